@@ -5,9 +5,11 @@ from util.db_service import (get_client_profile, get_client_objections)
 from model.context_model import ( ClientAgentContextModel )
 from dotenv import load_dotenv
 import requests
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-from .prompt import (get_client_agent_prompt)
-from util.inference_service import ( get_llm_output )
+from .prompt import (get_client_agent_prompt, advance_summary)
+from util.inference_service import ( get_llm_output, stream_llm_output )
+from util.stage_graph import ( stage_deadline_seconds )
+from typing import Callable
+import time
 
 load_dotenv()
 
@@ -18,23 +20,49 @@ class ClientAgent:
     def forward(self, client_agent_context: ClientAgentContextModel):
         output = ""
         print("prediction start")
+        advance_summary(client_agent_context)
         client_agent_prompt = get_client_agent_prompt(client_agent_context)
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(get_llm_output, client_agent_prompt)
-            try:
-                output = future.result(timeout=45)
-                print("Client agent response", output)
-            except FutureTimeoutError:
-                print("Prediction timed out after 45 seconds")
-                # Optionally, you can add a fallback response here
-                client_agent_context.conversation_history.append({"role": "client_agent", "content": "I'm still thinking about your offer. This is taking longer than expected."})
-                return client_agent_context
-            except Exception as e:
-                print(f"Error during prediction: {e}")
-                # Optionally, you can add a fallback response here
+        try:
+            output = get_llm_output(client_agent_prompt, "client_agent", deadline_seconds=stage_deadline_seconds(45))
+            print("Client agent response", output)
+        except TimeoutError:
+            print("Prediction timed out after 45 seconds")
+            # Optionally, you can add a fallback response here
+            client_agent_context.conversation_history.append({"role": "client_agent", "content": "I'm still thinking about your offer. This is taking longer than expected."})
+            return client_agent_context
+        except Exception as e:
+            print(f"Error during prediction: {e}")
+            # Optionally, you can add a fallback response here
+            client_agent_context.conversation_history.append({"role": "client_agent", "content": "Something went wrong in our discussion."})
+            return client_agent_context
+
+        # Add client response to history
+        client_agent_context.conversation_history.append({"role": "client_agent", "content": output})
+        return client_agent_context
+
+    def forward_stream(self, client_agent_context: ClientAgentContextModel, on_token: Callable[[str], None],
+                       timeout: float = 45):
+        """Like forward, but hands each completion token to on_token as it arrives"""
+        print("streaming prediction start")
+        advance_summary(client_agent_context)
+        client_agent_prompt = get_client_agent_prompt(client_agent_context)
+        tokens = []
+        timeout = stage_deadline_seconds(timeout)
+        deadline = time.monotonic() + timeout
+        try:
+            for token in stream_llm_output(client_agent_prompt, "client_agent", timeout):
+                tokens.append(token)
+                on_token(token)
+                if time.monotonic() > deadline:
+                    print(f"Streaming prediction cut off after {timeout} seconds")
+                    break
+        except Exception as e:
+            print(f"Error during streaming prediction: {e}")
+            if not tokens:
                 client_agent_context.conversation_history.append({"role": "client_agent", "content": "Something went wrong in our discussion."})
                 return client_agent_context
 
-        # Add client response to history
+        output = "".join(tokens)
+        print("Client agent response", output)
         client_agent_context.conversation_history.append({"role": "client_agent", "content": output})
-        return client_agent_context
\ No newline at end of file
+        return client_agent_context
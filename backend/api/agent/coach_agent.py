@@ -1,31 +1,62 @@
 import dspy
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Callable, List, Optional
 from model.context_model import ( ConversationAnalysis, ClientAgentContextModel, CoachAgentProblemAnalysis, CoachAgentSolutionAnalysis )
-from .prompt import (get_coach_agent_classification_prompt, get_coach_agent_behavioral_cue_prompt, get_coach_agent_risk_prompt)
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-from util.inference_service import ( get_llm_output )
+from .prompt import (get_coach_agent_classification_prompt, get_coach_agent_behavioral_cue_prompt, get_coach_agent_risk_prompt, get_coach_agent_analysis_prompt, get_latest_salesman_response)
+from util.inference_service import ( get_llm_output, stream_llm_output )
+from util.json_stream import ( IncrementalObjectParser )
 from util.db_service import (get_solutions_to_objections)
+from util.inference_scheduler import ( InferenceOverloaded )
+from util.stage_graph import ( stage_deadline_seconds )
+from util.response_classifier import ( classify_locally, classify_heuristically, log_classification_label )
 import json
+import time
 
 class CoachAgent:
     def __init__(self):
         self.classification = ""
 
-    def classify_response(self, client_agent_context: ClientAgentContextModel):
+    def classify_response(self, client_agent_context: ClientAgentContextModel,
+                          on_shed: Optional[Callable[[str], None]] = None):
+        """Label for the latest salesman message; on_shed(reason) fires when the label is only a heuristic guess"""
+        latest_sales_man_response = get_latest_salesman_response(client_agent_context.conversation_history)
+        # Clear-cut responses are decided in-process; only ambiguous ones reach the LLM
+        local_label = classify_locally(latest_sales_man_response)
+        if local_label is not None:
+            print("coach classification decided locally", local_label)
+            return local_label
+
         classification_prompt = get_coach_agent_classification_prompt(client_agent_context)
         classification_output = ""
         print("coach classification start")
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(get_llm_output, classification_prompt)
-            try:
-                classification_output = future.result(timeout=45)
-                # print("coach agent classification response", classification_output)
-            except FutureTimeoutError:
-                return "Prediction timed out after 45 seconds"
-            except Exception as e:
-                return f"Error during prediction: {e}"
+        start = time.perf_counter()
+        upstream = []
+        try:
+            classification_output = get_llm_output(
+                classification_prompt, "classification", latest_sales_man_response,
+                deadline_seconds=stage_deadline_seconds(45),
+                # The same message can be substantive against one objection and minor against another
+                semantic_scope=client_agent_context.current_objection,
+                on_upstream=upstream.append
+            )
+            # print("coach agent classification response", classification_output)
+        except InferenceOverloaded as e:
+            # Saturated: a rough label keeps the turn moving instead of queueing behind client replies
+            print(f"coach classification shed, using heuristic label: {e}")
+            if on_shed is not None:
+                on_shed(str(e))
+            return classify_heuristically(latest_sales_man_response)
+        except TimeoutError:
+            return "Prediction timed out after 45 seconds"
+        except Exception as e:
+            return f"Error during prediction: {e}"
 
+        # Cached labels are not new LLM judgements, and semantic hits may not even be for this message
+        if upstream:
+            log_classification_label(
+                latest_sales_man_response, client_agent_context.current_objection,
+                classification_output.strip().lower(), (time.perf_counter() - start) * 1000
+            )
         # Add client response to history
         return classification_output
 
@@ -33,15 +64,15 @@ class CoachAgent:
         behavioral_cue_prompt = get_coach_agent_behavioral_cue_prompt(client_agent_context)
         output = ""
         print("CoachAgent-behavioral cues start")
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(get_llm_output, behavioral_cue_prompt)
-            try:
-                output = future.result(timeout=45)
-                # print("response", json.dumps(output, indent=2, default=str))
-            except FutureTimeoutError:
-                return "Prediction timed out after 45 seconds"
-            except Exception as e:
-                return f"Error during prediction: {e}"
+        try:
+            output = get_llm_output(behavioral_cue_prompt, "behavioral", deadline_seconds=stage_deadline_seconds(45))
+            # print("response", json.dumps(output, indent=2, default=str))
+        except InferenceOverloaded:
+            raise  # shed under load; the turn falls back to degraded coach output
+        except TimeoutError:
+            return "Prediction timed out after 45 seconds"
+        except Exception as e:
+            return f"Error during prediction: {e}"
 
         # Add client response to history
         return output
@@ -50,22 +81,47 @@ class CoachAgent:
         risk_analysis_prompt = get_coach_agent_risk_prompt(client_agent_context)
         output = ""
         print("CoachAgent-risk analysis start")
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(get_llm_output, risk_analysis_prompt)
-            try:
-                output = future.result(timeout=45)
-                # print("response", json.dumps(output, indent=2, default=str))
-            except FutureTimeoutError:
-                return "Prediction timed out after 45 seconds"
-            except Exception as e:
-                return f"Error during prediction: {e}"
+        try:
+            output = get_llm_output(risk_analysis_prompt, "risk", deadline_seconds=stage_deadline_seconds(45))
+            # print("response", json.dumps(output, indent=2, default=str))
+        except InferenceOverloaded:
+            raise  # shed under load; the turn falls back to degraded coach output
+        except TimeoutError:
+            return "Prediction timed out after 45 seconds"
+        except Exception as e:
+            return f"Error during prediction: {e}"
 
         # Add client response to history
         return output
 
-    def get_solution_techniques(self, coach_agent_problem_analysis: CoachAgentProblemAnalysis, coach_solution_analysis: CoachAgentSolutionAnalysis):
+    def analyze_conversation(self, client_agent_context: ClientAgentContextModel,
+                             on_section: Optional[Callable[[str, Any], None]] = None, timeout: float = 45):
+        """Behavioral cues and risks from one streamed call; on_section(name, value) fires as each section completes"""
+        analysis_prompt = get_coach_agent_analysis_prompt(client_agent_context)
+        parser = IncrementalObjectParser(on_section)
+        tokens = []
+        print("CoachAgent-fused analysis start")
+        timeout = stage_deadline_seconds(timeout)
+        deadline = time.monotonic() + timeout
+        try:
+            for token in stream_llm_output(analysis_prompt, "analysis", timeout):
+                tokens.append(token)
+                parser.feed(token)
+                if time.monotonic() > deadline:
+                    print(f"Fused analysis cut off after {timeout} seconds")
+                    break
+        except InferenceOverloaded:
+            raise
+        except Exception as e:
+            print(f"Error during fused analysis: {e}")
+
+        # A cut-off stream still yields whichever sections finished, plus a repaired partial one
+        return "".join(tokens), parser.finish()
+
+    def get_solution_techniques(self, coach_agent_problem_analysis: CoachAgentProblemAnalysis, coach_solution_analysis: CoachAgentSolutionAnalysis,
+                                known_strategies: Optional[dict] = None):
         print("CoachAgent-solution retrieval start")
-        sol_techinques = get_solutions_to_objections(coach_agent_problem_analysis, coach_solution_analysis)
+        sol_techinques = get_solutions_to_objections(coach_agent_problem_analysis, coach_solution_analysis, known_strategies)
         print(sol_techinques)
         return sol_techinques
 
@@ -0,0 +1,192 @@
+import json
+import os
+from dotenv import load_dotenv
+from model.context_model import (
+    SessionModel, CoachAgentBehavioralCueAnalysis, CoachAgentRiskAnalysis,
+    CoachAgentProblemAnalysis, CoachAgentSolutionAnalysis
+)
+from util.stage_graph import ( Degraded, Stage, StageGraphResult, run_stage_graph )
+from util.json_stream import ( parse_json_tolerant )
+from util.inference_scheduler import ( is_shed_error )
+from util.db_service import ( get_strategies, get_solutions )
+from .client_agent import ClientAgent
+from .coach_agent import CoachAgent
+from typing import Any, Callable, List, Optional
+
+load_dotenv()
+
+# Wall-clock budget for one /user-msg turn, client reply included
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "60"))
+# Start classification and strategy retrieval with the client reply instead of after it
+SPECULATIVE_COACH_ENABLED = os.getenv("SPECULATIVE_COACH_ENABLED", "true").lower() == "true"
+# One structured-output call for behavioral cues and risks instead of two
+FUSED_COACH_ANALYSIS = os.getenv("FUSED_COACH_ANALYSIS", "false").lower() == "true"
+
+
+def _is_substantive(inputs) -> bool:
+    return inputs["classify"] == "substantive"
+
+
+def build_turn_stages(session_data: SessionModel, persist: Optional[Callable[[SessionModel], None]] = None,
+                      on_token: Optional[Callable[[str], None]] = None,
+                      on_reply: Optional[Callable[[dict], None]] = None,
+                      on_section: Optional[Callable[[str, Any], None]] = None,
+                      fused: bool = FUSED_COACH_ANALYSIS) -> List[Stage]:
+    """Stage graph for one conversation turn.
+
+    client_agent -> classify -> (behavioral || risks) -> solutions, with the session
+    write running alongside classification once the client reply is in. The session
+    write is exempt from the turn deadline, so a reply the trainee sees is never lost. With on_token
+    the client reply is streamed token by token; on_reply receives the finished reply
+    before any coach stage starts.
+
+    In speculative mode classification runs on the pre-reply history and a strategy
+    prefetch for the current objection starts at the same time, both in parallel with
+    the client agent. The label only depends on the salesman message, the objection and
+    the history before it, none of which the client reply changes, so the classify
+    stage adopts it once the reply is in. The solutions stage merges the prefetched
+    strategies into its own retrieval as long as the objection they were fetched for
+    is still the current one; otherwise they are discarded.
+
+    In fused mode a single analysis stage asks for behavioral cues and risks in one
+    streamed JSON object; on_section receives each section as soon as it is complete,
+    and the behavioral and risks stages just split the result.
+    """
+    client_agent = ClientAgent()
+    coach_agent = CoachAgent()
+    context = session_data.client_agent_context
+    # The client agent appends to this context in place, so speculation works on a copy
+    speculative_context = context.copy(deep=True)
+    # Filled by the prefetch stage; solutions reads it without waiting, so a slow prefetch never holds it up
+    prefetched = {}
+
+    def reply(_):
+        if on_token is not None:
+            session_data.client_agent_context = client_agent.forward_stream(context, on_token)
+        else:
+            session_data.client_agent_context = client_agent.forward(context)
+        session_data.round_count += 1
+        if on_reply is not None:
+            on_reply(session_data.client_agent_context.conversation_history[-1])
+        return session_data.client_agent_context
+
+    def classify_with(classify_context):
+        shed = []
+        label = coach_agent.classify_response(classify_context, on_shed=shed.append).strip()
+        # A shed classification still yields a heuristic label, but the turn must not pass it off as the LLM's
+        return Degraded(label, f"heuristic label: {shed[0]}") if shed else label
+
+    def classify(inputs):
+        return classify_with(inputs["client_agent"])
+
+    def classify_speculative(_):
+        return classify_with(speculative_context)
+
+    def prefetch(_):
+        latest = next((turn["content"] for turn in reversed(speculative_context.conversation_history)
+                       if turn["role"] == "salesman"), "")
+        query_text = f"{speculative_context.current_objection} {latest}"
+        strategies = get_strategies(query_text)
+        prefetched[speculative_context.current_objection] = strategies
+        return get_solutions(strategies, CoachAgentSolutionAnalysis(analysis=[]))
+
+    def behavioral(_):
+        cues = coach_agent.extract_behavioral_queue(context)
+        return cues, CoachAgentBehavioralCueAnalysis(**parse_json_tolerant(cues))
+
+    def risks(_):
+        risks_output = coach_agent.extract_risks(context)
+        return risks_output, CoachAgentRiskAnalysis(**parse_json_tolerant(risks_output))
+
+    def analysis(_):
+        return coach_agent.analyze_conversation(context, on_section)
+
+    def section(name, model):
+        def split(inputs):
+            sections = inputs["analysis"][1]
+            if name not in sections:
+                raise ValueError(f"Fused analysis did not produce {name}")
+            return json.dumps({name: sections[name]}), model(**{name: sections[name]})
+        return split
+
+    def solutions(inputs):
+        problem_analysis = CoachAgentProblemAnalysis(
+            behavioral=inputs["behavioral"][1],
+            risk=inputs["risks"][1]
+        )
+        known_strategies = prefetched.get(session_data.client_agent_context.current_objection)
+        return coach_agent.get_solution_techniques(problem_analysis, CoachAgentSolutionAnalysis(analysis=[]),
+                                                   known_strategies)
+
+    if SPECULATIVE_COACH_ENABLED:
+        classify_stages = [
+            Stage("classify_speculative", classify_speculative),
+            Stage("prefetch", prefetch),
+            Stage("classify", lambda inputs: inputs["classify_speculative"], ("classify_speculative", "client_agent")),
+        ]
+    else:
+        classify_stages = [Stage("classify", classify, ("client_agent",))]
+
+    if fused:
+        analysis_stages = [
+            Stage("analysis", analysis, ("classify",), condition=_is_substantive),
+            Stage("behavioral", section("behavioral_cues", CoachAgentBehavioralCueAnalysis), ("analysis",)),
+            Stage("risks", section("risks", CoachAgentRiskAnalysis), ("analysis",)),
+        ]
+    else:
+        analysis_stages = [
+            Stage("behavioral", behavioral, ("classify",), condition=_is_substantive),
+            Stage("risks", risks, ("classify",), condition=_is_substantive),
+        ]
+
+    stages = [
+        Stage("client_agent", reply),
+        *classify_stages,
+        *analysis_stages,
+        Stage("solutions", solutions, ("behavioral", "risks")),
+    ]
+    if persist is not None:
+        # Once the client reply exists it must be recorded, however late in the turn that is
+        stages.append(Stage("persist", lambda _: persist(session_data), ("client_agent",), exempt_from_deadline=True))
+    return stages
+
+
+def run_turn_pipeline(session_data: SessionModel, persist: Optional[Callable[[SessionModel], None]] = None,
+                      deadline_seconds: float = TURN_DEADLINE_SECONDS,
+                      on_token: Optional[Callable[[str], None]] = None,
+                      on_reply: Optional[Callable[[dict], None]] = None,
+                      on_section: Optional[Callable[[str, Any], None]] = None) -> StageGraphResult:
+    result = run_stage_graph(build_turn_stages(session_data, persist, on_token, on_reply, on_section), deadline_seconds)
+    print("turn stage timings", json.dumps(result.timings(), default=str))
+    return result
+
+
+def persist_failed(turn: StageGraphResult) -> bool:
+    """True when the turn had a session write and it did not succeed"""
+    return "persist" in turn.results and not turn.ok("persist")
+
+
+def coach_analysis(turn: StageGraphResult) -> dict:
+    """Coach part of a turn result in the shape /user-msg and the coach_analysis event return"""
+    behavioral = turn.value("behavioral")
+    risks = turn.value("risks")
+    classification = turn.value("classify")
+    coach_solution = turn.value("solutions")
+    solutions_source = "analysis" if coach_solution else None
+    # The objection-anchored prefetch only stands in when the full analysis could not finish;
+    # for minor responses or a completed analysis it is discarded
+    if coach_solution is None and classification == "substantive" and turn.ok("prefetch"):
+        coach_solution = turn.value("prefetch")
+        solutions_source = "prefetch"
+    return {
+        "client_response_classification": classification,
+        "behavioral": behavioral[0] if behavioral else None,
+        "risks": risks[0] if risks else None,
+        "solutions": coach_solution.dict()["analysis"] if coach_solution else None,
+        "solutions_source": solutions_source,
+        "stage_timings": turn.timings(),
+        "partial": turn.partial,
+        # Coach calls were shed under load: stages failed (solutions, if any, come from the prefetch)
+        # or finished on a fallback such as a heuristic classification
+        "degraded": any(is_shed_error(result.error) or result.degraded for result in turn.results.values())
+    }
@@ -1 +1,2 @@
-from .agent_base_prompts import *
\ No newline at end of file
+from .agent_base_prompts import *
+from .context_window import *
\ No newline at end of file
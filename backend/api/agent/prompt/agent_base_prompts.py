@@ -1,7 +1,8 @@
 from model.context_model import ( ClientAgentContextModel )
+from .context_window import ( render_history )
 
 def get_client_agent_prompt(client_agent_context: ClientAgentContextModel):
-    context_prompt = f"Client Profile: {client_agent_context.profile_desc}\n\nObjections: {client_agent_context.current_objection}\n\nConversation History: {client_agent_context.conversation_history}"
+    context_prompt = f"Client Profile: {client_agent_context.profile_desc}\n\nObjections: {client_agent_context.current_objection}\n\nConversation History:\n{render_history(client_agent_context, 'client_agent')}"
 
     base_prompt = """You are a demanding customer dealing with a salesman. Your role is to simulate a real client based on the provided profile and objections. 
     You should be skeptical, ask challenging questions, and maintain the concerns typical for your profile. Be authentic and don't make it easy for the salesman.
@@ -39,7 +40,7 @@ def get_coach_agent_classification_prompt(client_agent_context: ClientAgentConte
     Client's Core Objection:\n {client_agent_context.current_objection}
 
     Conversation History (Last 3 exchanges):
-    {client_agent_context.conversation_history}
+    {render_history(client_agent_context, 'classification')}
 
     User's Latest Response to Analyze:
     {latest_sales_man_response}
@@ -91,7 +92,7 @@ def get_coach_agent_behavioral_cue_prompt(client_agent_context: ClientAgentConte
     """
     context_prompt = f"""\n 
     Conversation History for Analysis:
-    {client_agent_context.conversation_history}
+    {render_history(client_agent_context, 'behavioral')}
 
     Current Session Context:
     Client Profile: {client_agent_context.profile_desc}
@@ -143,7 +144,8 @@ def get_coach_agent_risk_prompt(client_agent_context: ClientAgentContextModel):
     """
     context_prompt = f"""\n 
     Context:
-    Conversation history: {client_agent_context.conversation_history}
+    Conversation history:
+    {render_history(client_agent_context, 'risk')}
     Current_objection: {client_agent_context.current_objection}
     List of related objections: {client_agent_context.related_objections} (This is a list of objection names or descriptions from the session cache)
     Begin your analysis. Output only the formatted list.
@@ -152,3 +154,63 @@ def get_coach_agent_risk_prompt(client_agent_context: ClientAgentContextModel):
     coach_agent_risk_prompt = base_prompt + context_prompt
     return coach_agent_risk_prompt
 
+
+
+
+def get_coach_agent_analysis_prompt(client_agent_context: ClientAgentContextModel):
+    """Behavioral cues and risks in one call; the history is rendered once for both sections"""
+    base_prompt = """ 
+    You are an expert sales coach analyzing a role-play conversation between a sales representative (the User) and an AI simulating a client profile. Your task has two parts: analyze the client's most recent response for behavioral cues and emotional subtext, then identify the risks that could derail the sale. Your analysis must be evidence-based, concise, and structured for automated processing.
+    Instructions:
+
+        Behavioral cues:
+
+            1. Focus primarily on the Client's last message.
+
+            2. For each identified cue, name it using standard sales psychology terminology (e.g., "Skepticism," "Frustration," "Interest," "Urgency"), provide a direct quote from the client's dialogue that exemplifies it (mandatory), interpret its meaning in the context of the sales conversation, and estimate the probability of a specific outcome stemming from it (e.g., "70% chance of disengagement").
+
+            3. Limit the cues to a maximum of 3. Select the most impactful and relevant ones.
+
+        Risks:
+
+            4. Review the conversation history to determine which objections have been fully addressed, partially addressed, or remain unaddressed by the user's responses.
+
+            5. Identify up to 3 key risks, covering unaddressed objections from the related objections list and consequential objections that may arise next.
+
+            6. For each risk, assign an impact level: High (likely to cause immediate disengagement or deal loss), Moderate (could hinder progress) or Trivial (minor but needs attention).
+
+        Output Format: You MUST output a single valid, parsable JSON object matching the exact structure below, with "behavioral_cues" first.
+        
+        {
+            "behavioral_cues": [
+                {
+                "cue_name": "e.g., Price Sensitivity",
+                "evidence_quote": "The direct quote from the client's message",
+                "interpretation": "Brief analysis of what this cue means for the sale",
+                "impact_probability": "e.g., 70% chance of disengagement if unaddressed"
+                }
+            ],
+            "risks": [
+                {
+                "description": "A short 1-line description of the risk",
+                "impact": "A short 1-line description of the impact of the risk",
+                "impact_level": "How severe is the risk - High, Moderate, Trivial"
+                }
+            ]
+        }
+        
+    """
+    context_prompt = f"""\n 
+    Conversation History for Analysis:
+    {render_history(client_agent_context, 'analysis')}
+
+    Current Session Context:
+    Client Profile: {client_agent_context.profile_desc}
+    Core Objection: {client_agent_context.current_objection}
+    List of related objections: {client_agent_context.related_objections}
+
+    Output only the formatted json.
+    """
+
+    coach_agent_analysis_prompt = base_prompt + context_prompt
+    return coach_agent_analysis_prompt
@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+from dotenv import load_dotenv
+from model.context_model import ( ClientAgentContextModel )
+from typing import Dict, List, Optional, Tuple
+
+load_dotenv()
+
+# Turns kept verbatim in each prompt; older turns are represented by the rolling summary
+HISTORY_TURNS = {
+    "client_agent": int(os.getenv("CLIENT_AGENT_HISTORY_TURNS", "8")),
+    "classification": int(os.getenv("CLASSIFICATION_HISTORY_TURNS", "6")),
+    "behavioral": int(os.getenv("BEHAVIORAL_HISTORY_TURNS", "6")),
+    "risk": int(os.getenv("RISK_HISTORY_TURNS", "8")),
+    "analysis": int(os.getenv("ANALYSIS_HISTORY_TURNS", "8")),
+}
+# Token budget for the history section (summary plus verbatim turns) of each prompt
+HISTORY_TOKEN_BUDGET = {
+    "client_agent": int(os.getenv("CLIENT_AGENT_HISTORY_TOKENS", "1500")),
+    "classification": int(os.getenv("CLASSIFICATION_HISTORY_TOKENS", "1000")),
+    "behavioral": int(os.getenv("BEHAVIORAL_HISTORY_TOKENS", "1200")),
+    "risk": int(os.getenv("RISK_HISTORY_TOKENS", "1500")),
+    "analysis": int(os.getenv("ANALYSIS_HISTORY_TOKENS", "1500")),
+}
+# The persisted summary covers everything older than the widest window
+SUMMARY_KEEP_TURNS = max(HISTORY_TURNS.values())
+SUMMARY_TOKEN_BUDGET = int(os.getenv("HISTORY_SUMMARY_TOKENS", "400"))
+SUMMARY_LINE_CHARS = 200
+# auto: use tiktoken's cl100k_base when it loads locally, otherwise a character-based estimate
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "auto")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            if PROMPT_TOKENIZER != "heuristic":
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    print(f"tiktoken unavailable, estimating tokens from characters: {e}")
+            _encoding_loaded = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # About four characters per token for English, never fewer tokens than words
+    return max(len(text) // 4, len(text.split()))
+
+
+def format_turn(turn: Dict) -> str:
+    return f"{turn.get('role', '')}: {turn.get('content') or ''}"
+
+
+def _summary_line(turn: Dict) -> str:
+    content = " ".join(str(turn.get("content") or "").split())
+    if turn.get("role") == "summary":
+        return content
+    # The first sentence carries most of a short sales turn
+    first = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[:SUMMARY_LINE_CHARS].rstrip() + "..."
+    return f"{turn.get('role', '')}: {first}"
+
+
+def fold_into_summary(summary: Optional[str], turns: List[Dict], budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Append one condensed line per turn; past the budget the oldest lines after the opening go first"""
+    lines = summary.split("\n") if summary else []
+    lines.extend(_summary_line(turn) for turn in turns)
+    while len(lines) > 2 and estimate_tokens("\n".join(lines)) > budget:
+        del lines[1]
+    return "\n".join(lines)
+
+
+def advance_summary(client_agent_context: ClientAgentContextModel):
+    """Fold turns that left the widest window into the persisted rolling summary (O(new turns) per call)"""
+    history = client_agent_context.conversation_history or []
+    boundary = len(history) - SUMMARY_KEEP_TURNS
+    if boundary > client_agent_context.summarized_turns:
+        client_agent_context.history_summary = fold_into_summary(
+            client_agent_context.history_summary, history[client_agent_context.summarized_turns:boundary]
+        )
+        client_agent_context.summarized_turns = boundary
+
+
+def build_window(client_agent_context: ClientAgentContextModel, prompt_type: str) -> Tuple[str, List[Dict]]:
+    """(summary, verbatim turns) for one prompt, within that prompt type's turn count and token budget"""
+    history = client_agent_context.conversation_history or []
+    keep = HISTORY_TURNS.get(prompt_type, SUMMARY_KEEP_TURNS)
+    budget = HISTORY_TOKEN_BUDGET.get(prompt_type, SUMMARY_TOKEN_BUDGET * 4)
+
+    summarized = min(client_agent_context.summarized_turns, len(history))
+    start = max(summarized, len(history) - keep)
+    summary = client_agent_context.history_summary or ""
+    if start > summarized:
+        # Narrower windows fold the gap on the fly without touching the persisted summary
+        summary = fold_into_summary(summary, history[summarized:start])
+    recent = history[start:]
+
+    # Over budget: move the oldest verbatim turns into the summary, always keeping the latest turn
+    while len(recent) > 1 and estimate_tokens(summary) + sum(estimate_tokens(format_turn(t)) for t in recent) > budget:
+        summary = fold_into_summary(summary, recent[:1])
+        recent = recent[1:]
+    # Whatever budget the verbatim turns leave is what the summary may use
+    remaining = budget - sum(estimate_tokens(format_turn(t)) for t in recent)
+    if estimate_tokens(summary) > remaining:
+        summary = fold_into_summary(summary, [], max(remaining, 0))
+    return summary, recent
+
+
+def render_history(client_agent_context: ClientAgentContextModel, prompt_type: str) -> str:
+    summary, recent = build_window(client_agent_context, prompt_type)
+    sections = []
+    if summary:
+        sections.append("Summary of earlier conversation:\n" + summary)
+    if recent:
+        sections.append("Most recent turns:\n" + "\n".join(format_turn(turn) for turn in recent))
+    return "\n\n".join(sections) if sections else "(no conversation yet)"
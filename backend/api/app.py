@@ -1,3 +1,8 @@
+# Patch before anything else imports sockets or threads: the Socket.IO server runs on gevent and
+# streamed replies are emitted from stage-graph worker threads
+from gevent import monkey
+monkey.patch_all()
+
 from flask import Flask, request, jsonify
 import requests
 from dotenv import load_dotenv
@@ -9,6 +14,13 @@ from controller import *
 from config.tidb_config import (
     engine, Base, SessionLocal
 )
+from util.vector_index import ( load_vector_index )
+from util.bm25_index import ( load_bm25_index )
+from util.graph_snapshot import ( load_graph_snapshot )
+from util.session_cache import ( session_cache, install_session_cache_shutdown_hooks )
+from util.session_archive import ( start_session_archiver )
+from config.migrations import ( run_migrations, pending_migrations )
+from util.inference_service import ( OLLAMA_BASE_URL, OLLAMA_CHAT_MODEL )
 from model.data_model import (
     ClientProfileResponse,
     ConversationRound,
@@ -34,10 +46,35 @@ socketio = SocketIO(app,
 
 app.register_blueprint(client_profile_bp, url_prefix='/api/client_profile')
 app.register_blueprint(session_bp, url_prefix='/api/session')
+register_session_events(socketio)
 
-coach_lm = dspy.LM("ollama_chat/deepseek-r1:latest", api_base="http://localhost:11434")
+coach_lm = dspy.LM(f"ollama_chat/{OLLAMA_CHAT_MODEL}", api_base=OLLAMA_BASE_URL)
 dspy.settings.configure(lm=coach_lm)            
 
+# Schema changes normally run from the CLI (python -m config.migrations); a worker only applies them
+# itself when asked to, under the migration lock, and a failure there never keeps the API from starting
+try:
+    if os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true":
+        run_migrations(engine)
+    else:
+        pending = pending_migrations(engine)
+        if pending:
+            print(f"{len(pending)} schema migrations pending ({', '.join(m.name for m in pending)}); "
+                  f"run python -m config.migrations")
+except Exception as e:
+    print(f"Schema migrations not applied: {e}")
+
+# Mirror entity vectors, descriptions and edges in-process so coach turns skip TiDB scans
+load_vector_index()
+load_bm25_index()
+load_graph_snapshot()
+
+# Sessions are written behind; make sure queued turns reach TiDB before the process exits
+install_session_cache_shutdown_hooks()
+
+# Move idle sessions out of the hot tables; sessions still cached in this worker are left alone
+start_session_archiver(is_live=session_cache.__contains__)
+
 @app.route('/test', methods=['POST'])
 def test():
     print("Test received:", request.json)
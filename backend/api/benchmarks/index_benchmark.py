@@ -0,0 +1,124 @@
+"""
+Measure entity and relationship lookup latency with and without the migration-3 indexes
+as the graph grows. Uses scratch tables, so the real knowledge graph is untouched.
+
+Run from backend/api:
+    python -m benchmarks.index_benchmark --sizes 1000,10000,50000 --lookups 200
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from sqlalchemy import text
+from config.tidb_config import (engine)
+
+TYPES = ["ClientProfile", "Objection", "Strategy", "Technique", "Outcome"]
+RELATIONSHIP_TYPES = ["HAS_OBJECTION", "ADDRESSED_BY", "USES", "RESULTS_IN"]
+
+
+def create_tables(conn, suffix: str, indexed: bool):
+    conn.execute(text(f"DROP TABLE IF EXISTS bench_entities_{suffix}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS bench_relationships_{suffix}"))
+    conn.execute(text(f"""
+        CREATE TABLE bench_entities_{suffix} (
+            id INT NOT NULL PRIMARY KEY,
+            entity_id VARCHAR(255) NOT NULL,
+            type VARCHAR(64),
+            description TEXT,
+            deleted_at DATETIME
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE bench_relationships_{suffix} (
+            id INT NOT NULL PRIMARY KEY,
+            source_entity_id INT,
+            target_entity_id INT,
+            relationship_type VARCHAR(64)
+        )
+    """))
+    if indexed:
+        conn.execute(text(f"CREATE INDEX idx_entity_id ON bench_entities_{suffix} (entity_id)"))
+        conn.execute(text(f"CREATE INDEX idx_type ON bench_entities_{suffix} (type, deleted_at)"))
+        conn.execute(text(
+            f"CREATE INDEX idx_source_type ON bench_relationships_{suffix} (source_entity_id, relationship_type)"))
+
+
+def grow(conn, suffix: str, entities, relationships):
+    conn.execute(text(
+        f"INSERT INTO bench_entities_{suffix} (id, entity_id, type, description) "
+        f"VALUES (:id, :entity_id, :type, :description)"
+    ), entities)
+    conn.execute(text(
+        f"INSERT INTO bench_relationships_{suffix} (id, source_entity_id, target_entity_id, relationship_type) "
+        f"VALUES (:id, :source_entity_id, :target_entity_id, :relationship_type)"
+    ), relationships)
+
+
+def time_lookups(conn, suffix: str, entity_ids, source_ids):
+    entity_ms, adjacency_ms = [], []
+    for entity_id, source_id in zip(entity_ids, source_ids):
+        start = time.perf_counter()
+        conn.execute(text(
+            f"SELECT id FROM bench_entities_{suffix} WHERE entity_id = :entity_id AND type = 'ClientProfile' "
+            f"AND deleted_at IS NULL"
+        ), {"entity_id": entity_id}).fetchall()
+        entity_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        conn.execute(text(
+            f"SELECT target_entity_id FROM bench_relationships_{suffix} "
+            f"WHERE source_entity_id = :source AND relationship_type = 'USES'"
+        ), {"source": source_id}).fetchall()
+        adjacency_ms.append((time.perf_counter() - start) * 1000)
+    return statistics.median(entity_ms), statistics.median(adjacency_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma separated entity counts")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch tables in place")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    with engine.begin() as conn:
+        create_tables(conn, "scan", indexed=False)
+        create_tables(conn, "idx", indexed=True)
+
+    all_entity_ids = []
+    current = 0
+    print(f"{'entities':>9} {'scan entity':>12} {'idx entity':>11} {'scan adj':>9} {'idx adj':>8}  (median ms)")
+    for size in sizes:
+        entities = []
+        relationships = []
+        for row_id in range(current + 1, size + 1):
+            entity_id = str(uuid.uuid4())
+            all_entity_ids.append(entity_id)
+            entities.append({"id": row_id, "entity_id": entity_id, "type": TYPES[row_id % len(TYPES)],
+                             "description": f"benchmark entity {row_id}"})
+            relationships.append({"id": row_id, "source_entity_id": random.randint(1, size),
+                                  "target_entity_id": row_id,
+                                  "relationship_type": RELATIONSHIP_TYPES[row_id % len(RELATIONSHIP_TYPES)]})
+        with engine.begin() as conn:
+            for suffix in ("scan", "idx"):
+                for offset in range(0, len(entities), 1000):
+                    grow(conn, suffix, entities[offset:offset + 1000], relationships[offset:offset + 1000])
+        current = size
+
+        lookup_ids = random.choices(all_entity_ids, k=args.lookups)
+        source_ids = [random.randint(1, size) for _ in range(args.lookups)]
+        with engine.connect() as conn:
+            scan_entity, scan_adjacency = time_lookups(conn, "scan", lookup_ids, source_ids)
+            idx_entity, idx_adjacency = time_lookups(conn, "idx", lookup_ids, source_ids)
+        print(f"{size:>9} {scan_entity:>12.2f} {idx_entity:>11.2f} {scan_adjacency:>9.2f} {idx_adjacency:>8.2f}")
+
+    if not args.keep:
+        with engine.begin() as conn:
+            for suffix in ("scan", "idx"):
+                conn.execute(text(f"DROP TABLE IF EXISTS bench_entities_{suffix}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS bench_relationships_{suffix}"))
+
+
+if __name__ == "__main__":
+    main()
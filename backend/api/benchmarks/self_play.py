@@ -0,0 +1,262 @@
+"""
+Play many simulated training sessions concurrently through the /user-msg turn pipeline,
+for throughput testing and transcript generation.
+
+Each session seeds a client agent from a profile exactly as /session-init does, then a
+salesman (scripted lines, or an LLM playing the rep) answers for --turns rounds, each
+run through run_turn_pipeline like handle_msg. Reports turns/sec, per-stage latency
+percentiles over every stage that started (timeouts and errors included, and also counted
+per stage), and writes one compact JSON line per session to a gzipped transcript file.
+TiDB (session seeds, strategy retrieval) and Ollama (embeddings) are still used; --stub-llm
+only replaces the chat model, serving benchmarks/stub_llm_server in-process.
+
+Run from backend/api:
+    python -m benchmarks.self_play --sessions 50 --concurrency 10 --turns 6 --stub-llm
+    python -m benchmarks.self_play --profiles CP001,CP002 --salesman llm --out selfplay.jsonl.gz
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SCRIPTED_LINES = [
+    "I understand.",
+    "Okay, sure.",
+    "Fair point, can you tell me more about what worries you most?",
+    "Our customers typically see the cost recovered within the first two quarters through reduced manual work.",
+    "We're fully HIPAA compliant and I can share our latest audit report with your security team.",
+    "What would a successful pilot look like for your team?",
+    "That makes sense.",
+    "We can start with a small rollout for one department so you can measure the results before committing.",
+    "Several companies your size moved over last year; I can connect you with one of their leads.",
+    "If price is the main blocker, we could look at a phased plan that spreads the cost.",
+]
+
+SALESMAN_PROMPT = """You are a sales representative in a role-play with a skeptical client.
+Reply to the client's latest message in one or two sentences. Address their concern directly
+with specifics, ask a probing question, or propose a next step.
+
+Client profile: {profile}
+Client's current objection: {objection}
+
+Conversation so far:
+{history}
+
+Your reply:"""
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Salesman:
+    """Produces the trainee's side of a simulated conversation"""
+    def __init__(self, mode: str, rng: random.Random):
+        self.mode = mode
+        self.rng = rng
+        self.fallbacks = 0
+
+    def reply(self, context) -> str:
+        if self.mode == "llm":
+            from util.inference_service import ( get_llm_output )
+            from util.inference_scheduler import ( COACH )
+            history = "\n".join(f"{turn['role']}: {turn['content']}" for turn in context.conversation_history[-6:])
+            prompt = SALESMAN_PROMPT.format(
+                profile=context.profile_desc, objection=context.current_objection, history=history
+            )
+            try:
+                return get_llm_output(prompt, "salesman", priority=COACH).strip()
+            except Exception as e:
+                print(f"LLM salesman failed, using a scripted line: {e}")
+                self.fallbacks += 1
+        return self.rng.choice(SCRIPTED_LINES)
+
+
+def play_session(profile_id: str, turns: int, salesman_mode: str, seed: int, persist: bool) -> dict:
+    from model.context_model import ( SessionModel )
+    from agent import ( ClientAgent )
+    from agent.coach_pipeline import ( run_turn_pipeline, coach_analysis )
+    from controller.session_controller import ( construct_client_agent_context )
+    from util.session_service import ( create_new_session )
+    from util.session_cache import ( cache_new_session, store_session )
+
+    start = time.perf_counter()
+    context = construct_client_agent_context(profile_id, [])
+    if context is None:
+        return {"profile": profile_id, "error": "profile not found", "turns": []}
+    context = ClientAgent().forward(context)
+    session_data = SessionModel(session_id=f"selfplay-{uuid.uuid4()}", client_agent_context=context, round_count=0)
+    if persist:
+        create_new_session(session_data)
+        cache_new_session(session_data)
+    init_ms = (time.perf_counter() - start) * 1000
+
+    salesman = Salesman(salesman_mode, random.Random(seed))
+    records = []
+    for _ in range(turns):
+        message = salesman.reply(session_data.client_agent_context)
+        session_data.client_agent_context.conversation_history.append({"role": "salesman", "content": message})
+        turn_start = time.perf_counter()
+        turn = run_turn_pipeline(session_data, persist=store_session if persist else None)
+        turn_ms = (time.perf_counter() - turn_start) * 1000
+        stage_timings = turn.timings()
+        # Every stage that started, timed-out and failed ones included: they are the slow tail
+        timings = {name: timing["elapsed_ms"] for name, timing in stage_timings.items()
+                   if timing["elapsed_ms"] is not None}
+        failures = {name: timing["status"] for name, timing in stage_timings.items()
+                    if timing["status"] in ("timeout", "error")}
+        if not turn.ok("client_agent"):
+            # Same as a 504 from /user-msg: the salesman message is dropped and the session ends
+            session_data.client_agent_context.conversation_history.pop()
+            records.append({"s": message, "err": "client_agent", "ms": round(turn_ms, 1), "st": timings,
+                            "sf": failures})
+            break
+        analysis = coach_analysis(turn)
+        records.append({
+            "s": message,
+            "c": turn.value("client_agent").conversation_history[-1]["content"],
+            "cls": analysis["client_response_classification"],
+            "sol": len(analysis["solutions"] or []),
+            "src": analysis["solutions_source"],
+            "partial": analysis["partial"],
+            "degraded": analysis["degraded"],
+            "ms": round(turn_ms, 1),
+            "st": timings,
+            "sf": failures,
+        })
+    return {
+        "id": session_data.session_id,
+        "profile": profile_id,
+        "objection": session_data.client_agent_context.current_objection,
+        "opening": session_data.client_agent_context.conversation_history[0]["content"],
+        "init_ms": round(init_ms, 1),
+        "salesman_fallbacks": salesman.fallbacks,
+        "turns": records,
+    }
+
+
+def all_client_profile_ids():
+    from config.tidb_config import (SessionLocal)
+    from util.knowledge_graph import ( DatabaseEntity )
+    with SessionLocal() as session:
+        return [row.entity_id for row in session.query(DatabaseEntity.entity_id).filter(
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
+        ).all()]
+
+
+def report(sessions, elapsed: float):
+    turns = [turn for session in sessions for turn in session["turns"]]
+    completed = [turn for turn in turns if "err" not in turn]
+    stage_ms = {}
+    stage_failures = {}  # stage -> {"timeout": n, "error": n}
+    for turn in turns:
+        for name, ms in turn["st"].items():
+            stage_ms.setdefault(name, []).append(ms)
+        for name, status in turn.get("sf", {}).items():
+            counts = stage_failures.setdefault(name, {"timeout": 0, "error": 0})
+            counts[status] += 1
+    stage_ms["turn"] = [turn["ms"] for turn in turns]
+    stage_ms["session_init"] = [session["init_ms"] for session in sessions if "init_ms" in session]
+    classifications = {}
+    for turn in completed:
+        classifications[turn["cls"]] = classifications.get(turn["cls"], 0) + 1
+
+    print(f"\nsessions {len(sessions)}  turns {len(completed)} ok / {len(turns)}  wall {elapsed:.1f}s  "
+          f"throughput {len(completed) / elapsed if elapsed else 0:.2f} turns/s")
+    print(f"partial {sum(turn['partial'] for turn in completed)}  degraded {sum(turn['degraded'] for turn in completed)}  "
+          f"prefetch solutions {sum(turn['src'] == 'prefetch' for turn in completed)}  classifications {classifications}")
+    print(f"{'stage':<22}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}{'timeouts':>10}{'errors':>8}")
+    for name, values in sorted(stage_ms.items()):
+        if values:
+            failures = stage_failures.get(name, {"timeout": 0, "error": 0})
+            print(f"{name:<22}{len(values):>7}{percentile(values, 0.5):>11.1f}{percentile(values, 0.95):>11.1f}"
+                  f"{percentile(values, 0.99):>11.1f}{max(values):>11.1f}{failures['timeout']:>10}{failures['error']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=5, help="salesman messages per session")
+    parser.add_argument("--profiles", default="", help="comma-separated client profile ids (default: every profile)")
+    parser.add_argument("--salesman", choices=["scripted", "llm"], default="scripted")
+    parser.add_argument("--stub-llm", action="store_true", help="serve the chat model from the in-process stub")
+    parser.add_argument("--stub-latency-ms", type=float, default=300)
+    parser.add_argument("--stub-token-ms", type=float, default=20)
+    parser.add_argument("--no-response-cache", action="store_true", help="send every prompt upstream")
+    parser.add_argument("--persist", action="store_true", help="write the simulated sessions to TiDB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=f".cache/self_play/transcripts-{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+    args = parser.parse_args()
+
+    # Settings are read when the inference and stage modules load, so they go into the environment first
+    if args.stub_llm:
+        from benchmarks.stub_llm_server import serve
+        server = serve(port=0, latency_ms=args.stub_latency_ms, token_ms=args.stub_token_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        os.environ["INFERENCE_BACKENDS"] = "remote"
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    # Each turn keeps a few stages in flight; the LLM itself is still bounded by INFERENCE_MAX_CONCURRENCY
+    os.environ.setdefault("STAGE_GRAPH_MAX_WORKERS", str(max(16, args.concurrency * 4)))
+
+    from util.vector_index import ( load_vector_index )
+    from util.bm25_index import ( load_bm25_index )
+    from util.graph_snapshot import ( load_graph_snapshot )
+    from util.inference_service import ( inference_router )
+    from util.inference_scheduler import ( inference_scheduler )
+    from util.session_cache import ( session_cache )
+    load_vector_index()
+    load_bm25_index()
+    load_graph_snapshot()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()] or all_client_profile_ids()
+    if not profiles:
+        print("No client profiles to play")
+        return
+    print(f"Playing {args.sessions} sessions x {args.turns} turns across {len(profiles)} profiles, "
+          f"concurrency {args.concurrency}, {args.salesman} salesman{', stub LLM' if args.stub_llm else ''}")
+
+    sessions = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(play_session, profiles[i % len(profiles)], args.turns, args.salesman,
+                            args.seed + i, args.persist)
+            for i in range(args.sessions)
+        ]
+        for future in as_completed(futures):
+            try:
+                sessions.append(future.result())
+            except Exception as e:
+                print(f"Simulated session failed: {e}")
+    elapsed = time.perf_counter() - start
+    if args.persist:
+        session_cache.flush()
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with gzip.open(args.out, "wt", encoding="utf-8") as f:
+        for session in sessions:
+            f.write(json.dumps(session, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    report(sessions, elapsed)
+    scheduler = inference_scheduler.stats()
+    router = inference_router.stats()
+    print(f"inference peak queue {scheduler['peak_queue_depth']}  sheds "
+          f"{ {name: counters['shed'] for name, counters in scheduler['by_priority'].items()} }  "
+          f"hedges {router['hedges']}  failovers {router['failovers']}")
+    print(f"Transcripts written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
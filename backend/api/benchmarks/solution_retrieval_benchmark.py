@@ -0,0 +1,82 @@
+"""
+Compare the per-strategy/per-technique solution lookup with the single joined query.
+
+Run from backend/api:
+    python -m benchmarks.solution_retrieval_benchmark --strategies 20 --repeat 5
+"""
+import argparse
+import statistics
+import time
+from sqlalchemy import event
+from config.tidb_config import (engine, SessionLocal)
+from util.knowledge_graph import ( DatabaseEntity, DatabaseRelationship )
+from util.db_service import ( get_solution_triples )
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def legacy_solution_triples(strategy_ids):
+    """The original N+1 traversal: one query per strategy, then one per technique"""
+    triples = []
+    with SessionLocal() as session:
+        strategies = session.query(DatabaseEntity).filter(DatabaseEntity.id.in_(strategy_ids)).all()
+        for strategy in strategies:
+            techniques = session.query(DatabaseEntity).join(
+                DatabaseRelationship,
+                DatabaseRelationship.target_entity_id == DatabaseEntity.id
+            ).filter(
+                DatabaseRelationship.source_entity_id == strategy.id,
+                DatabaseRelationship.relationship_type == "USES"
+            ).all()
+            for technique in techniques:
+                outcomes = session.query(DatabaseEntity).join(
+                    DatabaseRelationship,
+                    DatabaseRelationship.target_entity_id == DatabaseEntity.id
+                ).filter(
+                    DatabaseRelationship.source_entity_id == technique.id,
+                    DatabaseRelationship.relationship_type == "RESULTS_IN"
+                ).all()
+                for outcome in outcomes:
+                    triples.append((strategy.description, technique.description, outcome.description))
+    return triples
+
+
+def measure(label, fn, strategy_ids, repeat):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    timings = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            triples = fn(strategy_ids)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    print(f"{label:<12} triples={len(triples):<5} queries/call={counter.count / repeat:<6.1f} "
+          f"median={statistics.median(timings):.1f}ms max={max(timings):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strategies", type=int, default=20, help="number of strategies per lookup")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        strategy_ids = [row.id for row in session.query(DatabaseEntity.id).filter(
+            DatabaseEntity.type == "Strategy"
+        ).limit(args.strategies).all()]
+    print(f"Benchmarking solution retrieval for {len(strategy_ids)} strategies, {args.repeat} runs each")
+
+    measure("n+1", legacy_solution_triples, strategy_ids, args.repeat)
+    measure("joined", get_solution_triples, strategy_ids, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Deterministic stand-in for the chat-completions endpoint, for benchmarks and local runs.
+
+Answers each prompt type the agents send (client reply, classification, behavioral
+cues, risks) with a canned response after a configurable delay, streams it word by
+word when the request sets "stream", and can inject 429/503 responses to exercise
+the retry path.
+
+Run from backend/api, then start the app with LLM_BASE_URL=http://127.0.0.1:8808/v1:
+    python -m benchmarks.stub_llm_server --port 8808 --latency-ms 300 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLIENT_REPLIES = [
+    "That sounds fine on paper, but how does it hold up for a team our size?",
+    "I've heard that pitch before. What makes your numbers different?",
+    "The price is still the sticking point for me. Can you justify it?",
+    "Who else in our industry is actually using this today?",
+]
+
+BEHAVIORAL = {
+    "behavioral_cues": [
+        {
+            "cue_name": "Skepticism",
+            "evidence_quote": "I've heard that pitch before.",
+            "interpretation": "The client doubts the claims and needs proof.",
+            "impact_probability": "60% chance of disengagement if unaddressed"
+        }
+    ]
+}
+
+RISKS = {
+    "risks": [
+        {
+            "description": "Pricing objection remains unaddressed",
+            "impact": "Client may stall the decision",
+            "impact_level": "High"
+        }
+    ]
+}
+
+
+def stub_completion(prompt: str) -> str:
+    """Canned output for a prompt, chosen by the same markers each agent prompt carries"""
+    if 'respond with a single lower case word : "minor" or "substantive"' in prompt:
+        # Salesman messages of a few words are fillers; anything longer counts as an answer
+        latest = prompt.rsplit("User's Latest Response to Analyze:", 1)[-1]
+        return "minor" if len(latest.split()) <= 4 else "substantive"
+    if '"behavioral_cues"' in prompt and '"risks"' in prompt:
+        return json.dumps({**BEHAVIORAL, **RISKS})
+    if '"behavioral_cues"' in prompt:
+        return json.dumps(BEHAVIORAL)
+    if '"risks"' in prompt:
+        return json.dumps(RISKS)
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+    return CLIENT_REPLIES[digest % len(CLIENT_REPLIES)]
+
+
+def make_handler(latency_ms: float, jitter_ms: float, error_rate: float, token_ms: float = 20):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, content: str):
+            """Server-sent events, one word per chunk, over chunked transfer encoding"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = content.split(" ")
+            events = [
+                {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                for i, word in enumerate(words)
+            ]
+            for event in events:
+                self._chunk(f"data: {json.dumps(event)}\n\n")
+                time.sleep(token_ms / 1000)
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, text: str):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+            if random.random() < error_rate:
+                status = random.choice([429, 503])
+                self._send(status, {"error": {"message": "stub overload"}}, {"Retry-After": "0"} if status == 429 else None)
+                return
+            prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+            content = stub_completion(prompt)
+            if request.get("stream"):
+                self._stream(content)
+                return
+            self._send(200, {
+                "id": "stub",
+                "object": "chat.completion",
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+            })
+
+    return StubHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8808, latency_ms: float = 300, jitter_ms: float = 50,
+          error_rate: float = 0.0, token_ms: float = 20) -> ThreadingHTTPServer:
+    """Create the stub server; call serve_forever() on the result (in a thread for in-process use)"""
+    server = ThreadingHTTPServer((host, port), make_handler(latency_ms, jitter_ms, error_rate, token_ms))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/503")
+    parser.add_argument("--token-ms", type=float, default=20, help="delay between streamed tokens")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.token_ms)
+    print(f"Stub LLM server on http://{args.host}:{args.port}/v1/chat/completions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Versioned schema migrations for the TiDB database.
+
+Each migration runs once, in order, and is recorded in schema_migrations.
+Statements are idempotent (IF NOT EXISTS / information_schema checks) so a
+database that was created by the older create_all path can be adopted.
+
+Runs hold a named lock (GET_LOCK), so several API workers starting at once apply
+each migration only once.
+
+Run from backend/api:
+    python -m config.migrations                 # apply pending migrations
+    python -m config.migrations --status        # list applied and pending
+    python -m config.migrations --vector-index  # retry the TiFlash vector index after enabling TiFlash
+"""
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import text
+from typing import Callable, List, NamedTuple
+
+load_dotenv()
+
+# nomic-embed-text produces 768-dimensional vectors; TiDB vector indexes need a fixed dimension
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+# Vectors of another dimension cannot move into the fixed-dimension column; by default the migration stops instead
+MIGRATION_DISCARD_MISMATCHED_VECTORS = os.getenv("MIGRATION_DISCARD_MISMATCHED_VECTORS", "false").lower() == "true"
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "300"))
+MIGRATION_LOCK_NAME = "actionreplay_schema_migrations"
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+def _column_type(conn, table: str, column: str):
+    return conn.execute(text(
+        "SELECT COLUMN_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"
+    ), {"table": table, "column": column}).scalar()
+
+
+def _index_exists(conn, table: str, index: str) -> bool:
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = :index"
+    ), {"table": table, "index": index}).scalar() > 0
+
+
+def create_base_tables(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS entities (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            entity_id VARCHAR(4096) NOT NULL,
+            name VARCHAR(4096),
+            type VARCHAR(4096),
+            description TEXT,
+            description_vec VECTOR({EMBEDDING_DIM}),
+            properties JSON
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS relationships (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            source_entity_id INT,
+            target_entity_id INT,
+            relationship_type VARCHAR(4096),
+            properties JSON,
+            FOREIGN KEY (source_entity_id) REFERENCES entities(id),
+            FOREIGN KEY (target_entity_id) REFERENCES entities(id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            guid VARCHAR(255) NOT NULL PRIMARY KEY,
+            client_agent_context JSON,
+            round_count INT DEFAULT 0,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def add_sync_columns(conn):
+    # Columns used by the incremental knowledge graph sync and tombstoning
+    for table in ("entities", "relationships"):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS source_id VARCHAR(255)"))
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS deleted_at DATETIME"))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS kg_version (
+            id INT NOT NULL PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0,
+            updated_at DATETIME
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS session_seeds (
+            client_profile_id VARCHAR(255) NOT NULL PRIMARY KEY,
+            graph_version INT NOT NULL,
+            seed JSON NOT NULL,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def resize_and_index_lookup_columns(conn):
+    # VARCHAR(4096) is too wide to index; ids are uuids and types are short enum-like labels
+    conn.execute(text("ALTER TABLE entities MODIFY entity_id VARCHAR(255) NOT NULL"))
+    conn.execute(text("ALTER TABLE entities MODIFY type VARCHAR(64)"))
+    conn.execute(text("ALTER TABLE entities MODIFY name VARCHAR(1024)"))
+    conn.execute(text("ALTER TABLE relationships MODIFY relationship_type VARCHAR(64)"))
+
+    indexes = [
+        ("entities", "idx_entities_entity_id", "(entity_id)"),
+        ("entities", "idx_entities_type", "(type, deleted_at)"),
+        ("entities", "idx_entities_source_id", "(source_id)"),
+        ("relationships", "idx_relationships_source_type", "(source_entity_id, relationship_type)"),
+        ("relationships", "idx_relationships_target_type", "(target_entity_id, relationship_type)"),
+        ("relationships", "idx_relationships_source_id", "(source_id)"),
+    ]
+    for table, index, columns in indexes:
+        if not _index_exists(conn, table, index):
+            conn.execute(text(f"CREATE INDEX {index} ON {table} {columns}"))
+
+
+def add_description_vector_index(conn):
+    # Tables created by tidb-vector's VectorType() have a dimensionless VECTOR column,
+    # which cannot carry a vector index; rebuild it with a fixed dimension first.
+    # Every step checks where an interrupted earlier run stopped, since each DDL commits on its own.
+    fixed_type = f"vector({EMBEDDING_DIM})"
+    column_type = (_column_type(conn, "entities", "description_vec") or "").lower()
+    staging_type = (_column_type(conn, "entities", "description_vec_fixed") or "").lower()
+    if column_type != fixed_type:
+        if not staging_type:
+            conn.execute(text(f"ALTER TABLE entities ADD COLUMN description_vec_fixed VECTOR({EMBEDDING_DIM})"))
+        if column_type:
+            mismatched = conn.execute(text(
+                f"SELECT entity_id FROM entities WHERE description_vec IS NOT NULL "
+                f"AND VEC_DIMS(description_vec) != {EMBEDDING_DIM}"
+            )).scalars().all()
+            if mismatched:
+                report = f"{len(mismatched)} entities have vectors that are not {EMBEDDING_DIM}-dimensional " \
+                         f"(e.g. {', '.join(mismatched[:5])})"
+                if not MIGRATION_DISCARD_MISMATCHED_VECTORS:
+                    raise RuntimeError(
+                        f"{report}. Re-embed them with the current EMBEDDING_MODEL, fix EMBEDDING_DIM, or set "
+                        f"MIGRATION_DISCARD_MISMATCHED_VECTORS=true to drop those vectors"
+                    )
+                print(f"Discarding vectors: {report}; re-embed these entities afterwards")
+            conn.execute(text(
+                f"UPDATE entities SET description_vec_fixed = description_vec "
+                f"WHERE description_vec IS NOT NULL AND VEC_DIMS(description_vec) = {EMBEDDING_DIM}"
+            ))
+            conn.execute(text("ALTER TABLE entities DROP COLUMN description_vec"))
+        conn.execute(text("ALTER TABLE entities RENAME COLUMN description_vec_fixed TO description_vec"))
+    elif staging_type:
+        conn.execute(text("ALTER TABLE entities DROP COLUMN description_vec_fixed"))
+
+    ensure_vector_index(conn)
+
+
+def ensure_vector_index(conn) -> bool:
+    """HNSW index on description_vec; skipped with a warning on clusters without TiFlash"""
+    if _index_exists(conn, "entities", "idx_entities_description_vec"):
+        return True
+    try:
+        # TiDB serves vector indexes from TiFlash
+        conn.execute(text("ALTER TABLE entities SET TIFLASH REPLICA 1"))
+        conn.execute(text(
+            "ALTER TABLE entities ADD VECTOR INDEX idx_entities_description_vec "
+            "((VEC_COSINE_DISTANCE(description_vec))) USING HNSW"
+        ))
+    except Exception as e:
+        print(f"Vector index skipped, vector search will scan entities: {e}. "
+              f"Run python -m config.migrations --vector-index once TiFlash is available.")
+        return False
+    return True
+
+
+def create_session_turns(conn):
+    # One row per conversation message; sessions.client_agent_context keeps only static context
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS session_turns (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            session_guid VARCHAR(255) NOT NULL,
+            turn_index INT NOT NULL,
+            role VARCHAR(32) NOT NULL,
+            content TEXT,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY idx_session_turns_session (session_guid, turn_index)
+        )
+    """))
+
+
+def add_session_archive(conn):
+    # last_active_at drives idle-session archival; archived sessions leave the hot tables
+    conn.execute(text("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS last_active_at DATETIME DEFAULT CURRENT_TIMESTAMP"))
+    conn.execute(text("UPDATE sessions SET last_active_at = created_date WHERE last_active_at IS NULL"))
+    if not _index_exists(conn, "sessions", "idx_sessions_last_active"):
+        conn.execute(text("CREATE INDEX idx_sessions_last_active ON sessions (last_active_at)"))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS session_archive (
+            guid VARCHAR(255) NOT NULL PRIMARY KEY,
+            round_count INT DEFAULT 0,
+            turn_count INT DEFAULT 0,
+            summary TEXT,
+            payload LONGBLOB NOT NULL,
+            created_date DATETIME,
+            last_active_at DATETIME,
+            archived_at DATETIME NOT NULL,
+            KEY idx_session_archive_archived_at (archived_at)
+        )
+    """))
+
+
+def create_classification_labels(conn):
+    # LLM minor/substantive labels, the training data for the local response classifier
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS classification_labels (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            salesman_message TEXT NOT NULL,
+            current_objection TEXT,
+            label VARCHAR(16) NOT NULL,
+            llm_ms FLOAT,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create_base_tables", create_base_tables),
+    Migration(2, "add_sync_columns", add_sync_columns),
+    Migration(3, "resize_and_index_lookup_columns", resize_and_index_lookup_columns),
+    Migration(4, "add_description_vector_index", add_description_vector_index),
+    Migration(5, "create_session_turns", create_session_turns),
+    Migration(6, "add_session_archive", add_session_archive),
+    Migration(7, "create_classification_labels", create_classification_labels),
+]
+
+
+def _ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT NOT NULL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at DATETIME NOT NULL
+            )
+        """))
+
+
+def applied_versions(engine) -> set:
+    _ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+@contextmanager
+def migration_lock(engine, timeout: int = MIGRATION_LOCK_TIMEOUT):
+    """Cluster-wide named lock held on one connection for the whole run"""
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                            {"name": MIGRATION_LOCK_NAME, "timeout": timeout}).scalar():
+            raise TimeoutError(f"Another process held the migration lock for {timeout}s")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+
+def run_migrations(engine):
+    """Apply every pending migration in version order"""
+    with migration_lock(engine):
+        # Read under the lock: another worker may have just applied what looked pending
+        applied = applied_versions(engine)
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            print(f"Applying migration {migration.version}: {migration.name}")
+            # TiDB commits DDL implicitly, so each statement is its own step; the
+            # version row is only written once the whole migration has succeeded.
+            with engine.begin() as conn:
+                migration.apply(conn)
+                conn.execute(text(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+                ), {"version": migration.version, "name": migration.name, "applied_at": datetime.now()})
+    print(f"Schema at version {max((m.version for m in MIGRATIONS), default=0)}")
+
+
+def pending_migrations(engine) -> List[Migration]:
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+if __name__ == "__main__":
+    import sys
+    from config.tidb_config import (engine)
+    if "--status" in sys.argv:
+        applied = applied_versions(engine)
+        for migration in MIGRATIONS:
+            state = "applied" if migration.version in applied else "pending"
+            print(f"{migration.version:>3} {migration.name:<40} {state}")
+    elif "--vector-index" in sys.argv:
+        with migration_lock(engine), engine.begin() as conn:
+            print("Vector index present" if ensure_vector_index(conn) else "Vector index still unavailable")
+    else:
+        run_migrations(engine)
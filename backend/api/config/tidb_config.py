@@ -34,5 +34,5 @@ def get_db_url():
 # Set up database connection
 engine = create_engine(get_db_url(), pool_recycle=300)
 Base = declarative_base()
-Base.metadata.create_all(engine)
+# Schema is owned by config/migrations.py; run_migrations(engine) applies pending versions
 SessionLocal = sessionmaker(bind=engine)
@@ -1,2 +1,3 @@
 from .session_controller import *
-from .client_profile_controller import *
\ No newline at end of file
+from .client_profile_controller import *
+from .session_socket import *
\ No newline at end of file
@@ -13,7 +13,8 @@ def get_client_profiles():
     """Get all available client profiles"""
     with SessionLocal() as session:
         profiles = session.query(DatabaseEntity).filter(
-            DatabaseEntity.type == "ClientProfile"
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
         ).all()
         
         return jsonify([{
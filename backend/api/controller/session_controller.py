@@ -9,12 +9,19 @@ from model.data_model import (
     CoachAnalysis
 )
 from util.session_service import ( update_session_cache, create_new_session, get_session_by_id, update_session_by_id )
-from util.db_service import (get_client_profile, get_client_objections, get_client_with_detailed_objections)
+from util.session_seed import ( get_session_seed )
+from util.session_cache import ( SessionCache, load_session, store_session, cache_new_session, session_cache as live_session_cache )
+from util.response_cache import ( response_cache )
+from util.inference_service import ( inference_router )
+from util.inference_scheduler import ( inference_scheduler )
+from util.embedding_cache import ( embedding_cache )
+from util.db_service import (get_client_profile, get_client_objections, get_client_with_detailed_objections, search_entities_by_embedding, search_entities_by_keywords)
 from model.context_model import ( 
     ClientAgentContextModel, SessionModel, CoachAgentBehavioralCueAnalysis, 
     CoachAgentRiskAnalysis, CoachAgentProblemAnalysis, CoachAgentSolutionAnalysis
 )
 from agent import (ClientAgent, CoachAgent)
+from agent.coach_pipeline import ( run_turn_pipeline, coach_analysis, persist_failed )
 from util.knowledge_graph import ( DatabaseEntity, DatabaseRelationship, get_query_embedding )
 from sqlalchemy import (
     Column,
@@ -35,7 +42,8 @@ from sqlalchemy import (
 import uuid
 
 session_bp = Blueprint('session_bp', __name__)
-# session_cache = {}
+# The legacy /start_session and /conversation routes keep their working state in memory only
+session_cache = SessionCache()
 
 @session_bp.route('/start_session', methods=['POST'])
 def start_session():
@@ -47,7 +55,8 @@ def start_session():
         # Get objections for this client profile
         client_profile = session.query(DatabaseEntity).filter(
             DatabaseEntity.entity_id == client_profile_id,
-            DatabaseEntity.type == "ClientProfile"
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
         ).first()
         
         if not client_profile:
@@ -59,7 +68,9 @@ def start_session():
             DatabaseRelationship.target_entity_id == DatabaseEntity.id
         ).filter(
             DatabaseRelationship.source_entity_id == client_profile.id,
-            DatabaseRelationship.relationship_type == "HAS_OBJECTION"
+            DatabaseRelationship.relationship_type == "HAS_OBJECTION",
+            DatabaseRelationship.deleted_at.is_(None),
+            DatabaseEntity.deleted_at.is_(None)
         ).all()
         
         # Perform initial searches
@@ -68,20 +79,14 @@ def start_session():
         
         # Embedding search
         embedding = get_query_embedding(initial_context)
-        embedding_results = session.query(DatabaseEntity).order_by(
-            DatabaseEntity.description_vec.cosine_distance(embedding)
-        ).limit(20).all()
+        embedding_results = search_entities_by_embedding(session, embedding, limit=20)
         
-        # BM25 search (simplified)
-        bm25_results = session.query(DatabaseEntity).filter(
-            or_(
-                DatabaseEntity.description.contains(term) for term in initial_context.split()[:5]
-            )
-        ).limit(20).all()
+        # BM25 search
+        bm25_results = search_entities_by_keywords(session, initial_context, limit=20, max_terms=5)
         
         # Create session cache
         session_id = str(uuid.uuid4())
-        session_cache[session_id] = {
+        session_data = {
             "client_profile": client_profile_id,
             "objections": [obj.entity_id for obj in objections],
             "embedding_cache": [obj.entity_id for obj in embedding_results],
@@ -89,7 +94,8 @@ def start_session():
             "conversation": [],
             "round_count": 0
         }
-        print(json.dumps(session_cache, indent=2, default=str))
+        session_cache.put(session_id, session_data, dirty=False)
+        print(json.dumps(session_data, indent=2, default=str))
 
         # Get first objection
         first_objection = objections[0] if objections else None
@@ -107,6 +113,8 @@ def start_session_v2():
     data = request.json
     client_profile_id = data['client_profile_id']
     client_agent_context = construct_client_agent_context(client_profile_id, [])
+    if client_agent_context is None:
+        return jsonify({"error": "Client profile not found"}), 404
 
     # Initialize the agent
     client_agent = ClientAgent()
@@ -122,6 +130,7 @@ def start_session_v2():
         round_count=0
     )
     create_new_session(session)
+    cache_new_session(session)
     print("Session created successfully")
     lates_client_response_idx = len(client_agent_context.conversation_history) - 1
     return jsonify({
@@ -130,24 +139,25 @@ def start_session_v2():
     })
 
 def construct_client_agent_context(client_profile_id, conversation_history):
-    client_profile = get_client_profile(client_profile_id)
-    print("Client Profile", json.dumps(client_profile, indent=2, default=str) )
-    objections = get_client_with_detailed_objections(client_profile_id)
-    print("Client Objections", json.dumps(objections, indent=2, default=str) )
+    # Profile and objections are identical for every session of a profile, so read the materialized seed
+    seed = get_session_seed(client_profile_id)
+    if seed is None:
+        return None
+    print("Session seed", json.dumps(seed, indent=2, default=str) )
 
         
     # Get the next objection to raise (cycle through them)
     current_objection_idx = len(conversation_history) // 2  # Each round has client + user messages
-    if current_objection_idx >= len(objections["client_objections"]):
-        current_objection_idx = len(objections["client_objections"]) - 1  # Stay on last objection
+    if current_objection_idx >= len(seed["client_objections"]):
+        current_objection_idx = len(seed["client_objections"]) - 1  # Stay on last objection
         
-    current_objection = objections["client_objections"][current_objection_idx] if objections["client_objections"] else "No specific objection"
+    current_objection = seed["client_objections"][current_objection_idx] if seed["client_objections"] else "No specific objection"
         
     context_model = ClientAgentContextModel(
-        profile_desc=client_profile["description"], 
+        profile_desc=seed["profile_desc"], 
         current_objection=current_objection,
-        all_objections=objections["client_objections"],
-        related_objections=objections["related_objections"],
+        all_objections=seed["client_objections"],
+        related_objections=seed["related_objections"],
         conversation_history=conversation_history
     )
     return context_model
@@ -159,11 +169,10 @@ def handle_conversation():
     session_id = data['session_id']
     user_response = data['user_response']
     
-    if session_id not in session_cache:
+    session_data = session_cache.get(session_id)
+    if session_data is None:
         return jsonify({"error": "Session not found"}), 404
     
-    session_data = session_cache[session_id]
-    
     # Add to conversation history
     session_data["conversation"].append({
         "role": "user",
@@ -180,12 +189,30 @@ def handle_conversation():
     session_data["round_count"] += 1
     if session_data["round_count"] % 3 == 0:
         update_session_cache(session_data)
+    session_cache.put(session_id, session_data, dirty=False)
     
     return jsonify({
         "next_objection": next_objection,
         "coach_analysis": analysis.dict()
     })
 
+@session_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit rates and sizes of the in-process caches"""
+    return jsonify({
+        "llm_responses": response_cache.stats(),
+        "sessions": live_session_cache.stats(),
+        "embeddings": embedding_cache.stats()
+    })
+
+@session_bp.route('/inference-stats', methods=['GET'])
+def inference_stats():
+    """Queue depth and shedding of the inference scheduler; hedging, failover and circuit state of its backends"""
+    return jsonify({
+        "scheduler": inference_scheduler.stats(),
+        "router": inference_router.stats()
+    })
+
 @session_bp.route('/user-msg', methods=['POST'])
 def handle_msg():
     """Handle conversation round"""
@@ -196,46 +223,39 @@ def handle_msg():
     if not session_id:
         return jsonify({"error": "Session not found"}), 404
     
-    session_data = get_session_by_id(session_id)
-    # print("retrieved session data:::", json.dumps(session_data, indent=2, default=str) )
+    session_data = load_session(session_id)
+    if session_data is None:
+        return jsonify({"error": "Session not found"}), 404
 
-    client_agent_context = session_data.client_agent_context
-    client_agent_context.conversation_history.append({"role": "salesman", "content": user_response})
-    client_agent = ClientAgent()
-    # Trigger client agent
-    client_agent_context = client_agent.forward(client_agent_context)
-    print("client_agent_context after:::", json.dumps(client_agent_context, indent=2, default=str) )
-    session_data.client_agent_context = client_agent_context
-    session_data.round_count += 1
-    update_session_by_id(session_id, session_data)
-    # round 
-    lates_client_response_idx = len(client_agent_context.conversation_history) - 1
+    session_data.client_agent_context.conversation_history.append({"role": "salesman", "content": user_response})
 
-    # Trigger coach agent
-    coach_agent = CoachAgent()
-    user_response_classification = coach_agent.classify_response(client_agent_context)
-    solution_analysis = CoachAgentSolutionAnalysis(analysis=[])
-
-    if user_response_classification == 'substantive':
-        print("Classification", user_response_classification)
-        cues = coach_agent.extract_behavioral_queue(client_agent_context) 
-        behavioral_data = json.loads(cues)
-        coach_agent_behavioral_analysis = CoachAgentBehavioralCueAnalysis(**behavioral_data)
-        print("cues", coach_agent_behavioral_analysis)
-        risks = coach_agent.extract_risks(client_agent_context) 
-        risks_data = json.loads(risks)
-        coach_agent_risk_analysis = CoachAgentRiskAnalysis(**risks_data)
-        print("risks", coach_agent_risk_analysis)
-        coach_agent_problem_analysis = CoachAgentProblemAnalysis(
-            behavioral=coach_agent_behavioral_analysis,
-            risk=coach_agent_risk_analysis)
-        coach_solution = coach_agent.get_solution_techniques(coach_agent_problem_analysis, solution_analysis)
-        print("coach_solution", coach_solution)
+    # Client reply, session write and coach analysis run as a stage graph under one turn deadline
+    turn = run_turn_pipeline(session_data, persist=store_session)
+    if not turn.ok("client_agent"):
+        # The turn is not persisted, so the salesman can resend the same message
+        return jsonify({
+            "session_id": session_id,
+            "client_agent_response": {"role": "client_agent", "content": "I'm still thinking about your offer. This is taking longer than expected."},
+            "stage_timings": turn.timings(),
+            "partial": True
+        }), 504
+
+    if persist_failed(turn):
+        # Nothing was stored, so the salesman can resend the same message
+        return jsonify({
+            "session_id": session_id,
+            "error": "The turn could not be saved",
+            "stage_timings": turn.timings()
+        }), 500
+
+    client_agent_context = turn.value("client_agent")
+    lates_client_response_idx = len(client_agent_context.conversation_history) - 1
+    analysis = coach_analysis(turn)
+    print("Classification", analysis["client_response_classification"])
+    print("coach_solution", analysis["solutions"])
 
     return jsonify({
         "session_id": session_id,
         "client_agent_response": client_agent_context.conversation_history[lates_client_response_idx],
-        "client_response_classification": user_response_classification,
-        "behavioral":cues,
-        "risks":risks
-    })
\ No newline at end of file
+        **analysis
+    })
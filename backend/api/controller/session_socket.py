@@ -0,0 +1,59 @@
+from flask import request
+from flask_socketio import SocketIO
+from util.session_cache import ( load_session, store_session )
+from agent.coach_pipeline import ( run_turn_pipeline, coach_analysis, persist_failed )
+
+
+def register_session_events(socketio: SocketIO):
+    """Streaming counterpart of /user-msg.
+
+    The trainee emits `user_msg` with {session_id, user_response} and receives, in order:
+    `client_token` for each token of the client reply, `client_reply` with the full
+    reply, then `coach_analysis` once the coach stages finish. With fused coach analysis
+    each section (behavioral_cues, risks) also arrives early as `coach_section`.
+    Failures arrive as `turn_error`.
+    """
+
+    @socketio.on('user_msg')
+    def handle_user_msg(data):
+        sid = request.sid
+        session_id = (data or {}).get('session_id')
+        user_response = (data or {}).get('user_response')
+        if not session_id or user_response is None:
+            socketio.emit('turn_error', {"session_id": session_id, "error": "session_id and user_response are required"}, to=sid)
+            return
+
+        session_data = load_session(session_id)
+        if session_data is None:
+            socketio.emit('turn_error', {"session_id": session_id, "error": "Session not found"}, to=sid)
+            return
+        session_data.client_agent_context.conversation_history.append({"role": "salesman", "content": user_response})
+
+        def on_token(token):
+            socketio.emit('client_token', {"session_id": session_id, "token": token}, to=sid)
+
+        def on_reply(reply):
+            socketio.emit('client_reply', {"session_id": session_id, "client_agent_response": reply}, to=sid)
+
+        def on_section(name, value):
+            socketio.emit('coach_section', {"session_id": session_id, "section": name, "value": value}, to=sid)
+
+        turn = run_turn_pipeline(session_data, persist=store_session, on_token=on_token, on_reply=on_reply,
+                                 on_section=on_section)
+        if not turn.ok("client_agent"):
+            socketio.emit('turn_error', {
+                "session_id": session_id,
+                "error": "Client reply did not finish within the turn deadline",
+                "stage_timings": turn.timings()
+            }, to=sid)
+            return
+
+        if persist_failed(turn):
+            socketio.emit('turn_error', {
+                "session_id": session_id,
+                "error": "The turn could not be saved; resend the message",
+                "stage_timings": turn.timings()
+            }, to=sid)
+            return
+
+        socketio.emit('coach_analysis', {"session_id": session_id, **coach_analysis(turn)}, to=sid)
@@ -9,12 +9,18 @@ class ClientAgentContextModel(BaseModel):
     all_objections: List[str]  # list of all client objections
     related_objections: List[str]  # objections not raised but related
     conversation_history: Optional[List[Dict]] = None
+    # Rolling summary of conversation_history[:summarized_turns], maintained by agent.prompt.context_window
+    history_summary: Optional[str] = None
+    summarized_turns: int = 0
 
 
 class SessionModel(BaseModel):
     session_id: str
     client_agent_context: ClientAgentContextModel
     round_count:int
+    # Persistence bookkeeping: turns already in session_turns and hash of the stored static context
+    persisted_turns: int = Field(default=0, exclude=True)
+    static_context_hash: Optional[str] = Field(default=None, exclude=True)
 
 class ConversationAnalysis(BaseModel):
     classification: str = Field(description="Classification of the user's response.")
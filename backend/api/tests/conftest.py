@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+# Tests import modules the way the app does, from backend/api
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing util builds (but never connects) the TiDB engine from these settings
+for name, value in {"TIDB_HOST": "localhost", "TIDB_PORT": "4000", "TIDB_USER": "test",
+                    "TIDB_PASSWORD": "", "TIDB_DB_NAME": "test"}.items():
+    os.environ.setdefault(name, value)
+# Token counts must not depend on downloading a tokenizer
+os.environ.setdefault("PROMPT_TOKENIZER", "heuristic")
+
+
+@pytest.fixture
+def make_scheduler():
+    """Factory for a one-slot scheduler without rate limiting; shed depths per class as client=, coach=, background="""
+    from util.inference_scheduler import ( BACKGROUND, CLIENT_AGENT, COACH, InferenceScheduler )
+
+    def make(**shed_depth):
+        depths = {CLIENT_AGENT: 100, COACH: 100, BACKGROUND: 100}
+        depths.update({{"client": CLIENT_AGENT, "coach": COACH, "background": BACKGROUND}[name]: depth
+                       for name, depth in shed_depth.items()})
+        return InferenceScheduler(max_concurrency=1, rate_per_second=0, burst=1, shed_depth=depths)
+    return make
@@ -0,0 +1,68 @@
+import math
+import time
+import pytest
+from util.bm25_index import ( BM25Index, tokenize )
+from util.index_sync import ( EntitySnapshot )
+
+
+def snapshot(id, description, type="Strategy"):
+    return EntitySnapshot(id, f"E{id}", None, type, description, None)
+
+
+def make_index(*snapshots, k1=1.5, b=0.75):
+    index = BM25Index(k1=k1, b=b, max_age=0)
+    index.loaded_at = time.time()
+    index.apply_changes(list(snapshots), [])
+    return index
+
+
+def bm25(tf, doc_length, avg_length, doc_count, df, k1=1.5, b=0.75):
+    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length / avg_length))
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("The client's PRICE is a concern, x 2025!") == ["client's", "price", "concern", "2025"]
+    assert tokenize(None) == []
+
+
+def test_search_scores_match_okapi_bm25():
+    index = make_index(
+        snapshot(1, "price discount price"),
+        snapshot(2, "security audit"),
+        snapshot(3, "price guarantee"),
+    )
+    hits = index.search("price")
+
+    assert [entity.id for entity, _ in hits] == [1, 3]
+    avg_length = 7 / 3
+    assert hits[0][1] == pytest.approx(bm25(2, 3, avg_length, 3, 2))
+    assert hits[1][1] == pytest.approx(bm25(1, 2, avg_length, 3, 2))
+
+
+def test_type_filter_uses_that_types_statistics():
+    index = make_index(
+        snapshot(1, "price price", "Strategy"),
+        snapshot(2, "price", "Strategy"),
+        snapshot(3, "price budget", "Objection"),
+        snapshot(4, "timing", "Objection"),
+    )
+    hits = index.search("price", entity_type="Objection")
+
+    assert [entity.id for entity, _ in hits] == [3]
+    assert hits[0][1] == pytest.approx(bm25(1, 2, 1.5, 2, 1))
+
+
+def test_apply_changes_updates_and_removes_postings():
+    index = make_index(snapshot(1, "price discount"), snapshot(2, "security audit"))
+    index.apply_changes([snapshot(1, "rollout pilot")], [2])
+
+    assert index.search("price") == []
+    assert index.search("security") == []
+    assert [entity.id for entity, _ in index.search("pilot")] == [1]
+    assert "price" not in index.postings and "audit" not in index.postings
+    assert index.type_doc_counts["Strategy"] == 1
+
+
+def test_search_defers_until_loaded():
+    assert BM25Index(max_age=0).search("price") is None
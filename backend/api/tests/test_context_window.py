@@ -0,0 +1,70 @@
+from agent.prompt import context_window
+from agent.prompt.context_window import ( advance_summary, build_window, fold_into_summary )
+from model.context_model import ( ClientAgentContextModel )
+
+
+def make_context(turns, **kwargs):
+    history = [
+        {"role": "salesman" if i % 2 == 0 else "client_agent", "content": f"Turn {i} says something. More detail {i}."}
+        for i in range(turns)
+    ]
+    return ClientAgentContextModel(
+        profile_desc="profile", current_objection="price", all_objections=["price"], related_objections=[],
+        conversation_history=history, **kwargs
+    )
+
+
+def test_fold_into_summary_keeps_first_sentence_per_turn():
+    summary = fold_into_summary(None, [{"role": "salesman", "content": "Hello there.  How are you?"}])
+    assert summary == "salesman: Hello there."
+    summary = fold_into_summary(summary, [{"role": "summary", "content": "Earlier conversation"}])
+    assert summary.split("\n") == ["salesman: Hello there.", "Earlier conversation"]
+
+
+def test_fold_into_summary_drops_oldest_lines_after_the_opening():
+    turns = make_context(10).conversation_history
+    summary = fold_into_summary(None, turns, budget=1)
+    assert summary.split("\n") == ["salesman: Turn 0 says something.", "client_agent: Turn 9 says something."]
+
+
+def test_build_window_keeps_recent_turns_and_folds_the_rest():
+    context = make_context(12)
+    summary, recent = build_window(context, "classification")
+
+    assert recent == context.conversation_history[-context_window.HISTORY_TURNS["classification"]:]
+    assert len(summary.split("\n")) == 12 - len(recent)
+    # Folding for a narrow window never touches the persisted summary
+    assert context.history_summary is None and context.summarized_turns == 0
+
+
+def test_build_window_moves_turns_into_the_summary_when_over_budget(monkeypatch):
+    monkeypatch.setitem(context_window.HISTORY_TOKEN_BUDGET, "classification", 20)
+    context = make_context(12)
+    summary, recent = build_window(context, "classification")
+
+    assert recent[-1] == context.conversation_history[-1]
+    assert len(recent) < context_window.HISTORY_TURNS["classification"]
+    assert summary
+
+
+def test_advance_summary_only_folds_new_turns():
+    context = make_context(context_window.SUMMARY_KEEP_TURNS + 4)
+    advance_summary(context)
+    assert context.summarized_turns == 4
+    first = context.history_summary
+
+    advance_summary(context)
+    assert context.history_summary == first
+
+    context.conversation_history.extend([{"role": "salesman", "content": "New turn."}] * 2)
+    advance_summary(context)
+    assert context.summarized_turns == 6
+    assert context.history_summary.startswith(first)
+
+
+def test_build_window_starts_after_the_persisted_summary():
+    context = make_context(context_window.SUMMARY_KEEP_TURNS + 4)
+    advance_summary(context)
+    summary, recent = build_window(context, "client_agent")
+    assert summary == context.history_summary
+    assert recent == context.conversation_history[context.summarized_turns:]
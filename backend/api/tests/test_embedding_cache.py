@@ -0,0 +1,53 @@
+import numpy as np
+from util.embedding_cache import ( DiskEmbeddingStore, EmbeddingCache )
+
+
+def vector(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_store_round_trips_and_is_shared_between_instances(tmp_path):
+    first = DiskEmbeddingStore(str(tmp_path), "model")
+    first.put("a", vector(1, 2, 3))
+    second = DiskEmbeddingStore(str(tmp_path), "model")
+    second.put("b", vector(4, 5, 6))
+    first.put("c", vector(7, 8, 9))  # catches up on b before claiming its row
+
+    reopened = DiskEmbeddingStore(str(tmp_path), "model")
+    assert reopened.get("a").tolist() == [1, 2, 3]
+    assert reopened.get("b").tolist() == [4, 5, 6]
+    assert reopened.get("c").tolist() == [7, 8, 9]
+    assert sorted(reopened.rows.values()) == [0, 1, 2]
+
+
+def test_torn_trailing_line_does_not_swallow_the_next_key(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), "model")
+    store.put("a", vector(1, 2))
+    with open(store._keys_path, "a") as keys_file:
+        keys_file.write("deadbeef\t")  # a writer crashed mid-line
+    store.close()
+
+    store = DiskEmbeddingStore(str(tmp_path), "model")
+    store.put("b", vector(3, 4))
+
+    reopened = DiskEmbeddingStore(str(tmp_path), "model")
+    assert reopened.get("b").tolist() == [3, 4]
+    assert "deadbeef" not in reopened.rows
+    with open(store._keys_path) as keys_file:
+        assert keys_file.read().endswith("\n")
+
+
+def test_models_never_share_vectors(tmp_path):
+    cache = EmbeddingCache(root=str(tmp_path))
+    cache.put("model-a", "text", [1.0, 2.0])
+    assert cache.get("model-b", "text") is None
+
+
+def test_memory_tier_is_bounded_by_bytes(tmp_path):
+    cache = EmbeddingCache(root=str(tmp_path), max_memory_bytes=16)
+    cache.put("model", "one", [1.0, 2.0, 3.0])
+    cache.put("model", "two", [4.0, 5.0, 6.0])
+
+    assert cache.memory_bytes <= 16 and cache.metrics["evictions"] == 1
+    assert cache.get("model", "one") == [1.0, 2.0, 3.0]  # evicted from memory, still on disk
+    assert cache.metrics["disk_hits"] == 1
@@ -0,0 +1,29 @@
+import pytest
+from util.hybrid_retrieval import ( reciprocal_rank_fusion )
+from util.index_sync import ( IndexedEntity )
+
+
+def entity(id):
+    return IndexedEntity(id, f"E{id}", None, "Strategy", f"entity {id}")
+
+
+def test_rrf_sums_reciprocal_ranks_across_lists():
+    a, b, c, d = entity(1), entity(2), entity(3), entity(4)
+    hits = reciprocal_rank_fusion([(a, 0.1), (b, 0.2), (c, 0.3)], [(c, 9.0), (a, 5.0), (d, 1.0)], limit=10, k=60)
+
+    assert [hit.entity.id for hit in hits] == [1, 3, 2, 4]
+    assert hits[0].score == pytest.approx(1 / 61 + 1 / 62)
+    assert hits[1].score == pytest.approx(1 / 63 + 1 / 61)
+    assert (hits[0].vector_rank, hits[0].vector_distance, hits[0].lexical_rank, hits[0].lexical_score) == (1, 0.1, 2, 5.0)
+    assert (hits[2].lexical_rank, hits[2].lexical_score) == (None, None)
+    assert (hits[3].vector_rank, hits[3].lexical_rank) == (None, 3)
+
+
+def test_rrf_breaks_ties_on_entity_id_and_applies_limit():
+    hits = reciprocal_rank_fusion([(entity(5), 0.1)], [(entity(3), None)], limit=1)
+    assert [hit.entity.id for hit in hits] == [3]
+
+
+def test_rrf_with_one_empty_list_keeps_its_order():
+    hits = reciprocal_rank_fusion([], [(entity(7), 2.0), (entity(2), 1.0)], limit=10)
+    assert [hit.entity.id for hit in hits] == [7, 2]
@@ -0,0 +1,177 @@
+import importlib
+import time
+import pytest
+from util.inference_router import (
+    InferenceBackend, InferenceDeadlineExceeded, InferenceRouter, InferenceUnavailable, strip_reasoning_stream
+)
+from util.inference_scheduler import ( COACH, InferenceOverloaded )
+
+
+class ScriptedBackend(InferenceBackend):
+    """Returns or raises the next scripted outcome on each call"""
+    def __init__(self, name, outcomes, retryable=True, delay=0.0):
+        super().__init__(name)
+        self.outcomes = list(outcomes)
+        self.retryable = retryable
+        self.delay = delay
+        self.calls = 0
+
+    def chat(self, prompt, timeout):
+        self.calls += 1
+        time.sleep(self.delay)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def is_retryable(self, error):
+        return self.retryable
+
+    def retry_after(self, error):
+        return getattr(error, "retry_after", None)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # util re-exports the service's router instance under the module's name, so look the module up directly
+    monkeypatch.setattr(importlib.import_module("util.inference_router"), "INFERENCE_RETRY_BACKOFF_BASE", 0.0)
+
+
+def make_router(*backends, max_retries=2, hedge_enabled=False, scheduler=None):
+    return InferenceRouter(list(backends), hedge_enabled=hedge_enabled, max_retries=max_retries, scheduler=scheduler)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 100])
+def test_strip_reasoning_stream_across_token_boundaries(size):
+    text = "<think>weighing <b>price</b>\nand timing</think>\n\nIt costs too much. <thin ok"
+    tokens = [text[i:i + size] for i in range(0, len(text), size)]
+    assert "".join(strip_reasoning_stream(iter(tokens))) == "It costs too much. <thin ok"
+
+
+def test_strip_reasoning_stream_drops_an_unclosed_block():
+    assert "".join(strip_reasoning_stream(iter(["Answer. <th", "ink>still going"]))) == "Answer. "
+
+
+def test_failover_then_retry_within_the_deadline():
+    remote = ScriptedBackend("remote", [ConnectionError("reset"), "ok"])
+    local = ScriptedBackend("local", [ConnectionError("refused")])
+    router = make_router(remote, local)
+
+    assert router.chat("prompt", deadline_seconds=5) == "ok"
+    assert (remote.calls, local.calls) == (2, 1)
+    assert router.metrics["failovers"] == 1 and router.metrics["retries"] == 1
+    assert remote.breaker.failures == 0 and local.breaker.failures == 1
+
+
+def test_non_retryable_failures_are_not_retried():
+    remote = ScriptedBackend("remote", [ValueError("400 bad request")], retryable=False)
+    router = make_router(remote)
+    with pytest.raises(InferenceUnavailable):
+        router.chat("prompt", deadline_seconds=5)
+    assert remote.calls == 1
+
+
+def test_retry_waits_for_retry_after():
+    throttled = ConnectionError("429 Too Many Requests")
+    throttled.retry_after = 0.2
+    remote = ScriptedBackend("remote", [throttled, "ok"])
+    router = make_router(remote)
+
+    start = time.monotonic()
+    assert router.chat("prompt", deadline_seconds=5) == "ok"
+    assert time.monotonic() - start >= 0.2
+
+
+def test_retry_after_past_the_deadline_gives_up():
+    throttled = ConnectionError("429 Too Many Requests")
+    throttled.retry_after = 10
+    remote = ScriptedBackend("remote", [throttled, "ok"])
+    router = make_router(remote)
+
+    with pytest.raises(InferenceUnavailable):
+        router.chat("prompt", deadline_seconds=1)
+    assert remote.calls == 1
+
+
+def test_retries_stop_at_max_retries():
+    remote = ScriptedBackend("remote", [ConnectionError("reset")] * 5)
+    router = make_router(remote, max_retries=2)
+    with pytest.raises(InferenceUnavailable):
+        router.chat("prompt", deadline_seconds=5)
+    assert remote.calls == 3
+    assert remote.breaker.failures == 3
+
+
+def test_deadline_spent_before_sending_does_not_open_the_circuit():
+    remote = ScriptedBackend("remote", [InferenceDeadlineExceeded("no time left")] * 3)
+    remote.breaker.failure_threshold = 1
+    router = make_router(remote)
+
+    with pytest.raises(InferenceDeadlineExceeded):
+        router.chat("prompt", deadline_seconds=0.05)
+    assert remote.breaker.state == "closed" and remote.breaker.failures == 0
+
+
+def test_stream_retries_before_the_first_token():
+    remote = ScriptedBackend("remote", [ConnectionError("reset"), "streamed"])
+    router = make_router(remote)
+    assert "".join(router.stream_chat("prompt", deadline_seconds=5)) == "streamed"
+    assert remote.calls == 2
+
+
+def test_empty_stream_resolves_a_half_open_probe():
+    class EmptyBackend(InferenceBackend):
+        def stream_chat(self, prompt, timeout):
+            yield from strip_reasoning_stream(iter(["<think>nothing to say</think>"]))
+
+    backend = EmptyBackend("local")
+    backend.breaker.state, backend.breaker.opened_at = "open", time.monotonic() - backend.breaker.reset_seconds
+    router = make_router(backend)
+
+    assert list(router.stream_chat("prompt", deadline_seconds=5)) == []
+    assert backend.breaker.state == "closed"
+    assert backend.breaker.allow()
+
+
+def test_every_upstream_request_takes_a_slot(make_scheduler):
+    scheduler = make_scheduler()
+    remote = ScriptedBackend("remote", [ConnectionError("reset"), "ok"])
+    router = make_router(remote, scheduler=scheduler)
+
+    assert router.chat("prompt", deadline_seconds=5, priority=COACH) == "ok"
+    assert scheduler.metrics["coach"]["admitted"] == 2
+    assert scheduler.in_flight == 0
+
+
+def test_hedge_is_skipped_without_a_free_slot(monkeypatch, make_scheduler):
+    module = importlib.import_module("util.inference_router")
+    monkeypatch.setattr(module, "INFERENCE_HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(module, "INFERENCE_HEDGE_MIN_DELAY", 0.0)
+    scheduler = make_scheduler()
+    remote = ScriptedBackend("remote", ["slow"], delay=0.3)
+    router = make_router(remote, hedge_enabled=True, scheduler=scheduler)
+
+    assert router.chat("prompt", deadline_seconds=5, priority=COACH) == "slow"
+    assert router.metrics["hedges_skipped"] == 1 and router.metrics["hedges"] == 0
+    assert remote.calls == 1
+
+
+def test_abandoned_request_keeps_its_slot_until_it_finishes(make_scheduler):
+    scheduler = make_scheduler()
+    router = make_router(ScriptedBackend("remote", ["late"], delay=0.3), scheduler=scheduler)
+
+    with pytest.raises(InferenceDeadlineExceeded):
+        router.chat("prompt", deadline_seconds=0.05, priority=COACH)
+    assert scheduler.in_flight == 1
+    time.sleep(0.5)
+    assert scheduler.in_flight == 0
+
+
+def test_shed_request_is_raised_without_touching_the_backend(make_scheduler):
+    remote = ScriptedBackend("remote", ["unused"])
+    router = make_router(remote, scheduler=make_scheduler(coach=0))
+
+    with pytest.raises(InferenceOverloaded):
+        router.chat("prompt", deadline_seconds=5, priority=COACH)
+    assert remote.calls == 0
+    assert remote.breaker.state == "closed"
@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from util.inference_router import ( InferenceDeadlineExceeded )
+from util.inference_scheduler import (
+    BACKGROUND, CLIENT_AGENT, COACH, InferenceOverloaded, TokenBucket, is_shed_error
+)
+
+
+def wait_for_depth(scheduler, depth):
+    deadline = time.monotonic() + 2
+    while len(scheduler.waiting) < depth:
+        assert time.monotonic() < deadline, f"queue never reached {depth}"
+        time.sleep(0.005)
+
+
+def queue_call(scheduler, priority, order, label):
+    def run():
+        with scheduler.slot(priority, timeout=5):
+            order.append(label)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiting_calls_run_by_priority_then_arrival(make_scheduler):
+    scheduler = make_scheduler()
+    order = []
+    threads = []
+    with scheduler.slot(CLIENT_AGENT):
+        for label, priority in [("background", BACKGROUND), ("coach-1", COACH),
+                                ("client", CLIENT_AGENT), ("coach-2", COACH)]:
+            threads.append(queue_call(scheduler, priority, order, label))
+            wait_for_depth(scheduler, len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["client", "coach-1", "coach-2", "background"]
+    assert scheduler.in_flight == 0
+    assert scheduler.peak_queue_depth == 4
+
+
+def test_call_is_shed_at_its_class_depth(make_scheduler):
+    scheduler = make_scheduler(coach=2)
+    order = []
+    threads = []
+    with scheduler.slot(CLIENT_AGENT):
+        for label in ("coach-1", "coach-2"):
+            threads.append(queue_call(scheduler, COACH, order, label))
+            wait_for_depth(scheduler, len(threads))
+
+        with pytest.raises(InferenceOverloaded) as shed:
+            with scheduler.slot(COACH, timeout=5):
+                pass
+        assert is_shed_error(str(shed.value))
+
+        # Lower-priority waiters do not count against a higher class
+        threads.append(queue_call(scheduler, CLIENT_AGENT, order, "client"))
+        wait_for_depth(scheduler, 3)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["client", "coach-1", "coach-2"]
+    assert scheduler.metrics["coach"]["shed"] == 1
+    assert scheduler.metrics["client_agent"]["shed"] == 0
+
+
+def test_queued_call_gives_up_at_its_deadline(make_scheduler):
+    scheduler = make_scheduler()
+    with scheduler.slot(CLIENT_AGENT):
+        with pytest.raises(InferenceDeadlineExceeded):
+            with scheduler.slot(COACH, timeout=0.05):
+                pass
+        assert scheduler.waiting == []
+    assert scheduler.metrics["coach"]["timed_out"] == 1
+    assert scheduler.in_flight == 0
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 0.1
+    assert TokenBucket(rate=0, burst=1).take() == 0
+
+
+def test_try_acquire_only_takes_a_free_slot(make_scheduler):
+    scheduler = make_scheduler()
+    assert scheduler.try_acquire(COACH)
+    assert not scheduler.try_acquire(CLIENT_AGENT)  # no free slot
+
+    order = []
+    waiter = queue_call(scheduler, COACH, order, "coach")
+    wait_for_depth(scheduler, 1)
+    scheduler.release()
+    waiter.join(5)
+    assert order == ["coach"]
+    assert scheduler.try_acquire(BACKGROUND)
+    scheduler.release()
+    assert scheduler.in_flight == 0
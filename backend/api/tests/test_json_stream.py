@@ -0,0 +1,97 @@
+import json
+import pytest
+from util.json_stream import ( IncrementalObjectParser, parse_json_tolerant, repair_json )
+
+
+def feed_in_chunks(parser, text, size):
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.extend(parser.feed(text[i:i + size]))
+    return emitted
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Here you go:\n```json\n{"a": 1}\n```', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ('{"a": 1} and then {"b": 2}', {"a": 1}),
+    ('[1, 2, 3', [1, 2, 3]),
+])
+def test_repair_json_fixes_formatting_slips(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": "hel', {"a": "hel"}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+    ('{"a": 1,', {"a": 1}),
+    ('{"a": [1, 2, {"b": 3', {"a": [1, 2, {"b": 3}]}),
+])
+def test_repair_json_closes_truncated_output(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_leaves_string_contents_alone():
+    text = '{"a": "x,}", "b": "say \\"hi\\" [", "c": "a\\\\",}'
+    assert json.loads(repair_json(text)) == {"a": "x,}", "b": 'say "hi" [', "c": "a\\"}
+
+
+def test_repair_json_without_json_returns_text():
+    assert repair_json("no json here") == "no json here"
+
+
+def test_parse_json_tolerant_falls_back_to_repair():
+    assert parse_json_tolerant('{"a": 1}') == {"a": 1}
+    assert parse_json_tolerant('```json\n{"a": [1,],}\n```') == {"a": [1]}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_parser_emits_each_member_once_whatever_the_chunking(size):
+    text = '```json\n{"behavioral_cues": ["hesitant", "asks about {price}"], "risks": {"open": ["budget, timing"]}, "n": 3}\n```'
+    seen = []
+    parser = IncrementalObjectParser(lambda key, value: seen.append(key))
+    emitted = feed_in_chunks(parser, text, size)
+
+    assert [key for key, _ in emitted] == ["behavioral_cues", "risks", "n"]
+    assert seen == ["behavioral_cues", "risks", "n"]
+    assert parser.finish() == {
+        "behavioral_cues": ["hesitant", "asks about {price}"], "risks": {"open": ["budget, timing"]}, "n": 3
+    }
+
+
+def test_parser_reports_member_as_soon_as_it_completes():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"a": [1, 2') == []
+    assert parser.feed('], "b": ') == [("a", [1, 2])]
+    assert parser.feed('"x"}') == [("b", "x")]
+
+
+def test_parser_handles_escapes_split_across_chunks():
+    parser = IncrementalObjectParser()
+    parser.feed('{"a": "quote \\')
+    parser.feed('" and brace }", "b": "back\\')
+    parser.feed('\\slash"}')
+    assert parser.members == {"a": 'quote " and brace }', "b": "back\\slash"}
+
+
+def test_parser_ignores_text_after_the_object():
+    parser = IncrementalObjectParser()
+    parser.feed('{"a": 1} {"b": 2}')
+    assert parser.finish() == {"a": 1}
+
+
+def test_finish_repairs_a_truncated_member():
+    parser = IncrementalObjectParser()
+    parser.feed('{"a": 1, "b": ["x", "y')
+    assert parser.finish() == {"a": 1, "b": ["x", "y"]}
+
+
+def test_finish_drops_a_member_cut_off_inside_its_key():
+    parser = IncrementalObjectParser()
+    parser.feed('{"a": 1, "lon')
+    assert parser.finish() == {"a": 1}
+
+
+def test_finish_without_any_object():
+    parser = IncrementalObjectParser()
+    parser.feed("I cannot help with that.")
+    assert parser.finish() == {}
@@ -0,0 +1,126 @@
+import importlib
+import time
+import numpy as np
+import pytest
+from util.response_cache import ( ResponseCache, _SemanticTier, normalize_prompt )
+
+# Messages that should count as the same question point in nearly the same direction
+VECTORS = {
+    "too expensive": [1.0, 0.0, 0.0],
+    "it costs too much": [0.99, 0.1, 0.0],
+    "send me a brochure": [0.0, 1.0, 0.0],
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    # util re-exports the cache instance under the module's name, so look the module up directly
+    module = importlib.import_module("util.response_cache")
+    monkeypatch.setattr(module, "get_query_embedding", lambda text: VECTORS[text])
+
+
+def make_cache(**kwargs):
+    options = {"ttls": {"default": 60, "classification": 60}, "semantic_types": ["classification"],
+               "similarity": 0.97}
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = make_cache()
+    cache.put("Classify:\n    Too expensive", "substantive")
+
+    assert cache.get("classify: too   EXPENSIVE") == "substantive"
+    assert cache.get("classify: something else") is None
+    assert cache.metrics["default"]["exact_hits"] == 1 and cache.metrics["default"]["misses"] == 1
+
+
+def test_prompt_types_do_not_share_entries():
+    cache = make_cache()
+    cache.put("prompt", "a", prompt_type="default")
+    assert cache.get("prompt", prompt_type="classification") is None
+
+
+def test_entries_expire_after_their_ttl():
+    cache = make_cache(ttls={"default": 0.05})
+    cache.put("prompt", "response")
+    time.sleep(0.1)
+
+    assert cache.get("prompt") is None
+    assert cache.metrics["default"]["expired"] == 1
+
+
+def test_zero_ttl_disables_caching():
+    cache = make_cache(ttls={"default": 0})
+    cache.put("prompt", "response")
+    assert cache.get("prompt") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+    assert cache.metrics["default"]["evictions"] == 1
+
+
+def test_similar_message_is_a_semantic_hit_within_its_scope():
+    cache = make_cache()
+    cache.put("prompt 1", "substantive", "classification", "too expensive", "price")
+
+    assert cache.get("prompt 2", "classification", "it costs too much", "price") == "substantive"
+    assert cache.get("prompt 2", "classification", "it costs too much", "timing") is None
+    assert cache.get("prompt 3", "classification", "send me a brochure", "price") is None
+    assert cache.metrics["classification"]["semantic_hits"] == 1
+
+
+def test_semantic_tier_only_serves_configured_types():
+    cache = make_cache(semantic_types=[])
+    cache.put("prompt 1", "substantive", "classification", "too expensive", "price")
+    assert cache.get("prompt 2", "classification", "it costs too much", "price") is None
+
+
+def test_embedding_failure_falls_back_to_a_miss(monkeypatch):
+    def broken(text):
+        raise RuntimeError("embedding service down")
+
+    monkeypatch.setattr(importlib.import_module("util.response_cache"), "get_query_embedding", broken)
+    cache = make_cache()
+    cache.put("prompt 1", "substantive", "classification", "too expensive", "price")
+
+    assert cache.get("prompt 1", "classification", "too expensive", "price") == "substantive"  # exact tier still works
+    assert cache.get("prompt 2", "classification", "it costs too much", "price") is None
+
+
+def test_get_or_call_calls_once_per_prompt():
+    cache = make_cache()
+    calls = []
+
+    def call(prompt):
+        calls.append(prompt)
+        return "response"
+
+    assert cache.get_or_call("prompt", call) == "response"
+    assert cache.get_or_call("prompt", call) == "response"
+    assert calls == ["prompt"]
+
+
+def test_semantic_tier_overwrites_its_oldest_row_when_full():
+    tier = _SemanticTier(max_entries=2)
+    for index, key in enumerate(["a", "b", "c"]):
+        vector = np.zeros(3, dtype=np.float32)
+        vector[index] = 1.0
+        tier.add(vector, key)
+
+    assert tier.size == 2
+    assert tier.nearest(np.array([1.0, 0.0, 0.0], dtype=np.float32))[0] != "a"
+    assert tier.nearest(np.array([0.0, 0.0, 1.0], dtype=np.float32)) == ("c", 1.0)
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  Hello\n\tWorld  ") == "hello world"
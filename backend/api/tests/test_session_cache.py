@@ -0,0 +1,143 @@
+import threading
+import pytest
+from util.session_cache import ( SessionCache )
+
+
+class Store:
+    """Saver that records each written batch; sessions named in failing raise, those in missing have no row"""
+    def __init__(self, failing=(), missing=()):
+        self.failing = set(failing)
+        self.missing = set(missing)
+        self.batches = []
+
+    def __call__(self, snapshots):
+        ids = [snapshot["id"] for snapshot in snapshots]
+        if self.failing.intersection(ids):
+            raise RuntimeError("write failed")
+        self.batches.append(ids)
+        return [session_id for session_id in ids if session_id in self.missing]
+
+    @property
+    def written(self):
+        return [session_id for batch in self.batches for session_id in batch]
+
+
+def make_cache(saver=None, loader=None, **kwargs):
+    # A long flush interval keeps the background flusher out of the way unless eviction wakes it
+    options = {"max_size": 10, "ttl_seconds": 3600, "flush_seconds": 3600, "flush_batch": 10}
+    options.update(kwargs)
+    return SessionCache(loader=loader, saver=saver, **options)
+
+
+def session(session_id, turn=0):
+    return {"id": session_id, "turn": turn}
+
+
+def test_get_hands_out_private_copies():
+    cache = make_cache()
+    cache.put("a", session("a"))
+
+    copy = cache.get("a")
+    copy["turn"] = 99
+    assert cache.get("a")["turn"] == 0
+
+
+def test_miss_goes_through_the_loader_once():
+    loads = []
+    cache = make_cache(loader=lambda session_id: loads.append(session_id) or session(session_id))
+
+    assert cache.get("a") == session("a")
+    assert cache.get("a") == session("a")
+    assert loads == ["a"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_flush_writes_only_dirty_sessions_in_batches():
+    store = Store()
+    cache = make_cache(store, flush_batch=2)
+    cache.put("clean", session("clean"), dirty=False)
+    for session_id in ("a", "b", "c"):
+        cache.put(session_id, session(session_id))
+    cache.flush()
+
+    assert sorted(store.written) == ["a", "b", "c"]
+    assert all(len(batch) <= 2 for batch in store.batches)
+    assert cache.flush() == 0
+    assert cache.stats()["dirty"] == 0
+
+
+def test_evicted_dirty_session_is_parked_until_written():
+    gate = threading.Event()
+    store = Store()
+    # Eviction wakes the background flusher; hold its write so the parked copy is still unwritten
+    cache = make_cache(lambda snapshots: gate.wait(2) and store(snapshots), max_size=1)
+    cache.put("a", session("a", turn=1))
+    cache.put("b", session("b"))  # pushes a out of the LRU
+
+    assert "a" in cache
+    assert cache.get("a")["turn"] == 1  # served from memory, not reloaded
+    gate.set()
+    cache.flush()
+    assert "a" in store.written
+
+
+def test_failing_session_does_not_hold_back_the_batch():
+    store = Store(failing={"bad"})
+    cache = make_cache(store, max_flush_failures=3)
+    for session_id in ("a", "bad", "c"):
+        cache.put(session_id, session(session_id))
+
+    assert cache.flush() == 2
+    assert sorted(store.written) == ["a", "c"]
+    assert cache.stats()["dirty"] == 1
+
+    cache.flush()
+    cache.flush()  # third failure in a row: stop retrying
+    assert cache.stats()["dirty"] == 0
+    assert cache.metrics["dropped_sessions"] == 1
+    assert cache.get("bad") == session("bad")  # still readable in memory
+
+
+def test_failure_count_resets_after_a_successful_write():
+    store = Store(failing={"a"})
+    cache = make_cache(store, max_flush_failures=2)
+    cache.put("a", session("a"))
+    cache.flush()
+    store.failing.clear()
+    cache.flush()
+
+    store.failing.add("a")
+    cache.put("a", session("a", turn=1))
+    cache.flush()
+    assert cache.metrics["dropped_sessions"] == 0
+    assert cache.stats()["dirty"] == 1
+
+
+def test_session_without_a_row_is_dropped_from_write_behind():
+    store = Store(missing={"gone"})
+    cache = make_cache(store)
+    cache.put("gone", session("gone"))
+    cache.put("a", session("a"))
+
+    assert cache.flush() == 1
+    assert cache.metrics["dropped_sessions"] == 1
+    assert cache.flush() == 0
+
+
+def test_close_writes_everything_still_dirty():
+    store = Store()
+    cache = make_cache(store)
+    cache.put("a", session("a"))
+    cache.close()
+    assert store.written == ["a"]
+
+
+@pytest.mark.parametrize("dirty", [True, False])
+def test_invalidate_forgets_the_session(dirty):
+    store = Store()
+    cache = make_cache(store)
+    cache.put("a", session("a"), dirty=dirty)
+    cache.invalidate("a")
+
+    assert "a" not in cache
+    assert cache.flush() == 0
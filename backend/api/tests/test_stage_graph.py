@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from util.stage_graph import ( Degraded, Stage, run_stage_graph, stage_deadline_seconds )
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_stages_receive_dependency_values_and_run_in_parallel(executor):
+    barrier = threading.Barrier(2, timeout=2)
+
+    def side(value):
+        def fn(_):
+            barrier.wait()  # only passes when both sides are running at once
+            return value
+        return fn
+
+    stages = [
+        Stage("root", lambda _: 1),
+        Stage("left", side(2), ("root",)),
+        Stage("right", side(3), ("root",)),
+        Stage("join", lambda inputs: inputs["left"] + inputs["right"], ("left", "right")),
+    ]
+    result = run_stage_graph(stages, deadline_seconds=5, executor=executor)
+
+    assert result.value("join") == 5
+    assert not result.partial and not result.deadline_hit
+    assert list(result.results) == ["root", "left", "right", "join"]
+
+
+def test_error_skips_dependents_but_not_siblings(executor):
+    def boom(_):
+        raise RuntimeError("boom")
+
+    stages = [
+        Stage("root", lambda _: 1),
+        Stage("bad", boom, ("root",)),
+        Stage("good", lambda _: 2, ("root",)),
+        Stage("after_bad", lambda _: 3, ("bad",)),
+    ]
+    result = run_stage_graph(stages, executor=executor)
+
+    assert result.results["bad"].status == "error"
+    assert result.results["bad"].error == "boom"
+    assert result.results["after_bad"].status == "skipped"
+    assert result.results["after_bad"].error == "upstream bad not ok"
+    assert result.ok("good")
+    assert result.partial
+
+
+def test_degraded_stage_is_ok_and_marked(executor):
+    stages = [
+        Stage("classify", lambda _: Degraded("minor", "heuristic label: shed")),
+        Stage("after", lambda inputs: inputs["classify"].upper(), ("classify",)),
+    ]
+    result = run_stage_graph(stages, executor=executor)
+
+    assert result.value("after") == "MINOR"
+    assert result.results["classify"].degraded == "heuristic label: shed"
+    assert result.results["after"].degraded is None
+    assert result.timings()["classify"]["degraded"] == "heuristic label: shed"
+    assert not result.partial
+
+
+def test_false_condition_skips_stage_and_dependents(executor):
+    stages = [
+        Stage("classify", lambda _: "minor"),
+        Stage("analysis", lambda _: 1, ("classify",), condition=lambda inputs: inputs["classify"] == "substantive"),
+        Stage("solutions", lambda _: 2, ("analysis",)),
+    ]
+    result = run_stage_graph(stages, executor=executor)
+
+    assert result.results["analysis"].status == "skipped"
+    assert result.results["analysis"].error is None
+    assert result.results["solutions"].status == "skipped"
+    assert not result.partial
+    assert result.value("solutions", "default") == "default"
+
+
+def test_deadline_times_out_running_and_skips_unstarted_stages(executor):
+    release = threading.Event()
+    stages = [
+        Stage("fast", lambda _: 1),
+        Stage("slow", lambda _: release.wait(2)),
+        Stage("after_slow", lambda _: 2, ("slow",)),
+    ]
+    start = time.perf_counter()
+    result = run_stage_graph(stages, deadline_seconds=0.1, executor=executor)
+    release.set()
+
+    assert time.perf_counter() - start < 1
+    assert result.deadline_hit and result.partial
+    assert result.ok("fast")
+    assert result.results["slow"].status == "timeout"
+    assert result.results["slow"].elapsed_ms is not None
+    assert result.results["after_slow"].status == "skipped"
+
+
+def test_stage_queued_past_the_deadline_never_starts():
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    started = threading.Event()
+    try:
+        pool.submit(release.wait, 2)  # holds the only worker past the deadline
+        result = run_stage_graph([Stage("late", lambda _: started.set())], deadline_seconds=0.05, executor=pool)
+        release.set()
+    finally:
+        pool.shutdown(wait=True)
+
+    assert result.results["late"].status == "timeout"
+    assert not started.is_set()
+
+
+def test_exempt_stage_runs_and_is_awaited_past_the_deadline(executor):
+    stored = []
+    stages = [
+        Stage("reply", lambda _: time.sleep(0.05) or "reply"),
+        Stage("slow", lambda _: time.sleep(1)),
+        Stage("persist", lambda inputs: time.sleep(0.2) or stored.append(inputs["reply"]), ("reply",),
+              exempt_from_deadline=True),
+    ]
+    result = run_stage_graph(stages, deadline_seconds=0.1, executor=executor)
+
+    assert result.deadline_hit
+    assert result.ok("persist")
+    assert stored == ["reply"]
+    assert result.results["slow"].status == "timeout"
+
+
+def test_exempt_stage_is_still_skipped_when_its_dependency_times_out(executor):
+    release = threading.Event()
+    stages = [
+        Stage("reply", lambda _: release.wait(2)),
+        Stage("persist", lambda _: None, ("reply",), exempt_from_deadline=True),
+    ]
+    result = run_stage_graph(stages, deadline_seconds=0.05, executor=executor)
+    release.set()
+
+    assert result.results["reply"].status == "timeout"
+    assert result.results["persist"].status == "skipped"
+
+
+def test_stage_deadline_seconds_tracks_the_run(executor):
+    seen = {}
+
+    def measure(_):
+        seen["remaining"] = stage_deadline_seconds(100)
+        return seen["remaining"]
+
+    run_stage_graph([Stage("measure", measure)], deadline_seconds=5, executor=executor)
+    assert 0 < seen["remaining"] <= 5
+    assert stage_deadline_seconds(7) == 7  # outside a run
+
+
+def test_stage_deadline_seconds_raises_once_the_deadline_has_passed(executor):
+    release = threading.Event()
+    errors = []
+
+    def late(_):
+        release.wait(2)
+        try:
+            stage_deadline_seconds(10)
+        except TimeoutError as e:
+            errors.append(e)
+
+    run_stage_graph([Stage("late", late)], deadline_seconds=0.05, executor=executor)
+    release.set()
+    executor.shutdown(wait=True)
+    assert len(errors) == 1
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", None), Stage("a", None)], "Duplicate"),
+    ([Stage("a", None, ("missing",))], "unknown"),
+    ([Stage("a", None, ("b",)), Stage("b", None, ("a",))], "cycle"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_stage_graph(stages)
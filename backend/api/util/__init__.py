@@ -1,4 +1,19 @@
 from .knowledge_graph import *
 from .db_service import *
 from .session_service import *
-from .inference_service import *
\ No newline at end of file
+from .inference_service import *
+from .index_sync import *
+from .vector_index import *
+from .bm25_index import *
+from .embedding_cache import *
+from .graph_snapshot import *
+from .session_seed import *
+from .hybrid_retrieval import *
+from .session_cache import *
+from .session_archive import *
+from .stage_graph import *
+from .response_cache import *
+from .response_classifier import *
+from .json_stream import *
+from .inference_router import *
+from .inference_scheduler import *
\ No newline at end of file
@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dotenv import load_dotenv
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseEntity )
+from .index_sync import ( EntitySnapshot, IndexedEntity, on_entity_commit, to_indexed_entity )
+from typing import Dict, List, Optional, Tuple
+
+load_dotenv()
+
+BM25_INDEX_ENABLED = os.getenv("BM25_INDEX_ENABLED", "true").lower() == "true"
+BM25_INDEX_MAX_AGE = int(os.getenv("BM25_INDEX_MAX_AGE", "900"))
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its of on or our so that the their them
+there these they this to was we were what when which who will with you your
+""".split())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+class BM25Index:
+    """Tokenized inverted index over entity descriptions with Okapi BM25 ranking.
+
+    Postings map term -> {entity id: term frequency}. Corpus statistics are kept
+    per entity type so scores filtered by type use that type's document
+    frequencies and average length, matching how the coach queries one type at a time.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_age: int = BM25_INDEX_MAX_AGE):
+        self.k1 = k1
+        self.b = b
+        self.max_age = max_age
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.entities: Dict[int, IndexedEntity] = {}
+        self.type_doc_counts: Counter = Counter()
+        self.type_total_lengths: Counter = Counter()
+        self.type_doc_freqs: Dict[str, Counter] = {}
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+        self._reloading = False
+
+    def rebuild(self):
+        """Replace the whole index with the current contents of the entities table"""
+        with SessionLocal() as session:
+            rows = session.query(
+                DatabaseEntity.id,
+                DatabaseEntity.entity_id,
+                DatabaseEntity.name,
+                DatabaseEntity.type,
+                DatabaseEntity.description
+            ).filter(DatabaseEntity.deleted_at.is_(None)).all()
+
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.entities = {}
+            self.type_doc_counts = Counter()
+            self.type_total_lengths = Counter()
+            self.type_doc_freqs = {}
+            for row in rows:
+                self._add(to_indexed_entity(row))
+            self.loaded_at = time.time()
+        print(f"BM25 index built over {len(rows)} entities with {len(self.postings)} terms")
+
+    def _add(self, entity: IndexedEntity):
+        terms = Counter(tokenize(entity.description))
+        self.entities[entity.id] = entity
+        self.doc_lengths[entity.id] = sum(terms.values())
+        self.type_doc_counts[entity.type] += 1
+        self.type_total_lengths[entity.type] += self.doc_lengths[entity.id]
+        doc_freqs = self.type_doc_freqs.setdefault(entity.type, Counter())
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[entity.id] = tf
+            doc_freqs[term] += 1
+
+    def _remove(self, entity_id: int):
+        entity = self.entities.pop(entity_id, None)
+        if entity is None:
+            return
+        length = self.doc_lengths.pop(entity_id)
+        self.type_doc_counts[entity.type] -= 1
+        self.type_total_lengths[entity.type] -= length
+        doc_freqs = self.type_doc_freqs[entity.type]
+        for term in set(tokenize(entity.description)):
+            postings = self.postings.get(term)
+            if postings is not None and postings.pop(entity_id, None) is not None:
+                doc_freqs[term] -= 1
+                if not doc_freqs[term]:
+                    del doc_freqs[term]
+                if not postings:
+                    del self.postings[term]
+
+    def apply_changes(self, upserted: List[EntitySnapshot], deleted: List[int]):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            for entity_id in deleted:
+                self._remove(entity_id)
+            for snapshot in upserted:
+                self._remove(snapshot.id)
+                self._add(to_indexed_entity(snapshot))
+
+    def is_fresh(self) -> bool:
+        if self.loaded_at is None:
+            return False
+        return self.max_age <= 0 or time.time() - self.loaded_at < self.max_age
+
+    def search(self, query_text: str, entity_type: Optional[str] = None, limit: int = 10) -> Optional[List[Tuple[IndexedEntity, float]]]:
+        """Return (entity, bm25_score) pairs best first, or None when the index cannot answer"""
+        if not self.is_fresh():
+            return None
+        query_terms = set(tokenize(query_text))
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for term in query_terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                for entity_id, tf in postings.items():
+                    doc_type = self.entities[entity_id].type
+                    if entity_type is not None and doc_type != entity_type:
+                        continue
+                    scores[entity_id] = scores.get(entity_id, 0.0) + self._term_score(term, tf, entity_id, doc_type)
+            ranked = sorted(scores.items(), key=lambda s: (-s[1], s[0]))[:limit]
+            return [(self.entities[entity_id], score) for entity_id, score in ranked]
+
+    def _term_score(self, term: str, tf: int, entity_id: int, doc_type: str) -> float:
+        doc_count = self.type_doc_counts[doc_type]
+        df = self.type_doc_freqs[doc_type][term]
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        avg_length = self.type_total_lengths[doc_type] / doc_count if doc_count else 0
+        norm = 1 - self.b + self.b * (self.doc_lengths[entity_id] / avg_length if avg_length else 0)
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+    def rebuild_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def _rebuild():
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"BM25 index rebuild failed: {e}")
+            finally:
+                self._reloading = False
+
+        threading.Thread(target=_rebuild, daemon=True).start()
+
+
+bm25_index = BM25Index()
+
+
+@on_entity_commit
+def _sync_bm25_index(upserted, deleted):
+    bm25_index.apply_changes(upserted, deleted)
+
+
+def load_bm25_index():
+    """Build the BM25 index at startup; on failure callers keep using LIKE scans"""
+    if not BM25_INDEX_ENABLED:
+        print("BM25 index disabled")
+        return
+    try:
+        bm25_index.rebuild()
+    except Exception as e:
+        print(f"BM25 index build failed, falling back to TiDB: {e}")
+
+
+def search_bm25_index(query_text: str, entity_type: Optional[str] = None, limit: int = 10):
+    if not BM25_INDEX_ENABLED:
+        return None
+    hits = bm25_index.search(query_text, entity_type, limit)
+    if hits is None and bm25_index.loaded_at is not None:
+        bm25_index.rebuild_in_background()
+    return hits
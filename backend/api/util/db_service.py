@@ -16,20 +16,36 @@ from sqlalchemy import (
 )
 from config.tidb_config import (SessionLocal)
 from tidb_vector.sqlalchemy import VectorType
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, aliased
 import ollama
 from flask import jsonify
 from .knowledge_graph import ( DatabaseEntity, DatabaseRelationship, get_query_embedding )
+from .hybrid_retrieval import ( hybrid_search, keyword_candidates, vector_candidates )
+from .graph_snapshot import ( get_graph_snapshot )
 from model.context_model import (CoachAgentRiskAnalysis, CoachAgentSolution, CoachAgentSolutionAnalysis, CoachAgentProblemAnalysis)
-from typing import List
+from typing import List, Optional
+import os
 
+STRATEGY_TOP_K = int(os.getenv("HYBRID_STRATEGY_TOP_K", "8"))
+RELATED_OBJECTION_TOP_K = int(os.getenv("HYBRID_RELATED_OBJECTION_TOP_K", "10"))
+
+
+def search_entities_by_embedding(session, embedding, entity_type: Optional[str] = None, limit: int = 10):
+    """Nearest entities by description_vec, served in-process when the vector index is fresh"""
+    return [entity for entity, _ in vector_candidates(session, embedding, entity_type, limit)]
+
+
+def search_entities_by_keywords(session, query_text: str, entity_type: Optional[str] = None, limit: int = 10, max_terms: Optional[int] = None):
+    """BM25-ranked entities from the in-process inverted index, or a LIKE scan when it is unavailable"""
+    return [entity for entity, _ in keyword_candidates(session, query_text, entity_type, limit, max_terms)]
 
 def get_client_profile(client_profile_id):
     with SessionLocal() as session:
         # Query for the client profile with the given entity_id
         profile = session.query(DatabaseEntity).filter(
             DatabaseEntity.entity_id == client_profile_id,
-            DatabaseEntity.type == "ClientProfile"
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
         ).first()
         
         if not profile:
@@ -47,7 +63,8 @@ def get_client_objections(client_profile_id):
         # Get objections for this client profile
         client_profile = session.query(DatabaseEntity).filter(
             DatabaseEntity.entity_id == client_profile_id,
-            DatabaseEntity.type == "ClientProfile"
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
         ).first()
         
         if not client_profile:
@@ -59,29 +76,19 @@ def get_client_objections(client_profile_id):
             DatabaseRelationship.target_entity_id == DatabaseEntity.id
         ).filter(
             DatabaseRelationship.source_entity_id == client_profile.id,
-            DatabaseRelationship.relationship_type == "HAS_OBJECTION"
-        ).all()
+            DatabaseRelationship.relationship_type == "HAS_OBJECTION",
+            DatabaseRelationship.deleted_at.is_(None),
+            DatabaseEntity.deleted_at.is_(None)
+        ).order_by(DatabaseRelationship.id).all()
         
         # Perform initial searches
         objection_descriptions = [obj.description for obj in objections]
         # print("client objections", objection_descriptions)
         initial_context = " ".join(objection_descriptions)
         
-        # Embedding search
-        embedding = get_query_embedding(initial_context)
-        embedding_results = session.query(DatabaseEntity).order_by(
-            DatabaseEntity.description_vec.cosine_distance(embedding)
-        ).limit(20).all()
-        em_objs = [obj.description for obj in embedding_results]
-        
-        # BM25 search (simplified)
-        bm25_results = session.query(DatabaseEntity).filter(
-            or_(
-                DatabaseEntity.description.contains(term) for term in initial_context.split()[:5]
-            )
-        ).limit(20).all()
-        bm25_objs = [obj.description for obj in bm25_results]
-        related_objs = list(set(em_objs + bm25_objs))
+        # Hybrid embedding + BM25 search, fused by reciprocal rank
+        hits = hybrid_search(initial_context, None, limit=RELATED_OBJECTION_TOP_K, max_terms=5)
+        related_objs = list(dict.fromkeys(hit.entity.description for hit in hits))
                
         return {
             "client_objections": objection_descriptions,
@@ -93,7 +100,8 @@ def get_client_with_detailed_objections(client_profile_id):
         # Get objections for this client profile
         client_profile = session.query(DatabaseEntity).filter(
             DatabaseEntity.entity_id == client_profile_id,
-            DatabaseEntity.type == "ClientProfile"
+            DatabaseEntity.type == "ClientProfile",
+            DatabaseEntity.deleted_at.is_(None)
         ).first()
         
         if not client_profile:
@@ -105,110 +113,96 @@ def get_client_with_detailed_objections(client_profile_id):
             DatabaseRelationship.target_entity_id == DatabaseEntity.id
         ).filter(
             DatabaseRelationship.source_entity_id == client_profile.id,
-            DatabaseRelationship.relationship_type == "HAS_OBJECTION"
-        ).all()
+            DatabaseRelationship.relationship_type == "HAS_OBJECTION",
+            DatabaseRelationship.deleted_at.is_(None),
+            DatabaseEntity.deleted_at.is_(None)
+        ).order_by(DatabaseRelationship.id).all()
         
         # Perform initial searches
         objection_descriptions = [obj.description for obj in objections]
         # print("client objections", objection_descriptions)
         initial_context = " ".join(objection_descriptions)
         
-        # Embedding search
-        embedding = get_query_embedding(initial_context)
-        embedding_results = session.query(DatabaseEntity).filter(
-            DatabaseEntity.type == 'Objection'
-        ).order_by(
-            DatabaseEntity.description_vec.cosine_distance(embedding)
-        ).limit(20).all()
-        em_objs = [obj.description for obj in embedding_results]
-        
-        # BM25 search (simplified)
-        bm25_results = session.query(DatabaseEntity).filter(
-            and_(
-                DatabaseEntity.type == 'Objection',
-                or_(
-                    DatabaseEntity.description.contains(term) for term in initial_context.split()[:5]
-                )
-            )
-        ).limit(20).all()
-        bm25_objs = [obj.description for obj in bm25_results]
-        related_objs = list(set(em_objs + bm25_objs))
+        # Hybrid embedding + BM25 search, fused by reciprocal rank
+        hits = hybrid_search(initial_context, 'Objection', limit=RELATED_OBJECTION_TOP_K, max_terms=5)
+        related_objs = list(dict.fromkeys(hit.entity.description for hit in hits))
                
         return {
             "client_objections": objection_descriptions,
             "related_objections": related_objs
         }
 
-def get_solutions_to_objections(problem_analysis: CoachAgentProblemAnalysis, solution_analysis: CoachAgentSolutionAnalysis):
-    with SessionLocal() as session:
-        # Extract risk descriptions
-        risk_analysis = problem_analysis.risk
-        risk_descriptions = [risk.description for risk in risk_analysis.risks]
-        risk_query_text = " ".join(risk_descriptions)
-        risk_strategies = get_strategies(risk_query_text)
-
-        behavioral_analysis = problem_analysis.behavioral
-        behavioral_descriptions = [b.interpretation for b in behavioral_analysis.behavioral_cues]
-        bhv_query_text = " ".join(behavioral_descriptions)
-        bhv_strategies = get_strategies(bhv_query_text)
-        
-        risk_solutions = get_solutions(risk_strategies, solution_analysis)
-        bhv_solutions = get_solutions(bhv_strategies, solution_analysis)
-        return solution_analysis
+def get_solutions_to_objections(problem_analysis: CoachAgentProblemAnalysis, solution_analysis: CoachAgentSolutionAnalysis,
+                                known_strategies: Optional[dict] = None):
+    # known_strategies: already retrieved for this objection (the turn's prefetch), merged in without another search
+    # Extract risk descriptions
+    risk_analysis = problem_analysis.risk
+    risk_descriptions = [risk.description for risk in risk_analysis.risks]
+    risk_query_text = " ".join(risk_descriptions)
+    risk_strategies = get_strategies(risk_query_text)
 
-def get_strategies(query_text):
-    with SessionLocal() as session:
-        # Embedding search
-        embedding = get_query_embedding(query_text)
-        embedding_results = session.query(DatabaseEntity).filter(
-            DatabaseEntity.type == 'Strategy'
-        ).order_by(
-            DatabaseEntity.description_vec.cosine_distance(embedding)
-        ).limit(10).all()
-            
-        # BM25 search
-        bm25_results = session.query(DatabaseEntity).filter(
-            and_(
-                DatabaseEntity.type == 'Strategy',
-                or_(
-                    DatabaseEntity.description.contains(term) for term in query_text.split()
-                )
-            )
-        ).limit(10).all()
-            
-        # Combine and deduplicate strategies
-        unique_strategies = {s.id: s for s in embedding_results}
-        unique_strategies.update({s.id: s for s in bm25_results})
-        return unique_strategies
+    behavioral_analysis = problem_analysis.behavioral
+    behavioral_descriptions = [b.interpretation for b in behavioral_analysis.behavioral_cues]
+    bhv_query_text = " ".join(behavioral_descriptions)
+    bhv_strategies = get_strategies(bhv_query_text)
+
+    # Resolve both strategy sets in one traversal; strategies found by both appear once
+    return get_solutions({**(known_strategies or {}), **risk_strategies, **bhv_strategies}, solution_analysis)
+
+def get_strategies(query_text, limit: int = STRATEGY_TOP_K):
+    """Top strategies for the query, best first, from RRF-fused embedding and BM25 retrieval"""
+    hits = hybrid_search(query_text, 'Strategy', limit=limit)
+    return {hit.entity.id: hit.entity for hit in hits}
 
 def get_solutions(unique_strategies, solution_analysis):
+    # Strategy -USES-> Technique -RESULTS_IN-> Outcome, from the in-memory CSR graph when loaded
+    strategy_ids = list(unique_strategies.keys())
+    snapshot = get_graph_snapshot()
+    if snapshot is not None:
+        triples = snapshot.solution_triples(strategy_ids)
+    else:
+        triples = get_solution_triples(strategy_ids)
+
+    for strategy, technique, outcome in triples:
+        solution_analysis.analysis.append(
+            CoachAgentSolution(strategy=strategy, technique=technique, outcome=outcome))
+    return solution_analysis
+
+def get_solution_triples(strategy_ids: List[int]):
+    """All (strategy, technique, outcome) descriptions for a batch of strategies in one joined query"""
+    if not strategy_ids:
+        return []
+    strategy = aliased(DatabaseEntity)
+    technique = aliased(DatabaseEntity)
+    outcome = aliased(DatabaseEntity)
+    uses = aliased(DatabaseRelationship)
+    results_in = aliased(DatabaseRelationship)
+
     with SessionLocal() as session:
-        for strategy in unique_strategies.values():
-            # Find techniques for the strategy
-            techniques = session.query(DatabaseEntity).join(
-                DatabaseRelationship,
-                DatabaseRelationship.target_entity_id == DatabaseEntity.id
-            ).filter(
-                DatabaseRelationship.source_entity_id == strategy.id,
-                DatabaseRelationship.relationship_type == "USES"
-            ).all()
-                
-            for technique in techniques:
-                # Find outcomes for the technique
-                outcomes = session.query(DatabaseEntity).join(
-                    DatabaseRelationship,
-                    DatabaseRelationship.target_entity_id == DatabaseEntity.id
-                ).filter(
-                    DatabaseRelationship.source_entity_id == technique.id,
-                    DatabaseRelationship.relationship_type == "RESULTS_IN"
-                ).all()
-                    
-                for outcome in outcomes:
-                    sol  = CoachAgentSolution(
-                        strategy=strategy.description, 
-                        technique=technique.description,
-                        outcome=outcome.description)
-                    solution_analysis.analysis.append(sol)
-      
-        return solution_analysis
+        rows = session.query(
+            strategy.id, strategy.description, technique.description, outcome.description
+        ).join(
+            uses, and_(
+                uses.source_entity_id == strategy.id,
+                uses.relationship_type == "USES",
+                uses.deleted_at.is_(None)
+            )
+        ).join(
+            technique, and_(technique.id == uses.target_entity_id, technique.deleted_at.is_(None))
+        ).join(
+            results_in, and_(
+                results_in.source_entity_id == technique.id,
+                results_in.relationship_type == "RESULTS_IN",
+                results_in.deleted_at.is_(None)
+            )
+        ).join(
+            outcome, and_(outcome.id == results_in.target_entity_id, outcome.deleted_at.is_(None))
+        ).filter(
+            strategy.id.in_(strategy_ids),
+            strategy.deleted_at.is_(None)
+        ).order_by(technique.id, outcome.id).all()
 
+    # Keep the caller's strategy ranking, matching the in-memory graph traversal
+    position = {strategy_id: i for i, strategy_id in enumerate(strategy_ids)}
+    rows.sort(key=lambda row: position[row[0]])
+    return [(row[1], row[2], row[3]) for row in rows]
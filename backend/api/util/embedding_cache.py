@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+EMBEDDING_CACHE_MEMORY_BYTES = int(os.getenv("EMBEDDING_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+
+
+def content_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """Append-only memory-mapped vector file for one embedding model, safe to share between processes.
+
+    Layout under <root>/<model>/: vectors.f32 holds float32 rows, keys.tsv maps
+    content hash -> row, meta.json records the dimension. A different model
+    name gets a different directory, so changing models never serves stale vectors.
+    Writers take an exclusive lock on store.lock, catch up on rows other processes
+    appended to keys.tsv, and claim the next row after all of them.
+    """
+    GROWTH_ROWS = 1024
+
+    def __init__(self, root: str, model: str):
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        if fcntl is None:
+            # No advisory locks on this platform: keep each process in its own directory
+            self.path = os.path.join(self.path, f"pid-{os.getpid()}")
+        self.rows: Dict[str, int] = {}
+        self.next_row = 0
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self.vectors: Optional[np.memmap] = None
+        self._keys_offset = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._keys_path = os.path.join(self.path, "keys.tsv")
+        self._lock_file = open(os.path.join(self.path, "store.lock"), "a")
+        with self._locked():
+            self._read_meta()
+            self._sync_keys()
+        if self.dim is not None:
+            self._map(max(self.next_row, self.GROWTH_ROWS))
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if self.dim is None and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+
+    def _sync_keys(self):
+        """Pick up keys appended since the last read, by this process or any other"""
+        if not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # Only whole lines; a torn trailing line left by a crashed writer is skipped here and cut off by the next put
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            parts = line.split("\t")
+            if len(parts) == 2:
+                row = int(parts[1])
+                self.rows[parts[0]] = row
+                self.next_row = max(self.next_row, row + 1)
+        self._keys_offset += end
+
+    def _map(self, capacity: int):
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        needed = capacity * self.dim * 4
+        with open(vectors_path, "ab") as f:
+            if f.tell() < needed:
+                f.truncate(needed)
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        if row is None or self.dim is None:
+            return None
+        if row >= self.capacity:
+            self._map(row + self.GROWTH_ROWS)
+        return np.array(self.vectors[row])
+
+    def put(self, key: str, vector: np.ndarray):
+        if key in self.rows:
+            return
+        with self._locked():
+            self._read_meta()
+            self._sync_keys()
+            if key in self.rows:
+                return
+            if self.dim is None:
+                self.dim = int(vector.shape[0])
+                with open(os.path.join(self.path, "meta.json"), "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if vector.shape[0] != self.dim:
+                return
+            row = self.next_row
+            if row >= self.capacity:
+                self._map(max(row + 1, self.capacity + self.GROWTH_ROWS))
+            self.vectors[row] = vector
+            # Row data reaches the file before the key does, so a crash never indexes garbage
+            self.vectors.flush()
+            with open(self._keys_path, "ab") as keys_file:
+                # _sync_keys stopped at the last newline; anything after it is a torn line from a crashed
+                # writer, and appending onto it would merge it with this key into one unreadable line
+                if keys_file.tell() > self._keys_offset:
+                    keys_file.truncate(self._keys_offset)
+                keys_file.write(f"{key}\t{row}\n".encode("utf-8"))
+            self._sync_keys()
+
+    def close(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        self._lock_file.close()
+
+
+class EmbeddingCache:
+    """Content-hash keyed embedding cache: in-memory LRU bounded by bytes over a disk store"""
+    def __init__(self, root: str = EMBEDDING_CACHE_DIR, max_memory_bytes: int = EMBEDDING_CACHE_MEMORY_BYTES):
+        self.root = root
+        self.max_memory_bytes = max_memory_bytes
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.memory_bytes = 0
+        self.stores: Dict[str, DiskEmbeddingStore] = {}
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def _store(self, model: str) -> Optional[DiskEmbeddingStore]:
+        if model not in self.stores:
+            try:
+                self.stores[model] = DiskEmbeddingStore(self.root, model)
+            except OSError as e:
+                print(f"Embedding disk cache unavailable for {model}: {e}")
+                self.stores[model] = None
+        return self.stores[model]
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = vector
+        self.memory_bytes += vector.nbytes
+        while self.memory_bytes > self.max_memory_bytes and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+            self.metrics["evictions"] += 1
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = content_key(model, text)
+        with self._lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+                return vector.tolist()
+            store = self._store(model)
+            vector = store.get(key) if store is not None else None
+            if vector is not None:
+                self._remember(key, vector)
+                self.metrics["disk_hits"] += 1
+                return vector.tolist()
+            self.metrics["misses"] += 1
+            return None
+
+    def put(self, model: str, text: str, embedding):
+        key = content_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            store = self._store(model)
+            if store is not None:
+                store.put(key, vector)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.metrics["memory_hits"] + self.metrics["disk_hits"] + self.metrics["misses"]
+            hits = lookups - self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": {model: len(s.rows) for model, s in self.stores.items() if s is not None}
+            }
+
+    def close(self):
+        with self._lock:
+            for store in self.stores.values():
+                if store is not None:
+                    store.close()
+
+
+embedding_cache = EmbeddingCache()
+
+
+def cached_embedding(model: str, text: str, embed_fn):
+    """Return the embedding for text, calling embed_fn(text) only on a cache miss"""
+    if not EMBEDDING_CACHE_ENABLED:
+        return embed_fn(text)
+    embedding = embedding_cache.get(model, text)
+    if embedding is None:
+        embedding = embed_fn(text)
+        embedding_cache.put(model, text, embedding)
+    return embedding
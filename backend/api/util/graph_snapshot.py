@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseEntity, DatabaseRelationship, get_graph_version )
+from .index_sync import ( IndexedEntity )
+from typing import Dict, Iterable, List, Optional, Tuple
+
+load_dotenv()
+
+GRAPH_SNAPSHOT_ENABLED = os.getenv("GRAPH_SNAPSHOT_ENABLED", "true").lower() == "true"
+# How often a query may trigger a kg_version check against TiDB
+GRAPH_SNAPSHOT_POLL_SECONDS = int(os.getenv("GRAPH_SNAPSHOT_POLL_SECONDS", "30"))
+
+
+class _CSR:
+    """Compressed sparse row adjacency for one relationship type over dense node indices"""
+    def __init__(self, node_count: int, sources: np.ndarray, targets: np.ndarray):
+        order = np.argsort(sources, kind="stable")
+        self.indices = targets[order].astype(np.int32)
+        counts = np.bincount(sources, minlength=node_count)
+        self.indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+
+class GraphSnapshot:
+    """Read-only in-memory copy of the live knowledge graph.
+
+    Entities are renumbered to dense indices; descriptions, names and types are
+    interned into shared string tables referenced by int32 arrays. Edges are
+    stored as one CSR structure per relationship_type, so a hop is an array slice.
+    """
+    def __init__(self, version: int, entity_rows, relationship_rows):
+        self.version = version
+        self.loaded_at = time.time()
+        self.db_ids = np.array([row.id for row in entity_rows], dtype=np.int64)
+        self.node_of: Dict[int, int] = {db_id: i for i, db_id in enumerate(self.db_ids.tolist())}
+        self.entity_ids = [row.entity_id for row in entity_rows]
+        self.strings: List[str] = []
+        string_ids: Dict[str, int] = {}
+
+        def intern(value) -> int:
+            value = value or ""
+            if value not in string_ids:
+                string_ids[value] = len(self.strings)
+                self.strings.append(value)
+            return string_ids[value]
+
+        self.description_idx = np.array([intern(row.description) for row in entity_rows], dtype=np.int32)
+        self.name_idx = np.array([intern(row.name) for row in entity_rows], dtype=np.int32)
+        self.type_idx = np.array([intern(row.type) for row in entity_rows], dtype=np.int32)
+
+        edges: Dict[str, Tuple[List[int], List[int]]] = {}
+        for row in relationship_rows:
+            source = self.node_of.get(row.source_entity_id)
+            target = self.node_of.get(row.target_entity_id)
+            if source is None or target is None:
+                continue
+            sources, targets = edges.setdefault(row.relationship_type, ([], []))
+            sources.append(source)
+            targets.append(target)
+        node_count = len(self.db_ids)
+        self.adjacency: Dict[str, _CSR] = {
+            rel_type: _CSR(node_count, np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64))
+            for rel_type, (sources, targets) in edges.items()
+        }
+
+    def entity(self, node: int) -> IndexedEntity:
+        return IndexedEntity(
+            int(self.db_ids[node]),
+            self.entity_ids[node],
+            self.strings[self.name_idx[node]],
+            self.strings[self.type_idx[node]],
+            self.strings[self.description_idx[node]]
+        )
+
+    def description(self, node: int) -> str:
+        return self.strings[self.description_idx[node]]
+
+    def neighbors(self, db_id: int, relationship_type: str) -> List[int]:
+        """Target entity db ids reachable from db_id over one relationship_type edge"""
+        node = self.node_of.get(db_id)
+        csr = self.adjacency.get(relationship_type)
+        if node is None or csr is None:
+            return []
+        return self.db_ids[csr.neighbors(node)].tolist()
+
+    def solution_triples(self, strategy_ids: Iterable[int]) -> List[Tuple[str, str, str]]:
+        """(strategy, technique, outcome) descriptions along Strategy -USES-> Technique -RESULTS_IN-> Outcome"""
+        uses = self.adjacency.get("USES")
+        results_in = self.adjacency.get("RESULTS_IN")
+        if uses is None or results_in is None:
+            return []
+        triples = []
+        for strategy_id in strategy_ids:
+            strategy = self.node_of.get(strategy_id)
+            if strategy is None:
+                continue
+            for technique in uses.neighbors(strategy):
+                for outcome in results_in.neighbors(technique):
+                    triples.append((self.description(strategy), self.description(technique), self.description(outcome)))
+        return triples
+
+
+class GraphSnapshotManager:
+    """Holds the current snapshot and swaps in a new one when kg_version moves"""
+    def __init__(self, poll_seconds: int = GRAPH_SNAPSHOT_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.snapshot: Optional[GraphSnapshot] = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def load(self):
+        with SessionLocal() as session:
+            version = _read_graph_version(session)
+            entity_rows = session.query(
+                DatabaseEntity.id,
+                DatabaseEntity.entity_id,
+                DatabaseEntity.name,
+                DatabaseEntity.type,
+                DatabaseEntity.description
+            ).filter(DatabaseEntity.deleted_at.is_(None)).order_by(DatabaseEntity.id).all()
+            relationship_rows = session.query(
+                DatabaseRelationship.source_entity_id,
+                DatabaseRelationship.target_entity_id,
+                DatabaseRelationship.relationship_type
+            ).filter(DatabaseRelationship.deleted_at.is_(None)).all()
+
+        snapshot = GraphSnapshot(version, entity_rows, relationship_rows)
+        self.snapshot = snapshot
+        self.checked_at = time.time()
+        print(f"Graph snapshot v{version}: {len(entity_rows)} entities, "
+              f"{len(relationship_rows)} relationships, {len(snapshot.strings)} interned strings")
+
+    def current(self) -> Optional[GraphSnapshot]:
+        """Return the loaded snapshot, scheduling a version check when one is due"""
+        if self.snapshot is not None and time.time() - self.checked_at >= self.poll_seconds:
+            self._refresh_in_background()
+        return self.snapshot
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _refresh():
+            try:
+                with SessionLocal() as session:
+                    version = _read_graph_version(session)
+                if self.snapshot is None or version != self.snapshot.version:
+                    self.load()
+                else:
+                    self.checked_at = time.time()
+            except Exception as e:
+                print(f"Graph snapshot refresh failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_refresh, daemon=True).start()
+
+
+def _read_graph_version(session) -> int:
+    try:
+        return get_graph_version(session)
+    except Exception:
+        # Graphs built before kg_version existed have no version table yet
+        session.rollback()
+        return 0
+
+
+graph_snapshot = GraphSnapshotManager()
+
+
+def load_graph_snapshot():
+    """Load the graph snapshot at startup; on failure traversals keep querying TiDB"""
+    if not GRAPH_SNAPSHOT_ENABLED:
+        print("Graph snapshot disabled")
+        return
+    try:
+        graph_snapshot.load()
+    except Exception as e:
+        print(f"Graph snapshot load failed, falling back to TiDB: {e}")
+
+
+def get_graph_snapshot() -> Optional[GraphSnapshot]:
+    if not GRAPH_SNAPSHOT_ENABLED:
+        return None
+    return graph_snapshot.current()
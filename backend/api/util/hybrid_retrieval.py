@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import (or_, and_)
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseEntity, get_query_embedding )
+from .vector_index import ( search_vector_index )
+from .bm25_index import ( search_bm25_index )
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+load_dotenv()
+
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Shared by all requests; each hybrid search runs one vector and one lexical branch
+_retrieval_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HYBRID_MAX_WORKERS", "8")))
+
+
+class HybridHit(NamedTuple):
+    entity: Any  # DatabaseEntity or IndexedEntity
+    score: float  # reciprocal rank fusion score
+    vector_rank: Optional[int]
+    vector_distance: Optional[float]
+    lexical_rank: Optional[int]
+    lexical_score: Optional[float]
+
+
+def vector_candidates(session, embedding, entity_type: Optional[str] = None, limit: int = 10) -> List[Tuple[Any, float]]:
+    """(entity, cosine_distance) nearest first, served in-process when the vector index is fresh"""
+    hits = search_vector_index(embedding, entity_type, limit)
+    if hits is not None:
+        return hits
+
+    distance = DatabaseEntity.description_vec.cosine_distance(embedding)
+    query = session.query(DatabaseEntity, distance.label("distance")).filter(DatabaseEntity.deleted_at.is_(None))
+    if entity_type is not None:
+        query = query.filter(DatabaseEntity.type == entity_type)
+    return [(entity, float(d)) for entity, d in query.order_by(distance).limit(limit).all()]
+
+
+def keyword_candidates(session, query_text: str, entity_type: Optional[str] = None, limit: int = 10,
+                       max_terms: Optional[int] = None) -> List[Tuple[Any, Optional[float]]]:
+    """(entity, bm25_score) best first, or unscored LIKE matches when the BM25 index is unavailable"""
+    hits = search_bm25_index(query_text, entity_type, limit)
+    if hits is not None:
+        return hits
+
+    terms = query_text.split()[:max_terms]
+    if not terms:
+        return []
+    keyword_filter = or_(DatabaseEntity.description.contains(term) for term in terms)
+    if entity_type is not None:
+        keyword_filter = and_(DatabaseEntity.type == entity_type, keyword_filter)
+    rows = session.query(DatabaseEntity).filter(
+        DatabaseEntity.deleted_at.is_(None), keyword_filter
+    ).order_by(DatabaseEntity.id).limit(limit).all()
+    return [(entity, None) for entity in rows]
+
+
+def reciprocal_rank_fusion(vector_hits, lexical_hits, limit: int, k: int = RRF_K) -> List[HybridHit]:
+    """Fuse two ranked lists with RRF: score = sum(1 / (k + rank)) over the lists an entity appears in"""
+    fused: Dict[int, dict] = {}
+    for rank, (entity, distance) in enumerate(vector_hits, start=1):
+        entry = fused.setdefault(entity.id, {"entity": entity, "score": 0.0})
+        entry.update(score=entry["score"] + 1.0 / (k + rank), vector_rank=rank, vector_distance=distance)
+    for rank, (entity, score) in enumerate(lexical_hits, start=1):
+        entry = fused.setdefault(entity.id, {"entity": entity, "score": 0.0})
+        entry.update(score=entry["score"] + 1.0 / (k + rank), lexical_rank=rank, lexical_score=score)
+
+    # Ties break on entity id so the output order is deterministic
+    ranked = sorted(fused.items(), key=lambda item: (-item[1]["score"], item[0]))[:limit]
+    return [
+        HybridHit(
+            entity=entry["entity"],
+            score=entry["score"],
+            vector_rank=entry.get("vector_rank"),
+            vector_distance=entry.get("vector_distance"),
+            lexical_rank=entry.get("lexical_rank"),
+            lexical_score=entry.get("lexical_score")
+        )
+        for _, entry in ranked
+    ]
+
+
+def _vector_branch(query_text, embedding, entity_type, candidates):
+    if embedding is None:
+        embedding = get_query_embedding(query_text)
+    with SessionLocal() as session:
+        return vector_candidates(session, embedding, entity_type, candidates)
+
+
+def _lexical_branch(query_text, entity_type, candidates, max_terms):
+    with SessionLocal() as session:
+        return keyword_candidates(session, query_text, entity_type, candidates, max_terms)
+
+
+def hybrid_search(query_text: str, entity_type: Optional[str] = None, limit: int = 10,
+                  candidates: int = HYBRID_CANDIDATES, embedding=None, max_terms: Optional[int] = None) -> List[HybridHit]:
+    """Run vector and lexical retrieval concurrently and return the RRF-fused top `limit`"""
+    vector_future = _retrieval_executor.submit(_vector_branch, query_text, embedding, entity_type, candidates)
+    lexical_future = _retrieval_executor.submit(_lexical_branch, query_text, entity_type, candidates, max_terms)
+    return reciprocal_rank_fusion(vector_future.result(), lexical_future.result(), limit)
@@ -0,0 +1,82 @@
+from sqlalchemy import event
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseEntity )
+from typing import Any, Callable, List, NamedTuple, Optional
+
+
+class IndexedEntity(NamedTuple):
+    """Lightweight stand-in for a DatabaseEntity row served from an in-process index"""
+    id: int
+    entity_id: str
+    name: Optional[str]
+    type: Optional[str]
+    description: Optional[str]
+
+
+class EntitySnapshot(NamedTuple):
+    id: int
+    entity_id: str
+    name: Optional[str]
+    type: Optional[str]
+    description: Optional[str]
+    description_vec: Any
+
+
+# Callbacks receive (upserted_snapshots, deleted_entity_ids) once a transaction commits
+_entity_listeners: List[Callable] = []
+
+
+def on_entity_commit(listener: Callable):
+    """Register a callback that keeps an in-process index in step with the entities table"""
+    _entity_listeners.append(listener)
+    return listener
+
+
+def to_indexed_entity(snapshot) -> IndexedEntity:
+    return IndexedEntity(snapshot.id, snapshot.entity_id, snapshot.name, snapshot.type, snapshot.description)
+
+
+def snapshot_entity(entity: DatabaseEntity) -> EntitySnapshot:
+    return EntitySnapshot(
+        id=entity.id,
+        entity_id=entity.entity_id,
+        name=entity.name,
+        type=entity.type,
+        description=entity.description,
+        description_vec=entity.description_vec
+    )
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_entity_changes(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here, but ids are assigned.
+    # Snapshot now: attributes are expired after commit and no SQL can be emitted then.
+    pending = session.info.setdefault("entity_changes", {"upserted": {}, "deleted": set()})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, DatabaseEntity) and obj.deleted_at is None:
+            pending["upserted"][obj.id] = snapshot_entity(obj)
+            pending["deleted"].discard(obj.id)
+    tombstoned = [obj for obj in session.dirty if isinstance(obj, DatabaseEntity) and obj.deleted_at is not None]
+    for obj in list(session.deleted) + tombstoned:
+        if isinstance(obj, DatabaseEntity):
+            pending["upserted"].pop(obj.id, None)
+            pending["deleted"].add(obj.id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_entity_changes(session):
+    pending = session.info.pop("entity_changes", None)
+    if not pending:
+        return
+    upserted = list(pending["upserted"].values())
+    deleted = list(pending["deleted"])
+    for listener in _entity_listeners:
+        try:
+            listener(upserted, deleted)
+        except Exception as e:
+            print(f"Index listener {listener.__name__} failed: {e}")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_entity_changes(session):
+    session.info.pop("entity_changes", None)
@@ -0,0 +1,483 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from typing import Dict, Iterator, List, Optional
+
+load_dotenv()
+
+# Budget for one LLM call when the caller does not pass its own deadline
+INFERENCE_DEADLINE_SECONDS = float(os.getenv("INFERENCE_DEADLINE_SECONDS", "45"))
+INFERENCE_HEDGE_ENABLED = os.getenv("INFERENCE_HEDGE_ENABLED", "true").lower() == "true"
+# A duplicate request goes out once the first has been running longer than this quantile of recent latencies
+INFERENCE_HEDGE_QUANTILE = float(os.getenv("INFERENCE_HEDGE_QUANTILE", "0.95"))
+INFERENCE_HEDGE_MIN_DELAY = float(os.getenv("INFERENCE_HEDGE_MIN_DELAY", "0.25"))
+# Used until a backend has enough samples for the prompt type to estimate the quantile
+INFERENCE_HEDGE_DEFAULT_DELAY = float(os.getenv("INFERENCE_HEDGE_DEFAULT_DELAY", "3"))
+INFERENCE_HEDGE_MIN_SAMPLES = int(os.getenv("INFERENCE_HEDGE_MIN_SAMPLES", "20"))
+INFERENCE_LATENCY_WINDOW = int(os.getenv("INFERENCE_LATENCY_WINDOW", "200"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+INFERENCE_ROUTER_MAX_WORKERS = int(os.getenv("INFERENCE_ROUTER_MAX_WORKERS", "32"))
+# Rounds of retries over the backends that failed retryably, with full-jitter backoff, inside the call's deadline
+INFERENCE_MAX_RETRIES = int(os.getenv("INFERENCE_MAX_RETRIES", "2"))
+INFERENCE_RETRY_BACKOFF_BASE = float(os.getenv("INFERENCE_RETRY_BACKOFF_BASE", "0.5"))
+INFERENCE_RETRY_BACKOFF_MAX = float(os.getenv("INFERENCE_RETRY_BACKOFF_MAX", "4"))
+
+_THINK_OPEN, _THINK_CLOSE = "<think>", "</think>"
+_THINK_BLOCK = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest proper prefix of tag that text ends with"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+def strip_reasoning_stream(tokens: Iterator[str]) -> Iterator[str]:
+    """Drop <think>...</think> blocks (and the whitespace after them) from a token stream, even when tags span tokens"""
+    pending = ""
+    thinking = skip_space = False
+    for token in tokens:
+        pending += token
+        while pending:
+            if thinking:
+                end = pending.find(_THINK_CLOSE)
+                if end < 0:
+                    pending = pending[-(len(_THINK_CLOSE) - 1):]
+                    break
+                pending = pending[end + len(_THINK_CLOSE):]
+                thinking, skip_space = False, True
+                continue
+            if skip_space:
+                pending = pending.lstrip()
+                if not pending:
+                    break
+                skip_space = False
+            start = pending.find(_THINK_OPEN)
+            if start >= 0:
+                if start:
+                    yield pending[:start]
+                pending = pending[start + len(_THINK_OPEN):]
+                thinking = True
+                continue
+            # Hold back what could be the start of an opening tag
+            keep = _partial_tag_length(pending, _THINK_OPEN)
+            if len(pending) > keep:
+                yield pending[:len(pending) - keep]
+            pending = pending[len(pending) - keep:]
+            break
+    if pending and not thinking:
+        yield pending
+
+
+class InferenceUnavailable(Exception):
+    """Every backend failed or is behind an open circuit"""
+
+
+class InferenceDeadlineExceeded(TimeoutError):
+    """No backend answered before the call's deadline"""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets one probe call through after `reset_seconds`"""
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"  # closed | open | half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False  # open, or a half-open probe is already in flight
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Inference circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def cancel_probe(self):
+        """Hand back a half-open probe whose request was never sent, so the next call can probe instead"""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+
+class LatencyTracker:
+    """Recent successful call latencies (seconds) per prompt type"""
+    def __init__(self, window: int = INFERENCE_LATENCY_WINDOW):
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, prompt_type: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(prompt_type, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, prompt_type: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.samples.get(prompt_type, ()))
+        if len(samples) < min_samples or not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    def summary(self) -> dict:
+        return {
+            prompt_type: {"samples": len(self.samples.get(prompt_type, ())),
+                          "p50_ms": self.quantile(prompt_type, 0.5) * 1000,
+                          "p95_ms": self.quantile(prompt_type, 0.95) * 1000}
+            for prompt_type in list(self.samples)
+        }
+
+
+def _longest(current: Optional[float], seconds: Optional[float]) -> Optional[float]:
+    if seconds is None:
+        return current
+    return seconds if current is None else max(current, seconds)
+
+
+class InferenceBackend:
+    """One place completions can come from. Subclasses implement chat and stream_chat."""
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+
+    def chat(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream_chat(self, prompt: str, timeout: float) -> Iterator[str]:
+        yield self.chat(prompt, timeout)
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether trying this backend again could succeed"""
+        return True
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds the backend asked to wait before the next attempt, if it said"""
+        return None
+
+    def stats(self) -> dict:
+        return {"circuit": self.breaker.state, "consecutive_failures": self.breaker.failures,
+                "latency": self.latency.summary()}
+
+
+class ChatCompletionsBackend(InferenceBackend):
+    """Any OpenAI-compatible endpoint behind an InferenceClient: the hosted API, or Ollama's /v1"""
+    def __init__(self, name: str, client, connect_timeout: float = 5, strip_reasoning: bool = False):
+        super().__init__(name)
+        self.client = client
+        self.connect_timeout = connect_timeout
+        # Reasoning models served by Ollama (deepseek-r1) prefix their answer with a <think> block
+        self.strip_reasoning = strip_reasoning
+
+    def _timeout(self, timeout: float):
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def chat(self, prompt: str, timeout: float) -> str:
+        output = self.client.chat(prompt, timeout=self._timeout(timeout), deadline_seconds=timeout)
+        return _THINK_BLOCK.sub("", output) if self.strip_reasoning else output
+
+    def stream_chat(self, prompt: str, timeout: float) -> Iterator[str]:
+        tokens = self.client.stream_chat(prompt, timeout=self._timeout(timeout), deadline_seconds=timeout)
+        yield from strip_reasoning_stream(tokens) if self.strip_reasoning else tokens
+
+    def is_retryable(self, error: Exception) -> bool:
+        return self.client.is_retryable(error)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        return self.client.retry_after(error)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "model": self.client.model, "http": dict(self.client.metrics)}
+
+
+class StubBackend(InferenceBackend):
+    """Deterministic canned completions from benchmarks/stub_llm_server, with no network involved"""
+    def __init__(self, name: str = "stub"):
+        super().__init__(name)
+        from benchmarks.stub_llm_server import stub_completion
+        self.completion = stub_completion
+
+    def chat(self, prompt: str, timeout: float) -> str:
+        return self.completion(prompt)
+
+    def stream_chat(self, prompt: str, timeout: float) -> Iterator[str]:
+        for index, word in enumerate(self.completion(prompt).split(" ")):
+            yield word if index == 0 else " " + word
+
+
+class InferenceRouter:
+    """Routes each LLM call across an ordered list of backends.
+
+    A call goes to the first backend whose circuit allows it. If it has not answered
+    after the backend's recent p95 latency for that prompt type, a hedged duplicate goes
+    to the next allowed backend (or the same one when it is the only one) and whichever
+    answers first wins. Failures fail over to the next backend; once every backend has
+    been tried, those that failed retryably are tried again after a backoff (no shorter
+    than any Retry-After they sent), up to max_retries rounds and never past the call's deadline. Backends do not retry
+    internally, so every failure reaches the circuit breakers and failover.
+    Requests that lose a hedge cannot be cancelled mid-flight; their results are dropped.
+    Streams are not hedged, and only fail over or retry before their first token.
+
+    With a scheduler, every upstream request takes its own slot and rate token:
+    the lead, each failover and retry, and each stream attempt wait for one at the
+    call's priority, while a hedge is only sent when a slot is free at that moment.
+    """
+    def __init__(self, backends: List[InferenceBackend], hedge_enabled: bool = INFERENCE_HEDGE_ENABLED,
+                 hedge_quantile: float = INFERENCE_HEDGE_QUANTILE, max_workers: int = INFERENCE_ROUTER_MAX_WORKERS,
+                 max_retries: int = INFERENCE_MAX_RETRIES, scheduler=None):
+        if not backends:
+            raise ValueError("InferenceRouter needs at least one backend")
+        self.backends = backends
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.max_retries = max_retries
+        # InferenceScheduler; passed in because the scheduler module builds on this one
+        self.scheduler = scheduler
+        self.metrics = {"calls": 0, "hedges": 0, "hedges_skipped": 0, "hedge_wins": 0, "failovers": 0, "retries": 0,
+                        "deadline_exceeded": 0, "unavailable": 0}
+        self._metrics_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+    def _count(self, key: str):
+        with self._metrics_lock:
+            self.metrics[key] += 1
+
+    def hedge_delay(self, backend: InferenceBackend, prompt_type: str) -> float:
+        observed = backend.latency.quantile(prompt_type, self.hedge_quantile, INFERENCE_HEDGE_MIN_SAMPLES)
+        return max(INFERENCE_HEDGE_MIN_DELAY, observed if observed is not None else INFERENCE_HEDGE_DEFAULT_DELAY)
+
+    def _retry_round(self, retries: int, retryable: List[InferenceBackend], deadline: float,
+                     retry_after: Optional[float] = None) -> bool:
+        """Back off before another round over the retryable backends; False when out of retries or time.
+
+        The backoff is at least the longest Retry-After the round's failures asked for.
+        """
+        if not retryable or retries >= self.max_retries:
+            return False
+        delay = random.uniform(0, min(INFERENCE_RETRY_BACKOFF_MAX, INFERENCE_RETRY_BACKOFF_BASE * (2 ** retries)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        self._count("retries")
+        return True
+
+    def _admit(self, backend: InferenceBackend, priority: Optional[int], deadline: float):
+        """Wait for a scheduler slot for one upstream request to backend"""
+        if self.scheduler is None:
+            return
+        try:
+            self.scheduler.acquire(priority, deadline - time.monotonic())
+        except Exception:
+            backend.breaker.cancel_probe()  # shed or out of time: the request never went out
+            raise
+
+    def _attempt(self, backend: InferenceBackend, prompt: str, prompt_type: str, deadline: float) -> str:
+        # Runs holding the slot taken by _admit, which is released once the request ends, even if nobody waits for it
+        start = time.monotonic()
+        try:
+            output = backend.chat(prompt, deadline - start)
+        except InferenceDeadlineExceeded:
+            backend.breaker.cancel_probe()  # out of time before the request went out; says nothing about the backend
+            raise
+        except Exception:
+            backend.breaker.record_failure()
+            raise
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+        backend.breaker.record_success()
+        backend.latency.record(prompt_type, time.monotonic() - start)
+        return output
+
+    def chat(self, prompt: str, prompt_type: str = "default", deadline_seconds: Optional[float] = None,
+             priority: Optional[int] = None) -> str:
+        self._count("calls")
+        deadline = time.monotonic() + (deadline_seconds or INFERENCE_DEADLINE_SECONDS)
+        remaining = list(self.backends)
+
+        def next_backend() -> Optional[InferenceBackend]:
+            # Circuits are checked only when a backend is about to be used, so a half-open probe is never wasted
+            while remaining:
+                backend = remaining.pop(0)
+                if backend.breaker.allow():
+                    return backend
+            return None
+
+        pending = {}
+        errors = []
+        retryable: List[InferenceBackend] = []  # backends worth another round once every backend has been tried
+        retry_after: Optional[float] = None  # longest wait those backends asked for
+        retries = 0
+
+        def launch(backend):
+            # Waiting for the slot happens here, on the caller's thread, so it is ordered by the scheduler's priorities
+            self._admit(backend, priority, deadline)
+            future = self._executor.submit(self._attempt, backend, prompt, prompt_type, deadline)
+            pending[future] = backend
+            return future
+
+        lead = next_backend()
+        if lead is None:
+            self._count("unavailable")
+            raise InferenceUnavailable("Every inference backend has an open circuit")
+        lead_future = launch(lead)
+        lead_started = time.monotonic()
+        hedged = False
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            hedge_at = lead_started + self.hedge_delay(lead, prompt_type)
+            can_hedge = self.hedge_enabled and not hedged
+            timeout = min(deadline, hedge_at) - now if can_hedge else deadline - now
+            done, _ = wait(list(pending), timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    output = future.result()
+                except InferenceDeadlineExceeded:
+                    self._count("deadline_exceeded")
+                    raise  # the call's own deadline is spent; no other backend or retry can help
+                except Exception as e:
+                    errors.append(f"{backend.name}: {e}")
+                    if backend.is_retryable(e):
+                        if backend not in retryable:
+                            retryable.append(backend)
+                        retry_after = _longest(retry_after, backend.retry_after(e))
+                    continue
+                if future is not lead_future:
+                    self._count("hedge_wins")
+                return output
+
+            if not done and can_hedge and time.monotonic() >= hedge_at:
+                hedged = True
+                backend = next_backend() or lead
+                # A hedge only goes out on spare capacity; it never queues behind other calls
+                if self.scheduler is None or self.scheduler.try_acquire(priority):
+                    self._count("hedges")
+                    future = self._executor.submit(self._attempt, backend, prompt, prompt_type, deadline)
+                    pending[future] = backend
+                else:
+                    self._count("hedges_skipped")
+                    if backend is not lead:
+                        backend.breaker.cancel_probe()
+                        remaining.insert(0, backend)
+            elif not pending:
+                backend = next_backend()
+                if backend is None:
+                    if not self._retry_round(retries, retryable, deadline, retry_after):
+                        break
+                    retries += 1
+                    remaining.extend(retryable)
+                    retryable, retry_after = [], None
+                    backend = next_backend()
+                    if backend is None:
+                        break
+                else:
+                    self._count("failovers")
+                lead, hedged = backend, False
+                lead_future = launch(lead)
+                lead_started = time.monotonic()
+
+        if pending or time.monotonic() >= deadline:
+            self._count("deadline_exceeded")
+            raise InferenceDeadlineExceeded(
+                f"No inference backend answered within {deadline_seconds or INFERENCE_DEADLINE_SECONDS:.1f}s"
+            )
+        self._count("unavailable")
+        raise InferenceUnavailable("; ".join(errors) or "No inference backend available")
+
+    def stream_chat(self, prompt: str, prompt_type: str = "default",
+                    deadline_seconds: Optional[float] = None, priority: Optional[int] = None) -> Iterator[str]:
+        self._count("calls")
+        deadline = time.monotonic() + (deadline_seconds or INFERENCE_DEADLINE_SECONDS)
+        errors = []
+        candidates = list(self.backends)
+        retries = 0
+        while True:
+            retryable = []
+            retry_after = None
+            failed_this_round = False
+            for backend in candidates:
+                if time.monotonic() >= deadline:
+                    self._count("deadline_exceeded")
+                    raise InferenceDeadlineExceeded("Inference stream did not start before its deadline")
+                if not backend.breaker.allow():
+                    continue
+                if failed_this_round:
+                    self._count("failovers")
+                # Each attempt holds its own slot until the stream is drained or abandoned
+                self._admit(backend, priority, deadline)
+                start = time.monotonic()
+                started = False
+                try:
+                    for token in backend.stream_chat(prompt, deadline - start):
+                        if not started:
+                            started = True
+                            backend.breaker.record_success()
+                        yield token
+                except GeneratorExit:
+                    if not started:
+                        backend.breaker.cancel_probe()  # closed before the backend said anything either way
+                    raise
+                except InferenceDeadlineExceeded:
+                    if not started:
+                        backend.breaker.cancel_probe()  # never sent, so the backend is not to blame
+                    self._count("deadline_exceeded")
+                    raise
+                except Exception as e:
+                    if started:
+                        raise  # the caller already holds part of this backend's reply
+                    backend.breaker.record_failure()
+                    errors.append(f"{backend.name}: {e}")
+                    failed_this_round = True
+                    if backend.is_retryable(e):
+                        retryable.append(backend)
+                        retry_after = _longest(retry_after, backend.retry_after(e))
+                    continue
+                finally:
+                    if self.scheduler is not None:
+                        self.scheduler.release()
+                if not started:
+                    # An empty reply (say, only a stripped <think> block) is still an answer and resolves a probe
+                    backend.breaker.record_success()
+                backend.latency.record(prompt_type, time.monotonic() - start)
+                return
+            if not self._retry_round(retries, retryable, deadline, retry_after):
+                break
+            retries += 1
+            candidates = retryable
+        self._count("unavailable")
+        raise InferenceUnavailable("; ".join(errors) or "Every inference backend has an open circuit")
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        return {**metrics, "backends": {backend.name: backend.stats() for backend in self.backends}}
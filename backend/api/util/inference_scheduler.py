@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .inference_router import ( InferenceDeadlineExceeded, LatencyTracker )
+from typing import Dict, Optional
+
+load_dotenv()
+
+# Priority classes; lower runs first
+CLIENT_AGENT = 0
+COACH = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {CLIENT_AGENT: "client_agent", COACH: "coach", BACKGROUND: "background"}
+PROMPT_PRIORITIES = {
+    "client_agent": CLIENT_AGENT,
+    "classification": COACH, "behavioral": COACH, "risk": COACH, "analysis": COACH,
+}
+
+# Upstream LLM calls in flight across the whole process
+INFERENCE_MAX_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "8"))
+# Sustained request rate and burst allowed upstream; a rate of 0 disables the limit
+INFERENCE_RATE_PER_SECOND = float(os.getenv("INFERENCE_RATE_PER_SECOND", "10"))
+INFERENCE_RATE_BURST = int(os.getenv("INFERENCE_RATE_BURST", "20"))
+# Calls already waiting at or above a class's priority before a new call of that class is shed
+INFERENCE_SHED_DEPTH = {
+    CLIENT_AGENT: int(os.getenv("INFERENCE_CLIENT_SHED_DEPTH", "256")),
+    COACH: int(os.getenv("INFERENCE_COACH_SHED_DEPTH", "16")),
+    BACKGROUND: int(os.getenv("INFERENCE_BACKGROUND_SHED_DEPTH", "8")),
+}
+
+SHED_PREFIX = "inference shed"
+
+
+class InferenceOverloaded(Exception):
+    """A call was shed because too many calls of equal or higher priority are already waiting"""
+    def __init__(self, priority: int, depth: int):
+        super().__init__(f"{SHED_PREFIX}: {depth} {PRIORITY_NAMES.get(priority, priority)}-or-higher calls queued")
+
+
+def is_shed_error(error: Optional[str]) -> bool:
+    return bool(error) and error.startswith(SHED_PREFIX)
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `burst`; take() returns 0 on success or the seconds until a token"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class InferenceScheduler:
+    """Process-wide admission control for upstream LLM requests.
+
+    A shared pool of `max_concurrency` slots, handed out strictly by priority class
+    (client agent, then coach, then background) and FIFO within a class, with a token
+    bucket capping the rate at which requests start. The router takes one slot per
+    upstream request, so failovers, retries and hedges are bounded too, and a request
+    abandoned by its caller keeps its slot until it actually finishes. A new request is
+    shed with InferenceOverloaded when the requests already waiting at or above its
+    priority reach that class's shed depth.
+    """
+    def __init__(self, max_concurrency: int = INFERENCE_MAX_CONCURRENCY, rate_per_second: float = INFERENCE_RATE_PER_SECOND,
+                 burst: int = INFERENCE_RATE_BURST, shed_depth: Optional[Dict[int, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.shed_depth = shed_depth if shed_depth is not None else dict(INFERENCE_SHED_DEPTH)
+        self.in_flight = 0
+        self.waiting = []  # heap of (priority, sequence)
+        self.wait_times = LatencyTracker()
+        self.metrics = {name: {"admitted": 0, "shed": 0, "timed_out": 0} for name in PRIORITY_NAMES.values()}
+        self.peak_queue_depth = 0
+        self.rate_limited = 0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _depth_at_or_above(self, priority: int) -> int:
+        return sum(1 for waiting_priority, _ in self.waiting if waiting_priority <= priority)
+
+    def acquire(self, priority: Optional[int] = BACKGROUND, timeout: Optional[float] = None):
+        """Wait for a slot and a rate token; pair with release()"""
+        priority = BACKGROUND if priority is None else priority
+        name = PRIORITY_NAMES[priority]
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            depth = self._depth_at_or_above(priority)
+            if depth >= self.shed_depth.get(priority, 0):
+                self.metrics[name]["shed"] += 1
+                raise InferenceOverloaded(priority, depth)
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self.waiting, ticket)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self.waiting))
+            try:
+                while True:
+                    wait = None
+                    if self.waiting[0] == ticket and self.in_flight < self.max_concurrency:
+                        wait = self.bucket.take()
+                        if wait == 0:
+                            break
+                        self.rate_limited += 1
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.metrics[name]["timed_out"] += 1
+                        raise InferenceDeadlineExceeded(f"{name} call still queued after {timeout:g}s")
+                    waits = [w for w in (wait, remaining) if w]
+                    self._cond.wait(min(waits) if waits else None)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self._cond.notify_all()
+            self.in_flight += 1
+            self.metrics[name]["admitted"] += 1
+        self.wait_times.record(name, time.monotonic() - start)
+
+    def try_acquire(self, priority: Optional[int] = BACKGROUND) -> bool:
+        """Take a slot only if one is free now and nothing at or above this priority is waiting"""
+        priority = BACKGROUND if priority is None else priority
+        with self._cond:
+            if self.in_flight >= self.max_concurrency or self._depth_at_or_above(priority) or self.bucket.take():
+                return False
+            self.in_flight += 1
+            self.metrics[PRIORITY_NAMES[priority]]["admitted"] += 1
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = BACKGROUND, timeout: Optional[float] = None):
+        """Hold one of the shared slots for the duration of the block"""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def run(self, fn, *args, priority: int = BACKGROUND, timeout: Optional[float] = None, **kwargs):
+        with self.slot(priority, timeout):
+            return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = {name: sum(1 for p, _ in self.waiting if p == priority) for priority, name in PRIORITY_NAMES.items()}
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "rate_limited_waits": self.rate_limited,
+                "by_priority": {name: dict(counters) for name, counters in self.metrics.items()},
+                "queue_wait": self.wait_times.summary(),
+            }
+
+
+def priority_for(prompt_type: str) -> int:
+    return PROMPT_PRIORITIES.get(prompt_type, BACKGROUND)
+
+
+inference_scheduler = InferenceScheduler()
@@ -1,21 +1,194 @@
+import json
+import threading
+import time
 import requests
 import os
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from .response_cache import ( RESPONSE_CACHE_ENABLED, response_cache )
+from .inference_router import (
+    INFERENCE_DEADLINE_SECONDS, ChatCompletionsBackend, InferenceDeadlineExceeded, InferenceRouter, StubBackend
+)
+from .inference_scheduler import ( inference_scheduler, priority_for )
+from typing import Callable, Iterator, Optional
 load_dotenv()
 
+# Point LLM_BASE_URL at benchmarks/stub_llm_server.py (or set INFERENCE_BACKENDS=stub) to run without the hosted API
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.moonshot.ai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "moonshot-v1-32k")
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "45"))
+# Budget for one request when the caller does not pass its own deadline
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "60"))
+# Connections kept open per host; callers beyond this wait for a free connection instead of opening more
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", "16"))
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "deepseek-r1:latest")
+# Backends in failover order: remote (LLM_BASE_URL), ollama (OLLAMA_CHAT_MODEL) and stub (canned, deterministic)
+INFERENCE_BACKENDS = os.getenv("INFERENCE_BACKENDS", "remote,ollama")
 
-def get_llm_output(prompt: str) -> str:
-    response = requests.post(
-        "https://api.moonshot.ai/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {os.getenv('KIMI_API_KEY')}"
-        },
-        json={
-            "model": "moonshot-v1-32k",
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class InferenceClient:
+    """Long-lived chat-completions client over one pooled keep-alive requests.Session.
+
+    Sends each request once. Retrying is left to the router, which sees every failure,
+    can fail over, and honours the Retry-After of a 429/503 when it backs off.
+    """
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: Optional[str] = None, model: str = LLM_MODEL,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 pool_maxsize: int = LLM_POOL_MAXSIZE):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("LLM_API_KEY", os.getenv("KIMI_API_KEY", ""))
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if self.api_key:
+            self.session.headers["Authorization"] = f"Bearer {self.api_key}"
+        self.metrics = {"requests": 0, "failures": 0}
+        self._metrics_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._metrics_lock:
+            self.metrics[key] += 1
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Connection errors and 429/5xx are worth another attempt; a read timeout never is,
+        as the server may already be generating and a POST is not idempotent"""
+        if isinstance(error, requests.ReadTimeout):
+            return False
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in RETRY_STATUSES
+        return isinstance(error, requests.ConnectionError)
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        """Seconds the server asked callers to wait (Retry-After), if it said"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return float(retry_after)
+        return None
+
+    def post(self, path: str, payload: dict, timeout=None, stream: bool = False,
+             deadline_seconds: Optional[float] = None) -> requests.Response:
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout, read_timeout = self.timeout[0], timeout or self.timeout[1]
+        remaining = LLM_REQUEST_DEADLINE if deadline_seconds is None else deadline_seconds
+        if remaining <= 0:
+            # Spent before sending, say waiting for a scheduler slot: not the server's fault
+            raise InferenceDeadlineExceeded(f"No time left to send a request to {url}")
+        self._count("requests")
+        try:
+            response = self.session.post(url, json=payload, stream=stream,
+                                         timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)))
+            response.raise_for_status()  # Raise an exception for bad status codes
+        except requests.RequestException:
+            self._count("failures")
+            raise
+        return response
+
+    def stream_chat(self, prompt: str, timeout=None, deadline_seconds: Optional[float] = None) -> Iterator[str]:
+        """Yield completion tokens as the server sends them (OpenAI-style server-sent events).
+
+        A failure after tokens have been yielded is raised to the caller, which already
+        holds a partial reply; the router only retries streams before their first token.
+        """
+        response = self.post("chat/completions", {
+            "model": self.model,
+            "stream": True,
+            "messages": [
+                {"role": "system", "content": prompt}
+            ]
+        }, timeout=timeout, stream=True, deadline_seconds=deadline_seconds)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    yield token
+
+    def chat(self, prompt: str, timeout=None, deadline_seconds: Optional[float] = None) -> str:
+        response = self.post("chat/completions", {
+            "model": self.model,
             "messages": [
                 {"role": "system", "content": prompt}
             ]
-        }
-    )
-    response.raise_for_status()  # Raise an exception for bad status codes
-    return response.json()["choices"][0]["message"]["content"]
+        }, timeout=timeout, deadline_seconds=deadline_seconds)
+        return response.json()["choices"][0]["message"]["content"]
+
+
+# Retries belong to the router, where each failure reaches the circuit breaker and can fail over
+inference_client = InferenceClient()
+
+
+def build_backend(name: str):
+    if name == "remote":
+        return ChatCompletionsBackend("remote", inference_client, LLM_CONNECT_TIMEOUT)
+    if name == "ollama":
+        client = InferenceClient(base_url=f"{OLLAMA_BASE_URL.rstrip('/')}/v1", api_key="", model=OLLAMA_CHAT_MODEL)
+        return ChatCompletionsBackend("ollama", client, LLM_CONNECT_TIMEOUT, strip_reasoning=True)
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"Unknown inference backend {name!r}; expected remote, ollama or stub")
+
+
+inference_router = InferenceRouter(
+    [build_backend(name.strip()) for name in INFERENCE_BACKENDS.split(",") if name.strip()],
+    scheduler=inference_scheduler
+)
+
+
+def get_llm_output(prompt: str, prompt_type: str = "default", semantic_text: Optional[str] = None,
+                   deadline_seconds: Optional[float] = None, priority: Optional[int] = None,
+                   semantic_scope: Optional[str] = None, on_upstream: Optional[Callable[[str], None]] = None) -> str:
+    """Chat completion for prompt; repeated (or, for semantic prompt types, similar) prompts are served from the response cache.
+
+    Each upstream request of a cache miss waits for a scheduler slot at the prompt type's priority;
+    the deadline covers the waits, retries and requests together.
+    on_upstream receives the output only when it came from a backend rather than the cache.
+    """
+    budget = deadline_seconds or INFERENCE_DEADLINE_SECONDS
+    priority = priority_for(prompt_type) if priority is None else priority
+
+    def call(text):
+        output = inference_router.chat(text, prompt_type, budget, priority)
+        if on_upstream is not None:
+            on_upstream(output)
+        return output
+
+    if not RESPONSE_CACHE_ENABLED:
+        return call(prompt)
+    return response_cache.get_or_call(prompt, call, prompt_type, semantic_text, semantic_scope)
+
+
+def stream_llm_output(prompt: str, prompt_type: str = "default", deadline_seconds: Optional[float] = None,
+                      priority: Optional[int] = None) -> Iterator[str]:
+    if RESPONSE_CACHE_ENABLED:
+        cached = response_cache.get(prompt, prompt_type)
+        if cached is not None:
+            yield cached
+            return
+    budget = deadline_seconds or INFERENCE_DEADLINE_SECONDS
+    priority = priority_for(prompt_type) if priority is None else priority
+    tokens = []
+    for token in inference_router.stream_chat(prompt, prompt_type, budget, priority):
+        tokens.append(token)
+        yield token
+    if RESPONSE_CACHE_ENABLED:
+        response_cache.put(prompt, "".join(tokens), prompt_type)
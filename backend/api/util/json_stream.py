@@ -0,0 +1,151 @@
+import json
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing bracket, leaving string contents alone"""
+    out = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json(text: str) -> str:
+    """Best-effort fix-up of LLM JSON: code fences, prose around the object, trailing commas, truncation"""
+    text = _FENCE.sub("", text.strip())
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return text
+    text = text[start:]
+
+    # Walk the text once to find where the top-level value ends, or what is left open if it never does
+    stack: List[str] = []
+    in_string = escaped = False
+    end = None
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+            if not stack:
+                end = i + 1
+                break
+    if end is not None:
+        text = text[:end]
+    else:
+        if in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",")
+        if text.endswith(":"):
+            text += " null"
+        text += "".join(reversed(stack))
+    return _strip_trailing_commas(text)
+
+
+def parse_json_tolerant(text: str) -> Any:
+    """json.loads, falling back to repair_json for the usual LLM formatting slips"""
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return json.loads(repair_json(text or ""))
+
+
+class IncrementalObjectParser:
+    """Scans a streamed JSON object and reports each top-level member once its value is complete.
+
+    feed() takes arbitrary chunks; any text before the opening brace (a code fence or
+    prose) is skipped. Members are parsed with parse_json_tolerant, so a trailing comma
+    inside a section does not lose it. finish() flushes a member cut off by the end of
+    the stream after repairing it.
+    """
+    def __init__(self, on_member: Optional[Callable[[str, Any], None]] = None):
+        self.on_member = on_member
+        self.members: dict = {}
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start: Optional[int] = None
+        self._done = False
+
+    def _emit(self, raw: str):
+        raw = raw.strip().rstrip(",")
+        if not raw:
+            return
+        try:
+            member = parse_json_tolerant("{" + raw + "}")
+        except json.JSONDecodeError:
+            return
+        for key, value in member.items():
+            if key not in self.members:
+                self.members[key] = value
+                if self.on_member is not None:
+                    self.on_member(key, value)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        before = set(self.members)
+        self._buffer += chunk
+        while self._pos < len(self._buffer) and not self._done:
+            char = self._buffer[self._pos]
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(self._buffer[self._member_start:self._pos])
+                    self._done = True
+            elif char == "," and self._depth == 1:
+                self._emit(self._buffer[self._member_start:self._pos])
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return [(key, self.members[key]) for key in self.members if key not in before]
+
+    def finish(self) -> dict:
+        if self._started and not self._done and self._member_start is not None:
+            self._emit(repair_json("{" + self._buffer[self._member_start:])[1:-1])
+            self._done = True
+        return self.members
@@ -13,25 +13,42 @@ from sqlalchemy import (
     or_,
     and_,
     inspect,
-    func
+    func,
+    Index,
+    Float
 )
 from config.tidb_config import (
     engine, Base, SessionLocal
 )
+from sqlalchemy.dialects.mysql import LONGBLOB
 from tidb_vector.sqlalchemy import VectorType
 from sqlalchemy.orm import relationship
 import ollama
+import os
+from config.migrations import ( EMBEDDING_DIM )
+from .embedding_cache import ( cached_embedding )
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
 
 class DatabaseEntity(Base):
     __tablename__ = "entities"
     
     id = Column(Integer, primary_key=True)
-    entity_id = Column(String(4096), nullable=False)
-    name = Column(String(4096))
-    type = Column(String(4096))  # ClientProfile, Objection, Strategy, Technique, Outcome
+    entity_id = Column(String(255), nullable=False)
+    name = Column(String(1024))
+    type = Column(String(64))  # ClientProfile, Objection, Strategy, Technique, Outcome
     description = Column(Text)
-    description_vec = Column(VectorType())
+    description_vec = Column(VectorType(EMBEDDING_DIM))
     properties = Column(JSON)  # Additional properties as JSON
+    source_id = Column(String(255))  # profile_id of the sales record this entity came from
+    content_hash = Column(String(64))
+    deleted_at = Column(DateTime)  # tombstone set by incremental knowledge graph sync
+
+    __table_args__ = (
+        Index("idx_entities_entity_id", "entity_id"),
+        Index("idx_entities_type", "type", "deleted_at"),
+        Index("idx_entities_source_id", "source_id"),
+    )
 
 class DatabaseRelationship(Base):
     __tablename__ = "relationships"
@@ -39,9 +56,18 @@ class DatabaseRelationship(Base):
     id = Column(Integer, primary_key=True)
     source_entity_id = Column(Integer, ForeignKey("entities.id"))
     target_entity_id = Column(Integer, ForeignKey("entities.id"))
-    relationship_type = Column(String(4096))
+    relationship_type = Column(String(64))
     properties = Column(JSON)  # Additional properties as JSON
+    source_id = Column(String(255))
+    content_hash = Column(String(64))
+    deleted_at = Column(DateTime)
     
+    __table_args__ = (
+        Index("idx_relationships_source_type", "source_entity_id", "relationship_type"),
+        Index("idx_relationships_target_type", "target_entity_id", "relationship_type"),
+        Index("idx_relationships_source_id", "source_id"),
+    )
+
     source_entity = relationship("DatabaseEntity", foreign_keys=[source_entity_id])
     target_entity = relationship("DatabaseEntity", foreign_keys=[target_entity_id])
 
@@ -52,10 +78,79 @@ class DatabaseSession(Base):
     client_agent_context = Column(JSON, nullable=True) 
     round_count = Column(Integer, default=0)
     created_date = Column(DateTime, server_default=func.now())  
+    last_active_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_sessions_last_active", "last_active_at"),
+    )
+
+class DatabaseSessionTurn(Base):
+    __tablename__ = "session_turns"
+
+    id = Column(Integer, primary_key=True)
+    session_guid = Column(String(255), nullable=False)
+    turn_index = Column(Integer, nullable=False)
+    role = Column(String(32), nullable=False)
+    content = Column(Text)
+    created_date = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_session_turns_session", "session_guid", "turn_index", unique=True),
+    )
+
+class DatabaseSessionArchive(Base):
+    __tablename__ = "session_archive"
+
+    guid = Column(String(255), primary_key=True)
+    round_count = Column(Integer, default=0)
+    turn_count = Column(Integer, default=0)
+    summary = Column(Text)
+    payload = Column(LONGBLOB, nullable=False)  # zlib-compressed JSON: static context and retained turns
+    created_date = Column(DateTime)
+    last_active_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("idx_session_archive_archived_at", "archived_at"),
+    )
+
+class DatabaseClassificationLabel(Base):
+    __tablename__ = "classification_labels"
+
+    id = Column(Integer, primary_key=True)
+    salesman_message = Column(Text, nullable=False)
+    current_objection = Column(Text)
+    label = Column(String(16), nullable=False)  # minor | substantive, as returned by the LLM
+    llm_ms = Column(Float)  # latency of the LLM call that produced the label
+    created_date = Column(DateTime, server_default=func.now())
+
+class DatabaseSessionSeed(Base):
+    __tablename__ = "session_seeds"
+
+    client_profile_id = Column(String(255), primary_key=True)
+    graph_version = Column(Integer, nullable=False)
+    seed = Column(JSON, nullable=False)  # profile description, ordered and related objections
+    created_date = Column(DateTime, server_default=func.now())
+
+class DatabaseGraphVersion(Base):
+    __tablename__ = "kg_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+def get_graph_version(session) -> int:
+    """Version counter bumped by the knowledge graph builder after every build or sync"""
+    state = session.get(DatabaseGraphVersion, 1)
+    return state.version if state else 0
 
 def get_query_embedding(query: str):
     """
     Generate embedding using Ollama's nomic-embed-text model.
+    Repeated texts are served from the embedding cache, keyed by model and content hash.
     """
-    response = ollama.embeddings(model='nomic-embed-text', prompt=query)
+    return cached_embedding(EMBEDDING_MODEL, query, _embed_with_ollama)
+
+def _embed_with_ollama(query: str):
+    response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=query)
     return response['embedding']
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from .knowledge_graph import ( get_query_embedding )
+from typing import Callable, Dict, List, Optional
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+# Seconds a response stays valid, per prompt type; 0 disables caching for that type
+RESPONSE_CACHE_TTLS = os.getenv(
+    "RESPONSE_CACHE_TTLS", "client_agent=3600,classification=86400,behavioral=900,risk=900,analysis=900,default=600"
+)
+# Prompt types that may also be answered by a semantically similar earlier call
+RESPONSE_CACHE_SEMANTIC_TYPES = os.getenv("RESPONSE_CACHE_SEMANTIC_TYPES", "classification")
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.97"))
+RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES", "2048"))
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            prompt_type, seconds = item.split("=", 1)
+            ttls[prompt_type.strip()] = float(seconds)
+    return ttls
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt; indentation differences never miss the cache"""
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+def prompt_key(prompt_type: str, prompt: str) -> str:
+    return hashlib.sha256(f"{prompt_type}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class _SemanticTier:
+    """Normalized embeddings of recent semantic keys for one scope, in a preallocated ring scanned with one matrix product"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.keys: List[Optional[str]] = [None] * max_entries  # exact-tier key each row answers with
+        self.matrix: Optional[np.ndarray] = None
+        self.size = 0
+        self.next = 0
+
+    def add(self, vector: np.ndarray, key: str):
+        if self.matrix is None or self.matrix.shape[1] != vector.shape[0]:
+            # Allocated on first use, or again if the embedding model changed dimension
+            self.matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self.keys = [None] * self.max_entries
+            self.size = self.next = 0
+        self.matrix[self.next] = vector
+        self.keys[self.next] = key
+        self.next = (self.next + 1) % self.max_entries
+        self.size = min(self.size + 1, self.max_entries)
+
+    def nearest(self, vector: np.ndarray):
+        if self.size == 0 or self.matrix.shape[1] != vector.shape[0]:
+            return None, 0.0
+        scores = self.matrix[:self.size] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class ResponseCache:
+    """Two-tier cache of LLM responses.
+
+    The exact tier maps a hash of (prompt type, normalized prompt) to the response
+    and is an LRU bounded by entry count, with a TTL per prompt type. The semantic
+    tier, enabled per prompt type, embeds a caller-supplied semantic key (for a
+    classification, the salesman message) and reuses the response of the most
+    similar earlier key above the similarity threshold. Keys are only compared within
+    the same semantic scope (for a classification, the client's objection), since the
+    same message can deserve a different response in a different context.
+    """
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttls: Optional[Dict[str, float]] = None,
+                 semantic_types: Optional[List[str]] = None, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttls = ttls if ttls is not None else parse_ttls(RESPONSE_CACHE_TTLS)
+        self.semantic_types = set(semantic_types if semantic_types is not None else
+                                  [t.strip() for t in RESPONSE_CACHE_SEMANTIC_TYPES.split(",") if t.strip()])
+        self.similarity = similarity
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (prompt_type, response, expires_at)
+        self.semantic: Dict[tuple, _SemanticTier] = {}  # (prompt type, scope) -> tier
+        self.metrics: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, prompt_type: str) -> float:
+        return self.ttls.get(prompt_type, self.ttls.get("default", 0))
+
+    def _count(self, prompt_type: str, key: str):
+        counters = self.metrics.setdefault(prompt_type, {
+            "exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0
+        })
+        counters[key] += 1
+
+    def _lookup_locked(self, key: str, prompt_type: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            del self.entries[key]
+            self._count(prompt_type, "expired")
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def _semantic_vector(self, text: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(get_query_embedding(normalize_prompt(text)), dtype=np.float32)
+        except Exception as e:
+            print(f"Semantic response cache skipped: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, prompt: str, prompt_type: str = "default", semantic_text: Optional[str] = None,
+            semantic_scope: Optional[str] = None) -> Optional[str]:
+        if self.ttl(prompt_type) <= 0:
+            return None
+        key = prompt_key(prompt_type, prompt)
+        with self._lock:
+            response = self._lookup_locked(key, prompt_type)
+            if response is not None:
+                self._count(prompt_type, "exact_hits")
+                return response
+
+        if semantic_text and prompt_type in self.semantic_types:
+            vector = self._semantic_vector(semantic_text)
+            if vector is not None:
+                with self._lock:
+                    tier = self.semantic.get((prompt_type, normalize_prompt(semantic_scope or "")))
+                    match, score = tier.nearest(vector) if tier is not None else (None, 0.0)
+                    if match is not None and score >= self.similarity:
+                        response = self._lookup_locked(match, prompt_type)
+                        if response is not None:
+                            self._count(prompt_type, "semantic_hits")
+                            return response
+
+        with self._lock:
+            self._count(prompt_type, "misses")
+        return None
+
+    def put(self, prompt: str, response: str, prompt_type: str = "default", semantic_text: Optional[str] = None,
+            semantic_scope: Optional[str] = None):
+        ttl = self.ttl(prompt_type)
+        if ttl <= 0 or not response:
+            return
+        key = prompt_key(prompt_type, prompt)
+        vector = None
+        if semantic_text and prompt_type in self.semantic_types:
+            vector = self._semantic_vector(semantic_text)
+        with self._lock:
+            self.entries[key] = (prompt_type, response, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            self._count(prompt_type, "stores")
+            while len(self.entries) > self.max_entries:
+                _, (evicted_type, _, _) = self.entries.popitem(last=False)
+                self._count(evicted_type, "evictions")
+            if vector is not None:
+                # Rows pointing at evicted keys simply miss on lookup and age out of the tier
+                scope = (prompt_type, normalize_prompt(semantic_scope or ""))
+                self.semantic.setdefault(scope, _SemanticTier(RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES)).add(vector, key)
+
+    def get_or_call(self, prompt: str, call: Callable[[str], str], prompt_type: str = "default",
+                    semantic_text: Optional[str] = None, semantic_scope: Optional[str] = None) -> str:
+        response = self.get(prompt, prompt_type, semantic_text, semantic_scope)
+        if response is None:
+            response = call(prompt)
+            self.put(prompt, response, prompt_type, semantic_text, semantic_scope)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_type = {}
+            for prompt_type, counters in self.metrics.items():
+                lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+                hits = counters["exact_hits"] + counters["semantic_hits"]
+                by_type[prompt_type] = {**counters, "hit_rate": hits / lookups if lookups else 0.0}
+            return {"entries": len(self.entries), "by_type": by_type}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,283 @@
+"""
+Local minor/substantive classifier for salesman responses.
+
+Logistic regression over the (cached) message embedding plus a few lexical
+features, trained from the labels the LLM classifier has logged. Only
+responses it is confident about are decided locally; the rest still go to
+the LLM.
+
+Run from backend/api:
+    python -m util.response_classifier train       # fit, calibrate and save
+    python -m util.response_classifier evaluate    # agreement and latency savings on held-out labels
+
+Labels are split by message text: 60% train the model, 20% calibrate its
+confidence threshold and the remaining 20% are only ever used by evaluate.
+"""
+import hashlib
+import os
+import re
+import statistics
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseClassificationLabel, EMBEDDING_MODEL, get_query_embedding )
+from typing import List, Optional, Tuple
+
+load_dotenv()
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", ".cache/models/response_classifier.joblib")
+# Confident decisions must agree with the LLM at least this often on held-out labels
+LOCAL_CLASSIFIER_TARGET_AGREEMENT = float(os.getenv("LOCAL_CLASSIFIER_TARGET_AGREEMENT", "0.97"))
+LOCAL_CLASSIFIER_MIN_SAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_SAMPLES", "200"))
+LABEL_LOGGING_ENABLED = os.getenv("CLASSIFICATION_LABEL_LOGGING", "true").lower() == "true"
+LABELS = ("minor", "substantive")
+
+FILLER_WORDS = {
+    "ok", "okay", "sure", "yes", "yeah", "yep", "right", "alright", "hmm", "uh", "um", "thanks",
+    "thank", "great", "cool", "fine", "got", "it", "i", "see", "understood", "absolutely", "totally", "no"
+}
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Label logging must never hold up a turn
+_label_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def lexical_features(message: str) -> np.ndarray:
+    text = (message or "").strip()
+    words = _WORD.findall(text.lower())
+    filler = sum(1 for word in words if word in FILLER_WORDS)
+    return np.array([
+        np.log1p(len(words)),
+        np.log1p(len(text)),
+        filler / len(words) if words else 1.0,
+        1.0 if words and all(word in FILLER_WORDS for word in words) else 0.0,
+        1.0 if "?" in text else 0.0,
+        1.0 if re.search(r"\d", text) else 0.0,
+        text.count(".") + text.count("!") + text.count("?"),
+    ], dtype=np.float32)
+
+
+def features(message: str) -> np.ndarray:
+    embedding = np.asarray(get_query_embedding(message or ""), dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    if norm:
+        embedding = embedding / norm
+    return np.concatenate([embedding, lexical_features(message)])
+
+
+def log_classification_label(salesman_message: Optional[str], current_objection: Optional[str],
+                             label: str, llm_ms: float):
+    """Record an LLM label for future training, off the request path"""
+    if not LABEL_LOGGING_ENABLED or not salesman_message or label not in LABELS:
+        return
+
+    def _write():
+        try:
+            with SessionLocal() as session:
+                session.add(DatabaseClassificationLabel(
+                    salesman_message=salesman_message, current_objection=current_objection,
+                    label=label, llm_ms=llm_ms
+                ))
+                session.commit()
+        except Exception as e:
+            print(f"Could not log classification label: {e}")
+
+    _label_executor.submit(_write)
+
+
+def load_labels() -> List[Tuple[str, str, Optional[float]]]:
+    with SessionLocal() as session:
+        rows = session.query(
+            DatabaseClassificationLabel.salesman_message,
+            DatabaseClassificationLabel.label,
+            DatabaseClassificationLabel.llm_ms
+        ).order_by(DatabaseClassificationLabel.id).all()
+    return [(message, label, llm_ms) for message, label, llm_ms in rows if label in LABELS]
+
+
+def label_split(message: str) -> str:
+    """'train', 'calibration' or 'evaluation', deterministic by message text so duplicates never straddle splits"""
+    bucket = int(hashlib.sha256(message.strip().lower().encode("utf-8")).hexdigest(), 16) % 5
+    return "evaluation" if bucket == 0 else "calibration" if bucket == 1 else "train"
+
+
+def calibrate_threshold(probabilities: np.ndarray, labels: np.ndarray, target: float) -> float:
+    """Smallest confidence t such that predictions with max(p, 1-p) >= t agree with the LLM at `target`"""
+    confidence = np.maximum(probabilities, 1 - probabilities)
+    predicted = (probabilities >= 0.5).astype(int)
+    for threshold in np.arange(0.5, 1.0, 0.01):
+        confident = confidence >= threshold
+        if confident.sum() == 0:
+            break
+        if (predicted[confident] == labels[confident]).mean() >= target:
+            return float(threshold)
+    return 1.01  # never confident: everything goes to the LLM
+
+
+class LocalResponseClassifier:
+    """Trained model plus its calibrated confidence threshold"""
+    def __init__(self, model, threshold: float, embedding_model: str, trained_on: int):
+        self.model = model
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self.trained_on = trained_on
+
+    def probability(self, message: str) -> float:
+        """P(substantive)"""
+        return float(self.model.predict_proba(features(message)[None, :])[0, 1])
+
+    def decide(self, message: str) -> Optional[str]:
+        p = self.probability(message)
+        if max(p, 1 - p) < self.threshold:
+            return None
+        return "substantive" if p >= 0.5 else "minor"
+
+    def save(self, path: str = LOCAL_CLASSIFIER_PATH):
+        import joblib
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump({
+            "model": self.model, "threshold": self.threshold,
+            "embedding_model": self.embedding_model, "trained_on": self.trained_on
+        }, path)
+
+    @classmethod
+    def load(cls, path: str = LOCAL_CLASSIFIER_PATH) -> Optional["LocalResponseClassifier"]:
+        if not os.path.exists(path):
+            return None
+        import joblib
+        state = joblib.load(path)
+        if state["embedding_model"] != EMBEDDING_MODEL:
+            print(f"Local classifier was trained on {state['embedding_model']} embeddings; ignoring it")
+            return None
+        return cls(state["model"], state["threshold"], state["embedding_model"], state["trained_on"])
+
+
+_classifier: Optional[LocalResponseClassifier] = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_local_classifier() -> Optional[LocalResponseClassifier]:
+    global _classifier, _classifier_loaded
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    if not _classifier_loaded:
+        with _classifier_lock:
+            if not _classifier_loaded:
+                try:
+                    _classifier = LocalResponseClassifier.load()
+                except Exception as e:
+                    print(f"Local classifier unavailable: {e}")
+                _classifier_loaded = True
+    return _classifier
+
+
+def classify_locally(salesman_message: Optional[str]) -> Optional[str]:
+    """'minor' or 'substantive' when the local model is confident, None to defer to the LLM"""
+    classifier = get_local_classifier()
+    if classifier is None or not salesman_message:
+        return None
+    try:
+        return classifier.decide(salesman_message)
+    except Exception as e:
+        print(f"Local classification failed, deferring to the LLM: {e}")
+        return None
+
+
+def classify_heuristically(salesman_message: Optional[str]) -> str:
+    """Rough label from surface features alone, for when the LLM cannot be reached in time"""
+    text = (salesman_message or "").strip()
+    words = _WORD.findall(text.lower())
+    if not words or all(word in FILLER_WORDS for word in words) or (len(words) <= 3 and "?" not in text):
+        return "minor"
+    return "substantive"
+
+
+def train(target: float = LOCAL_CLASSIFIER_TARGET_AGREEMENT, min_samples: int = LOCAL_CLASSIFIER_MIN_SAMPLES):
+    from sklearn.linear_model import LogisticRegression
+
+    labels = load_labels()
+    train_rows = [row for row in labels if label_split(row[0]) == "train"]
+    calibration_rows = [row for row in labels if label_split(row[0]) == "calibration"]
+    if len(train_rows) < min_samples or len({label for _, label, _ in train_rows}) < 2:
+        print(f"Need at least {min_samples} training labels covering both classes; have {len(train_rows)}")
+        return None
+
+    X = np.stack([features(message) for message, _, _ in train_rows])
+    y = np.array([LABELS.index(label) for _, label, _ in train_rows])
+    model = LogisticRegression(max_iter=2000, class_weight="balanced")
+    model.fit(X, y)
+
+    # Calibrate on the calibration split when there are enough labels, otherwise on the training set;
+    # the evaluation split is never seen here, so evaluate() stays an honest estimate either way
+    if len(calibration_rows) < 50:
+        print(f"Only {len(calibration_rows)} calibration labels; calibrating on the training set")
+        calibration_rows = train_rows
+    probabilities = model.predict_proba(np.stack([features(message) for message, _, _ in calibration_rows]))[:, 1]
+    threshold = calibrate_threshold(
+        probabilities, np.array([LABELS.index(label) for _, label, _ in calibration_rows]), target
+    )
+    classifier = LocalResponseClassifier(model, threshold, EMBEDDING_MODEL, len(train_rows))
+    classifier.save()
+    print(f"Trained on {len(train_rows)} labels; confidence threshold {threshold:.2f}; saved to {LOCAL_CLASSIFIER_PATH}")
+    return classifier
+
+
+def evaluate(classifier: Optional[LocalResponseClassifier] = None):
+    """Agreement with the LLM and estimated latency savings on the evaluation split"""
+    classifier = classifier or LocalResponseClassifier.load()
+    if classifier is None:
+        print(f"No trained classifier at {LOCAL_CLASSIFIER_PATH}")
+        return None
+    rows = [row for row in load_labels() if label_split(row[0]) == "evaluation"]
+    if not rows:
+        print("No held-out labels to evaluate on")
+        return None
+
+    decided, agreed, local_ms = 0, 0, []
+    for message, label, _ in rows:
+        start = time.perf_counter()
+        decision = classifier.decide(message)
+        local_ms.append((time.perf_counter() - start) * 1000)
+        if decision is not None:
+            decided += 1
+            agreed += decision == label
+    llm_latencies = [llm_ms for _, _, llm_ms in rows if llm_ms]
+    # Median, because labels logged before cache hits were excluded carry near-zero latencies
+    llm_median = statistics.median(llm_latencies) if llm_latencies else 0.0
+    coverage = decided / len(rows)
+    local_ms.sort()
+    report = {
+        "held_out": len(rows),
+        "threshold": classifier.threshold,
+        "coverage": coverage,
+        "agreement_on_decided": agreed / decided if decided else None,
+        "overall_agreement_with_fallback": (agreed + len(rows) - decided) / len(rows),
+        "local_p50_ms": local_ms[len(local_ms) // 2],
+        "local_p95_ms": local_ms[min(len(local_ms) - 1, int(len(local_ms) * 0.95))],
+        "llm_median_ms": llm_median,
+        # Every confident decision saves an LLM call; ambiguous ones pay the local check on top
+        "saved_ms_per_classification": coverage * llm_median - statistics.mean(local_ms),
+    }
+    for key, value in report.items():
+        print(f"{key:<34} {value:.3f}" if isinstance(value, float) else f"{key:<34} {value}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--target-agreement", type=float, default=LOCAL_CLASSIFIER_TARGET_AGREEMENT)
+    parser.add_argument("--min-samples", type=int, default=LOCAL_CLASSIFIER_MIN_SAMPLES)
+    args = parser.parse_args()
+    if args.command == "train":
+        trained = train(args.target_agreement, args.min_samples)
+        if trained is not None:
+            evaluate(trained)
+    else:
+        evaluate()
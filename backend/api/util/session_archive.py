@@ -0,0 +1,349 @@
+"""
+Compaction of idle sessions out of the hot sessions/session_turns tables.
+
+Sessions idle past the retention policy are moved into session_archive as one
+zlib-compressed payload, where they stay restorable. Older turns are folded into
+an extractive summary and only the most recent turns are kept verbatim.
+Archived rows are purged once they pass the retention window; with the parquet
+sink they are first exported to a local Parquet file, which is never restored
+from and is deleted after its own retention period.
+
+Run from backend/api:
+    python -m util.session_archive                 # archive and purge once
+    python -m util.session_archive --dry-run       # report what would move
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import timedelta
+from dotenv import load_dotenv
+from sqlalchemy import (select, insert, delete, func, or_, and_)
+from sqlalchemy.exc import IntegrityError
+from config.tidb_config import (SessionLocal)
+from model.context_model import (SessionModel, ClientAgentContextModel)
+from .knowledge_graph import ( DatabaseSession, DatabaseSessionTurn, DatabaseSessionArchive )
+from .session_service import ( get_session_by_id, create_new_session )
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+load_dotenv()
+
+SESSION_ARCHIVE_ENABLED = os.getenv("SESSION_ARCHIVE_ENABLED", "true").lower() == "true"
+SESSION_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("SESSION_ARCHIVE_INTERVAL_SECONDS", "3600"))
+SESSION_ARCHIVE_BATCH_SIZE = int(os.getenv("SESSION_ARCHIVE_BATCH_SIZE", "200"))
+# Where archives go once past retention: "table" deletes them, "parquet" exports them to SESSION_ARCHIVE_PARQUET_DIR first
+SESSION_ARCHIVE_SINK = os.getenv("SESSION_ARCHIVE_SINK", "table")
+SESSION_ARCHIVE_PARQUET_DIR = os.getenv("SESSION_ARCHIVE_PARQUET_DIR", ".cache/session_archive")
+# Parquet exports older than this are deleted; "forever" keeps them
+SESSION_ARCHIVE_PARQUET_RETENTION_DAYS = os.getenv("SESSION_ARCHIVE_PARQUET_RETENTION_DAYS", "365")
+SUMMARY_SNIPPET_CHARS = 160
+
+
+class RetentionPolicy(NamedTuple):
+    idle_hours: float  # sessions untouched this long leave the hot tables
+    keep_turns: Optional[int]  # most recent turns kept verbatim; None keeps the full transcript
+    retention_days: Optional[float]  # archived sessions are purged after this; None keeps them forever
+
+
+def _optional_number(value: str, cast):
+    return None if value.strip().lower() in ("", "all", "none", "forever") else cast(value)
+
+
+def default_retention_policy() -> RetentionPolicy:
+    return RetentionPolicy(
+        idle_hours=float(os.getenv("SESSION_ARCHIVE_IDLE_HOURS", "24")),
+        keep_turns=_optional_number(os.getenv("SESSION_ARCHIVE_KEEP_TURNS", "6"), int),
+        retention_days=_optional_number(os.getenv("SESSION_ARCHIVE_RETENTION_DAYS", "180"), float)
+    )
+
+
+def summarize_turns(turns: List[Dict]) -> str:
+    """Extractive summary of a stretch of conversation: the opening exchange and the last word from each side"""
+    if not turns:
+        return ""
+
+    def snippet(turn):
+        content = " ".join(str(turn.get("content") or "").split())
+        if len(content) > SUMMARY_SNIPPET_CHARS:
+            content = content[:SUMMARY_SNIPPET_CHARS].rstrip() + "..."
+        return f"{turn.get('role', '')}: {content}"
+
+    picked = turns[:2]
+    for role in ("salesman", "client_agent"):
+        last = next((turn for turn in reversed(turns[2:]) if turn.get("role") == role), None)
+        if last is not None and last not in picked:
+            picked.append(last)
+    return f"Earlier conversation ({len(turns)} turns) | " + " | ".join(snippet(turn) for turn in picked)
+
+
+def compact_session(context: dict, turns: List[Dict], keep_turns: Optional[int]) -> dict:
+    """Archive payload: static context, the retained tail of the transcript and a summary of the rest"""
+    if keep_turns is None or len(turns) <= keep_turns:
+        retained, summary = turns, ""
+    else:
+        split = len(turns) - keep_turns
+        retained, summary = turns[split:], summarize_turns(turns[:split])
+    return {
+        "context": context,
+        "summary": summary,
+        "turn_offset": len(turns) - len(retained),
+        "turns": retained
+    }
+
+
+def encode_payload(payload: dict) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8"), 6)
+
+
+def decode_payload(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _write_parquet(rows: List[dict]) -> str:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(SESSION_ARCHIVE_PARQUET_DIR, exist_ok=True)
+    # Named after the batch's contents, so re-exporting a batch whose delete did not commit overwrites the file
+    batch_key = hashlib.sha256(",".join(row["guid"] for row in rows).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(
+        SESSION_ARCHIVE_PARQUET_DIR,
+        f"sessions-{rows[0]['archived_at'].strftime('%Y%m%d')}-{batch_key}.parquet"
+    )
+    # The payload is already zlib-compressed; zstd still pays off on the summary and metadata columns
+    pq.write_table(pa.Table.from_pylist(rows), path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def purge_expired_exports(retention_days: Optional[float], dry_run: bool = False) -> int:
+    """Delete Parquet exports older than retention_days"""
+    if retention_days is None or not os.path.isdir(SESSION_ARCHIVE_PARQUET_DIR):
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    purged = 0
+    for name in os.listdir(SESSION_ARCHIVE_PARQUET_DIR):
+        path = os.path.join(SESSION_ARCHIVE_PARQUET_DIR, name)
+        if name.endswith(".parquet") and os.path.getmtime(path) < cutoff:
+            if not dry_run:
+                os.remove(path)
+            purged += 1
+    return purged
+
+
+def archive_idle_sessions(policy: Optional[RetentionPolicy] = None, batch_size: int = SESSION_ARCHIVE_BATCH_SIZE,
+                          is_live: Optional[Callable[[str], bool]] = None, dry_run: bool = False) -> dict:
+    """Move sessions idle past the policy threshold out of the hot tables, one batch per transaction"""
+    policy = policy or default_retention_policy()
+    stats = {"archived": 0, "turns_removed": 0, "turns_summarized": 0, "skipped_live": 0}
+    skipped: List[str] = []
+
+    while True:
+        with SessionLocal() as session:
+            # Use the database clock so the threshold matches last_active_at
+            now = session.execute(select(func.now())).scalar()
+            cutoff = now - timedelta(hours=policy.idle_hours)
+            query = session.query(DatabaseSession).filter(or_(
+                DatabaseSession.last_active_at < cutoff,
+                and_(DatabaseSession.last_active_at.is_(None), DatabaseSession.created_date < cutoff)
+            ))
+            if skipped:
+                query = query.filter(DatabaseSession.guid.notin_(skipped))
+            candidates = query.order_by(DatabaseSession.last_active_at).limit(batch_size).all()
+            if not candidates:
+                break
+
+            # Sessions still held by this worker's write-behind cache may have unflushed turns
+            idle = []
+            for row in candidates:
+                if is_live is not None and is_live(row.guid):
+                    skipped.append(row.guid)
+                    stats["skipped_live"] += 1
+                else:
+                    idle.append(row)
+            if not idle:
+                continue
+
+            guids = [row.guid for row in idle]
+            turns_by_session: Dict[str, List[Dict]] = {guid: [] for guid in guids}
+            for guid, role, content in session.query(
+                DatabaseSessionTurn.session_guid, DatabaseSessionTurn.role, DatabaseSessionTurn.content
+            ).filter(DatabaseSessionTurn.session_guid.in_(guids)).order_by(
+                DatabaseSessionTurn.session_guid, DatabaseSessionTurn.turn_index
+            ):
+                turns_by_session[guid].append({"role": role, "content": content})
+
+            archive_rows = []
+            for row in idle:
+                context = dict(row.client_agent_context or {})
+                # Sessions written before session_turns still carry their history inline
+                turns = turns_by_session[row.guid] or context.pop("conversation_history", None) or []
+                context.pop("conversation_history", None)
+                payload = compact_session(context, turns, policy.keep_turns)
+                stats["turns_summarized"] += payload["turn_offset"]
+                stats["turns_removed"] += len(turns)
+                archive_rows.append({
+                    "guid": row.guid,
+                    "round_count": row.round_count,
+                    "turn_count": len(turns),
+                    "summary": payload["summary"],
+                    "payload": encode_payload(payload),
+                    "created_date": row.created_date,
+                    "last_active_at": row.last_active_at,
+                    "archived_at": now
+                })
+
+            if dry_run:
+                stats["archived"] += len(archive_rows)
+                skipped.extend(guids)
+                continue
+
+            session.execute(insert(DatabaseSessionArchive), archive_rows)
+            session.execute(delete(DatabaseSessionTurn).where(DatabaseSessionTurn.session_guid.in_(guids)))
+            session.execute(delete(DatabaseSession).where(DatabaseSession.guid.in_(guids)))
+            session.commit()
+            stats["archived"] += len(archive_rows)
+    return stats
+
+
+def purge_expired_archives(policy: Optional[RetentionPolicy] = None, batch_size: int = SESSION_ARCHIVE_BATCH_SIZE,
+                           sink: str = SESSION_ARCHIVE_SINK, dry_run: bool = False) -> int:
+    """Delete archived sessions older than the retention window, exporting them to Parquet first with the parquet sink"""
+    policy = policy or default_retention_policy()
+    if policy.retention_days is None:
+        return 0
+    purged = 0
+    with SessionLocal() as session:
+        cutoff = session.execute(select(func.now())).scalar() - timedelta(days=policy.retention_days)
+        expired = DatabaseSessionArchive.archived_at < cutoff
+        if dry_run:
+            return session.query(func.count(DatabaseSessionArchive.guid)).filter(expired).scalar()
+        while True:
+            # A stable order means a batch whose delete failed is exported under the same file name next run
+            query = session.query(DatabaseSessionArchive).filter(expired).order_by(
+                DatabaseSessionArchive.archived_at, DatabaseSessionArchive.guid
+            ).limit(batch_size)
+            if sink == "parquet":
+                rows = [{column.name: getattr(row, column.name) for column in DatabaseSessionArchive.__table__.columns}
+                        for row in query]
+                guids = [row["guid"] for row in rows]
+            else:
+                guids = [guid for guid, in query.with_entities(DatabaseSessionArchive.guid)]
+            if not guids:
+                break
+            if sink == "parquet":
+                path = _write_parquet(rows)
+                print(f"Exported {len(rows)} expired archived sessions to {path}")
+            session.execute(delete(DatabaseSessionArchive).where(DatabaseSessionArchive.guid.in_(guids)))
+            session.commit()
+            purged += len(guids)
+    return purged
+
+
+# Serializes restores of the same session within this process
+_RESTORE_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def restore_archived_session(session_id: str) -> Optional[SessionModel]:
+    """Move an archived session back into the hot tables so the conversation can continue"""
+    with _RESTORE_LOCKS[hash(session_id) % len(_RESTORE_LOCKS)]:
+        # A concurrent request may have restored it while this one waited
+        restored = get_session_by_id(session_id)
+        if restored is not None:
+            return restored
+        return _restore_archived_session(session_id)
+
+
+def _restore_archived_session(session_id: str) -> Optional[SessionModel]:
+    with SessionLocal() as session:
+        archived = session.get(DatabaseSessionArchive, session_id)
+        if archived is None:
+            return None
+        payload = decode_payload(archived.payload)
+        round_count = archived.round_count
+
+    history = list(payload["turns"])
+    if payload["summary"]:
+        history.insert(0, {"role": "summary", "content": payload["summary"]})
+    # The restored history is renumbered, so the rolling summary is rebuilt from it
+    context = {**payload["context"], "history_summary": None, "summarized_turns": 0}
+    session_model = SessionModel(
+        session_id=session_id,
+        client_agent_context=ClientAgentContextModel(**context, conversation_history=history),
+        round_count=round_count
+    )
+    try:
+        create_new_session(session_model)
+    except IntegrityError:
+        # Another worker restored it first; theirs is the copy that is live now
+        print(f"Archived session {session_id} was restored concurrently")
+        return get_session_by_id(session_id)
+    with SessionLocal() as session:
+        session.execute(delete(DatabaseSessionArchive).where(DatabaseSessionArchive.guid == session_id))
+        session.commit()
+    print(f"Restored archived session {session_id} with {len(history)} turns")
+    return session_model
+
+
+def get_or_restore_session(session_id: str) -> Optional[SessionModel]:
+    """Hot-table lookup; only a miss pays for the archive check"""
+    session_model = get_session_by_id(session_id)
+    if session_model is None:
+        session_model = restore_archived_session(session_id)
+    return session_model
+
+
+def run_session_compaction(policy: Optional[RetentionPolicy] = None, is_live: Optional[Callable[[str], bool]] = None,
+                           dry_run: bool = False) -> dict:
+    policy = policy or default_retention_policy()
+    start = time.perf_counter()
+    stats = archive_idle_sessions(policy, is_live=is_live, dry_run=dry_run)
+    stats["purged"] = purge_expired_archives(policy, dry_run=dry_run)
+    if SESSION_ARCHIVE_SINK == "parquet":
+        stats["exports_purged"] = purge_expired_exports(
+            _optional_number(SESSION_ARCHIVE_PARQUET_RETENTION_DAYS, float), dry_run=dry_run
+        )
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def start_session_archiver(is_live: Optional[Callable[[str], bool]] = None):
+    """Run compaction periodically in a daemon thread"""
+    if not SESSION_ARCHIVE_ENABLED:
+        return None
+
+    def _loop():
+        while True:
+            time.sleep(SESSION_ARCHIVE_INTERVAL_SECONDS)
+            try:
+                stats = run_session_compaction(is_live=is_live)
+                if stats["archived"] or stats["purged"]:
+                    print(f"Session compaction: {stats}")
+            except Exception as e:
+                print(f"Session compaction failed: {e}")
+
+    thread = threading.Thread(target=_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+    defaults = default_retention_policy()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle-hours", type=float, default=defaults.idle_hours)
+    parser.add_argument("--keep-turns", default=str(defaults.keep_turns if defaults.keep_turns is not None else "all"),
+                        help="turns kept verbatim, or 'all'")
+    parser.add_argument("--retention-days", default=str(defaults.retention_days if defaults.retention_days is not None else "forever"),
+                        help="days archived sessions are kept, or 'forever'")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    policy = RetentionPolicy(
+        idle_hours=args.idle_hours,
+        keep_turns=_optional_number(args.keep_turns, int),
+        retention_days=_optional_number(args.retention_days, float)
+    )
+    print(f"Session compaction with {policy}{' (dry run)' if args.dry_run else ''}")
+    print(run_session_compaction(policy, dry_run=args.dry_run))
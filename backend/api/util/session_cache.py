@@ -0,0 +1,334 @@
+import atexit
+import copy
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from model.context_model import (SessionModel)
+from .session_service import ( update_session_by_id, save_sessions )
+from .session_archive import ( get_or_restore_session )
+from typing import Any, Callable, Dict, List, Optional
+
+load_dotenv()
+
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+SESSION_CACHE_MAX_SIZE = int(os.getenv("SESSION_CACHE_MAX_SIZE", "1000"))
+# Sessions untouched for this long are flushed and dropped from memory
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "1800"))
+SESSION_CACHE_FLUSH_SECONDS = float(os.getenv("SESSION_CACHE_FLUSH_SECONDS", "2"))
+SESSION_CACHE_FLUSH_BATCH = int(os.getenv("SESSION_CACHE_FLUSH_BATCH", "50"))
+# A session whose write fails this many flushes in a row is dropped from write-behind
+SESSION_CACHE_MAX_FLUSH_FAILURES = int(os.getenv("SESSION_CACHE_MAX_FLUSH_FAILURES", "5"))
+
+
+class _Entry:
+    __slots__ = ("value", "dirty", "last_access")
+
+    def __init__(self, value, dirty: bool):
+        self.value = value
+        self.dirty = dirty
+        self.last_access = time.monotonic()
+
+
+class SessionCache:
+    """Bounded write-behind cache of live sessions.
+
+    Reads hand out deep copies, so a request can mutate its session freely and
+    publish it with put(). Dirty sessions are written by a background flusher in
+    batches; dirty sessions that fall out of the LRU or pass the idle TTL are
+    parked until flushed, so eviction never loses a turn. A failed batch is retried
+    one session at a time so a single bad session cannot hold back the rest; a
+    session that keeps failing, or whose row is gone, is dropped from write-behind.
+    The saver returns the ids of sessions it could not find. Without a saver the
+    cache is purely in-memory.
+    """
+    def __init__(self, loader: Optional[Callable[[str], Any]] = None,
+                 saver: Optional[Callable[[List[Any]], Optional[List[str]]]] = None,
+                 max_size: int = SESSION_CACHE_MAX_SIZE, ttl_seconds: int = SESSION_CACHE_TTL_SECONDS,
+                 flush_seconds: float = SESSION_CACHE_FLUSH_SECONDS, flush_batch: int = SESSION_CACHE_FLUSH_BATCH,
+                 max_flush_failures: int = SESSION_CACHE_MAX_FLUSH_FAILURES):
+        self.loader = loader
+        self.saver = saver
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.flush_seconds = flush_seconds
+        self.flush_batch = flush_batch
+        self.max_flush_failures = max_flush_failures
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._evicted_dirty: Dict[str, Any] = {}
+        # Consecutive failed writes per session
+        self._flush_failures: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        # Serializes flushes so the background flusher and shutdown never write the same session twice
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "flushes": 0, "flushed_sessions": 0, "flush_errors": 0,
+                        "dropped_sessions": 0}
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries or session_id in self._evicted_dirty
+
+    def get(self, session_id: str):
+        """Return a private copy of the session, loading it through the loader on a miss"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None and session_id in self._evicted_dirty:
+                # Re-adopt a parked session rather than reading a stale row from TiDB
+                entry = _Entry(self._evicted_dirty.pop(session_id), dirty=True)
+                self._entries[session_id] = entry
+            if entry is not None:
+                self.metrics["hits"] += 1
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+                return copy.deepcopy(entry.value)
+            self.metrics["misses"] += 1
+
+        if self.loader is None:
+            return None
+        value = self.loader(session_id)
+        if value is None:
+            return None
+        with self._lock:
+            # Another request may have published the session while we were loading
+            if session_id not in self._entries:
+                self._entries[session_id] = _Entry(value, dirty=False)
+                self._evict_locked()
+            else:
+                value = self._entries[session_id].value
+            return copy.deepcopy(value)
+
+    def put(self, session_id: str, value, dirty: bool = True):
+        """Publish a session; dirty sessions are written by the next flush"""
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current is not None:
+                _carry_persisted_state(value, current.value)
+                current.value = value
+                current.dirty = current.dirty or dirty
+                current.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+            else:
+                parked = self._evicted_dirty.pop(session_id, None)
+                if parked is not None:
+                    _carry_persisted_state(value, parked)
+                    dirty = True
+                self._entries[session_id] = _Entry(value, dirty)
+            self._evict_locked()
+            pending = self._dirty_count_locked()
+        self._ensure_flusher()
+        if pending >= self.flush_batch:
+            self._wake.set()
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._evicted_dirty.pop(session_id, None)
+            self._flush_failures.pop(session_id, None)
+
+    def _dirty_count_locked(self) -> int:
+        return sum(1 for entry in self._entries.values() if entry.dirty) + len(self._evicted_dirty)
+
+    def _evict_locked(self):
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, entry in self._entries.items()
+            if now - entry.last_access > self.ttl_seconds
+        ]
+        for session_id in expired:
+            self._drop_locked(session_id)
+        while len(self._entries) > self.max_size:
+            self._drop_locked(next(iter(self._entries)))
+
+    def _drop_locked(self, session_id: str):
+        entry = self._entries.pop(session_id)
+        self.metrics["evictions"] += 1
+        if entry.dirty and self.saver is not None:
+            self._evicted_dirty[session_id] = entry.value
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write every dirty session now, in batches; returns the number written"""
+        if self.saver is None:
+            return 0
+        written = 0
+        # Sessions that failed during this flush wait for the next one
+        failed = set()
+        with self._flush_lock:
+            while True:
+                batch = self._take_dirty_batch(skip=failed)
+                if not batch:
+                    break
+                written += self._save_batch(batch, failed)
+        if written:
+            self.metrics["flushes"] += 1
+            self.metrics["flushed_sessions"] += written
+        return written
+
+    def _save_batch(self, batch, failed: set) -> int:
+        """Write one batch, falling back to one session at a time when the batch fails; returns the number written"""
+        try:
+            missing = set(self.saver([snapshot for _, snapshot, _ in batch]) or ())
+        except Exception as e:
+            self.metrics["flush_errors"] += 1
+            if len(batch) > 1:
+                print(f"Session cache flush failed for {len(batch)} sessions, retrying one at a time: {e}")
+                return sum(self._save_batch([item], failed) for item in batch)
+            session_id = batch[0][0]
+            failed.add(session_id)
+            with self._lock:
+                failures = self._flush_failures.get(session_id, 0) + 1
+                self._flush_failures[session_id] = failures
+            print(f"Session cache flush failed for session {session_id} ({failures} in a row): {e}")
+            if failures >= self.max_flush_failures:
+                self._drop_unwritable(batch[0], f"{failures} failed writes")
+            else:
+                self._restore_dirty(batch)
+            return 0
+
+        for item in batch:
+            if item[0] in missing:
+                self._drop_unwritable(item, "its row no longer exists")
+        saved = [item for item in batch if item[0] not in missing]
+        self._record_flushed(saved)
+        return len(saved)
+
+    def _drop_unwritable(self, item, reason: str):
+        """Stop retrying a session's write; the in-memory copy stays readable until it is evicted"""
+        session_id, snapshot, _ = item
+        with self._lock:
+            self._flush_failures.pop(session_id, None)
+            if self._evicted_dirty.get(session_id) is snapshot:
+                del self._evicted_dirty[session_id]
+            self.metrics["dropped_sessions"] += 1
+        print(f"Session cache dropped unsaved changes for session {session_id}: {reason}")
+
+    def _take_dirty_batch(self, skip=()):
+        """(session_id, snapshot, parked) for up to flush_batch dirty sessions, marking them clean"""
+        batch = []
+        with self._lock:
+            # Parked sessions stay readable through get() until their write has landed
+            for session_id in self._evicted_dirty:
+                if len(batch) >= self.flush_batch:
+                    break
+                if session_id not in skip:
+                    batch.append((session_id, self._evicted_dirty[session_id], True))
+            for session_id, entry in self._entries.items():
+                if len(batch) >= self.flush_batch:
+                    break
+                if entry.dirty and session_id not in skip:
+                    entry.dirty = False
+                    batch.append((session_id, copy.deepcopy(entry.value), False))
+        return batch
+
+    def _restore_dirty(self, batch):
+        with self._lock:
+            for session_id, snapshot, parked in batch:
+                entry = self._entries.get(session_id)
+                if entry is not None:
+                    entry.dirty = True
+                elif not parked:
+                    self._evicted_dirty[session_id] = snapshot
+
+    def _record_flushed(self, batch):
+        with self._lock:
+            for session_id, snapshot, _ in batch:
+                self._flush_failures.pop(session_id, None)
+                entry = self._entries.get(session_id)
+                if entry is not None:
+                    _carry_persisted_state(entry.value, snapshot)
+                parked = self._evicted_dirty.get(session_id)
+                if parked is snapshot:
+                    del self._evicted_dirty[session_id]
+                elif parked is not None:
+                    _carry_persisted_state(parked, snapshot)
+
+    def _ensure_flusher(self):
+        if self.saver is None or self._flusher is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            with self._lock:
+                self._evict_locked()
+            self.flush()
+
+    def close(self):
+        """Stop the background flusher and write everything still dirty"""
+        self._stopped.set()
+        self._wake.set()
+        written = self.flush()
+        if written:
+            print(f"Session cache flushed {written} sessions on shutdown")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "size": len(self._entries),
+                "dirty": self._dirty_count_locked(),
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0
+            }
+
+
+def _carry_persisted_state(target, source):
+    # Turns are append-only, so the furthest persisted point is the one to keep
+    if isinstance(target, SessionModel) and isinstance(source, SessionModel):
+        if source.persisted_turns >= target.persisted_turns:
+            target.persisted_turns = source.persisted_turns
+            target.static_context_hash = source.static_context_hash
+
+
+session_cache = SessionCache(loader=get_or_restore_session, saver=save_sessions)
+
+
+def load_session(session_id: str) -> Optional[SessionModel]:
+    if not SESSION_CACHE_ENABLED:
+        return get_or_restore_session(session_id)
+    return session_cache.get(session_id)
+
+
+def store_session(session_model: SessionModel):
+    """Queue a session for write-behind, or write it through when the cache is disabled"""
+    if not SESSION_CACHE_ENABLED:
+        update_session_by_id(session_model.session_id, session_model)
+        return
+    session_cache.put(session_model.session_id, session_model)
+
+
+def cache_new_session(session_model: SessionModel):
+    """Track a session that create_new_session has just written"""
+    if SESSION_CACHE_ENABLED:
+        session_cache.put(session_model.session_id, copy.deepcopy(session_model), dirty=False)
+
+
+def install_session_cache_shutdown_hooks():
+    """Flush dirty sessions at interpreter exit and on SIGTERM/SIGINT"""
+    atexit.register(session_cache.close)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(signum)
+
+        def _handler(received, frame, previous=previous):
+            session_cache.close()
+            if callable(previous):
+                previous(received, frame)
+            elif previous == signal.SIG_DFL:
+                raise SystemExit(128 + received)
+
+        try:
+            signal.signal(signum, _handler)
+        except ValueError:
+            # Only the main thread may install signal handlers; atexit still covers clean exits
+            pass
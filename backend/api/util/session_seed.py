@@ -0,0 +1,86 @@
+import threading
+from sqlalchemy.exc import IntegrityError
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseSessionSeed, get_graph_version )
+from .db_service import ( get_client_profile, get_client_with_detailed_objections )
+from .graph_snapshot import ( get_graph_snapshot )
+from typing import Dict, Optional, Tuple
+
+# client_profile_id -> (graph_version, seed)
+_seed_cache: Dict[str, Tuple[int, dict]] = {}
+_seed_lock = threading.Lock()
+
+
+def current_graph_version(session) -> int:
+    # The graph snapshot already polls kg_version, so prefer it over another query
+    snapshot = get_graph_snapshot()
+    if snapshot is not None:
+        return snapshot.version
+    try:
+        return get_graph_version(session)
+    except Exception:
+        session.rollback()
+        return 0
+
+
+def compute_session_seed(client_profile_id: str) -> Optional[dict]:
+    """Everything session-init needs from the knowledge graph for one client profile"""
+    profile = get_client_profile(client_profile_id)
+    if not isinstance(profile, dict):
+        return None
+    objections = get_client_with_detailed_objections(client_profile_id)
+    return {
+        "client_profile_id": client_profile_id,
+        "profile_name": profile["name"],
+        "profile_desc": profile["description"],
+        "client_objections": objections["client_objections"],
+        "related_objections": objections["related_objections"]
+    }
+
+
+def get_session_seed(client_profile_id: str) -> Optional[dict]:
+    """Return the materialized seed for a profile, rebuilding it when the graph version moved.
+
+    Lookup order is the in-process cache, then the session_seeds row, then a
+    fresh computation that is written back for other workers.
+    """
+    with SessionLocal() as session:
+        version = current_graph_version(session)
+
+        with _seed_lock:
+            cached = _seed_cache.get(client_profile_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        row = session.get(DatabaseSessionSeed, client_profile_id)
+        if row is not None and row.graph_version == version:
+            with _seed_lock:
+                _seed_cache[client_profile_id] = (version, row.seed)
+            return row.seed
+
+        print(f"Materializing session seed for {client_profile_id} at graph version {version}")
+        seed = compute_session_seed(client_profile_id)
+        if seed is None:
+            return None
+        if row is None:
+            session.add(DatabaseSessionSeed(client_profile_id=client_profile_id, graph_version=version, seed=seed))
+        else:
+            row.graph_version = version
+            row.seed = seed
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another worker materialized the same profile first; its row is equivalent
+            session.rollback()
+
+    with _seed_lock:
+        _seed_cache[client_profile_id] = (version, seed)
+    return seed
+
+
+def invalidate_session_seed(client_profile_id: Optional[str] = None):
+    with _seed_lock:
+        if client_profile_id is None:
+            _seed_cache.clear()
+        else:
+            _seed_cache.pop(client_profile_id, None)
@@ -12,7 +12,10 @@ from sqlalchemy import (
     create_engine,
     or_,
     and_,
-    inspect
+    inspect,
+    insert,
+    update,
+    func
 )
 from config.tidb_config import (
     engine, Base, SessionLocal
@@ -22,8 +25,11 @@ from tidb_vector.sqlalchemy import VectorType
 from sqlalchemy.orm import relationship
 import ollama
 from flask import jsonify
-from .knowledge_graph import ( DatabaseEntity, DatabaseRelationship, DatabaseSession, get_query_embedding )
+from .knowledge_graph import ( DatabaseEntity, DatabaseRelationship, DatabaseSession, DatabaseSessionTurn, get_query_embedding )
+from .db_service import ( search_entities_by_embedding, search_entities_by_keywords )
 from typing import Optional, Dict, List
+import hashlib
+import json
 
 
 def update_session_cache(session_data: dict):
@@ -35,29 +41,46 @@ def update_session_cache(session_data: dict):
     with SessionLocal() as session:
         # Update embedding cache
         embedding = get_query_embedding(conversation_text)
-        new_embedding_results = session.query(DatabaseEntity).order_by(
-            DatabaseEntity.description_vec.cosine_distance(embedding)
-        ).limit(20).all()
+        new_embedding_results = search_entities_by_embedding(session, embedding, limit=20)
         session_data["embedding_cache"] = [obj.entity_id for obj in new_embedding_results]
         
         # Update BM25 cache
-        new_bm25_results = session.query(DatabaseEntity).filter(
-            or_(
-                DatabaseEntity.description.contains(term) for term in conversation_text.split()[:5]
-            )
-        ).limit(20).all()
+        new_bm25_results = search_entities_by_keywords(session, conversation_text, limit=20, max_terms=5)
         session_data["bm25_cache"] = [obj.entity_id for obj in new_bm25_results]
 
+def static_context(client_agent_context: ClientAgentContextModel) -> dict:
+    """Everything in the client agent context except the conversation, which lives in session_turns"""
+    return client_agent_context.dict(exclude={"conversation_history"})
+
+
+def static_context_hash(context: dict) -> str:
+    return hashlib.sha256(json.dumps(context, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _turn_rows(session_id: str, history: List[Dict], start: int) -> List[dict]:
+    return [
+        {"session_guid": session_id, "turn_index": index, "role": turn.get("role", ""), "content": turn.get("content")}
+        for index, turn in enumerate(history[start:], start=start)
+    ]
+
+
 def create_new_session(session_model: SessionModel):
     print("create new session")
+    context = static_context(session_model.client_agent_context)
+    history = session_model.client_agent_context.conversation_history or []
     with SessionLocal() as session:
         session_entity = DatabaseSession(
             guid=session_model.session_id,
-            client_agent_context=session_model.client_agent_context.dict(),
+            client_agent_context=context,
             round_count = session_model.round_count
         )
         session.add(session_entity)
+        rows = _turn_rows(session_model.session_id, history, 0)
+        if rows:
+            session.execute(insert(DatabaseSessionTurn), rows)
         session.commit()
+    session_model.persisted_turns = len(history)
+    session_model.static_context_hash = static_context_hash(context)
 
 def get_session_by_id(session_id: str):
     print("get session by id")
@@ -69,32 +92,99 @@ def get_session_by_id(session_id: str):
         if not session_entity:
             return None
 
+        context = dict(session_entity.client_agent_context)
+        turns = session.query(DatabaseSessionTurn.role, DatabaseSessionTurn.content).filter(
+            DatabaseSessionTurn.session_guid == session_id
+        ).order_by(DatabaseSessionTurn.turn_index).all()
+
+        if turns:
+            history = [{"role": role, "content": content} for role, content in turns]
+            persisted_turns = len(history)
+        else:
+            # Sessions written before session_turns carry the whole history in the JSON blob;
+            # report nothing persisted so the next update moves it into session_turns.
+            history = context.get("conversation_history") or []
+            persisted_turns = 0
+        legacy_blob = "conversation_history" in context
+        context["conversation_history"] = history
+
         # Convert client_agent_context JSON -> ClientAgentContextModel
-        client_context = ClientAgentContextModel(**session_entity.client_agent_context)
+        client_context = ClientAgentContextModel(**context)
+        context_hash = static_context_hash(static_context(client_context))
 
         # Build SessionModel
         return SessionModel(
             session_id=session_entity.guid,
             client_agent_context=client_context,
-            round_count=session_entity.round_count
+            round_count=session_entity.round_count,
+            persisted_turns=persisted_turns,
+            # A legacy blob still holds the history, so force a rewrite to the static form
+            static_context_hash=None if legacy_blob else context_hash
         )
 
+def _session_changes(session_model: SessionModel):
+    """(update values, new turn rows, static context hash) needed to persist a session"""
+    history = session_model.client_agent_context.conversation_history or []
+    context = static_context(session_model.client_agent_context)
+    context_hash = static_context_hash(context)
+    values = {"round_count": session_model.round_count, "last_active_at": func.now()}
+    if context_hash != session_model.static_context_hash:
+        values["client_agent_context"] = context
+    return values, _turn_rows(session_model.session_id, history, session_model.persisted_turns), context_hash
+
+
+def _mark_persisted(session_model: SessionModel, context_hash: str):
+    session_model.persisted_turns = len(session_model.client_agent_context.conversation_history or [])
+    session_model.static_context_hash = context_hash
+
+
 def update_session_by_id(session_id: str, updatedSession: SessionModel):
+    """Append the turns added since the last load/save; the static context is only rewritten when it changed"""
     print(f"update session by id: {session_id}")
-    with SessionLocal() as session:
-        # Find the session by ID
-        session_entity = session.query(DatabaseSession).filter(
-            DatabaseSession.guid == session_id
-        ).first()
+    values, rows, context_hash = _session_changes(updatedSession)
 
-        if not session_entity:
+    with SessionLocal() as session:
+        result = session.execute(
+            update(DatabaseSession).where(DatabaseSession.guid == session_id).values(**values)
+        )
+        if result.rowcount == 0:
             print(f"Session with id {session_id} not found")
+            session.rollback()
             return False
 
+        if rows:
+            session.execute(insert(DatabaseSessionTurn), rows)
+        session.commit()
 
-        session_entity.client_agent_context = updatedSession.client_agent_context.dict()
-        session_entity.round_count = updatedSession.round_count
-        
+    _mark_persisted(updatedSession, context_hash)
+    print(f"Session {session_id} updated successfully: {len(rows)} new turns")
+    return True
+
+def save_sessions(session_models: List[SessionModel]) -> List[str]:
+    """Persist several sessions in one transaction, with a single insert for all of their new turns.
+
+    Returns the ids of sessions whose row no longer exists; their turns are not written.
+    """
+    if not session_models:
+        return []
+    changes = [_session_changes(model) for model in session_models]
+    missing = []
+    rows = []
+    with SessionLocal() as session:
+        for model, (values, turn_rows, _) in zip(session_models, changes):
+            result = session.execute(update(DatabaseSession).where(DatabaseSession.guid == model.session_id).values(**values))
+            if result.rowcount == 0:
+                # Turns for a missing session would be orphans
+                print(f"Session with id {model.session_id} not found")
+                missing.append(model.session_id)
+                continue
+            rows.extend(turn_rows)
+        if rows:
+            session.execute(insert(DatabaseSessionTurn), rows)
         session.commit()
-        print(f"Session {session_id} updated successfully")
-        return True
\ No newline at end of file
+
+    for model, (_, _, context_hash) in zip(session_models, changes):
+        if model.session_id not in missing:
+            _mark_persisted(model, context_hash)
+    print(f"Saved {len(session_models) - len(missing)} sessions: {len(rows)} new turns")
+    return missing
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+load_dotenv()
+
+# Shared by every turn; a coach turn needs at most two stages in flight at once
+_stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STAGE_GRAPH_MAX_WORKERS", "16")))
+# Deadline of the run that owns the stage executing on this thread
+_stage_deadline = threading.local()
+
+
+def stage_deadline_seconds(default: float) -> float:
+    """Time left for the current stage's run, capped at default; just default outside a stage graph.
+
+    Raises TimeoutError once the run's deadline has passed, so a stage abandoned by
+    its turn gives up instead of starting new work on a shared worker.
+    """
+    deadline = getattr(_stage_deadline, "value", None)
+    if deadline is None:
+        return default
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:
+        raise TimeoutError("turn deadline exceeded")
+    return min(default, remaining)
+
+
+def _run_stage(fn, inputs, deadline: Optional[float]):
+    # A stage that waited for a worker past its deadline has already been reported as a timeout
+    if deadline is not None and time.perf_counter() >= deadline:
+        raise TimeoutError("turn deadline exceeded before the stage started")
+    _stage_deadline.value = deadline
+    try:
+        return fn(inputs)
+    finally:
+        _stage_deadline.value = None
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]  # called with {dependency name: value}
+    depends_on: Tuple[str, ...] = ()
+    # Evaluated on the dependency values once they are all done; False skips this stage and its dependents
+    condition: Optional[Callable[[Dict[str, Any]], bool]] = None
+    # Still started, and waited for, after the deadline once its dependencies are ok
+    exempt_from_deadline: bool = False
+
+
+class Degraded(NamedTuple):
+    """Returned by a stage that finished, but only with a fallback value; the stage is still ok"""
+    value: Any
+    reason: str
+
+
+class StageResult(NamedTuple):
+    name: str
+    status: str  # ok | error | timeout | skipped
+    value: Any = None
+    error: Optional[str] = None
+    started_ms: Optional[float] = None  # offset from the start of the run
+    elapsed_ms: Optional[float] = None
+    degraded: Optional[str] = None  # why an ok stage's value is only a fallback
+
+
+class StageGraphResult:
+    """Per-stage outcomes of one run; stages that did not finish have no value"""
+    def __init__(self, results: Dict[str, StageResult], elapsed_ms: float, deadline_hit: bool):
+        self.results = results
+        self.elapsed_ms = elapsed_ms
+        self.deadline_hit = deadline_hit
+
+    def value(self, name: str, default=None):
+        result = self.results.get(name)
+        return result.value if result is not None and result.status == "ok" else default
+
+    def ok(self, name: str) -> bool:
+        result = self.results.get(name)
+        return result is not None and result.status == "ok"
+
+    @property
+    def partial(self) -> bool:
+        return any(result.status in ("error", "timeout") for result in self.results.values())
+
+    def timings(self) -> Dict[str, dict]:
+        return {
+            name: {
+                "status": result.status,
+                "started_ms": None if result.started_ms is None else round(result.started_ms, 1),
+                "elapsed_ms": None if result.elapsed_ms is None else round(result.elapsed_ms, 1),
+                **({"error": result.error} if result.error else {}),
+                **({"degraded": result.degraded} if result.degraded else {})
+            }
+            for name, result in self.results.items()
+        }
+
+
+def _validate(stages: List[Stage]):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names in {names}")
+    known = set(names)
+    for stage in stages:
+        missing = [dep for dep in stage.depends_on if dep not in known]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+
+    # Kahn's algorithm; anything left over sits on a cycle
+    remaining = {stage.name: set(stage.depends_on) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Stage dependency cycle among {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_stage_graph(stages: List[Stage], deadline_seconds: Optional[float] = None,
+                    executor: Optional[ThreadPoolExecutor] = None) -> StageGraphResult:
+    """Run stages as soon as their dependencies finish, concurrently where the graph allows.
+
+    When the deadline passes, stages still running are reported as timeouts (their
+    threads are left to finish in the background and their results are dropped) and
+    stages that never started are skipped, so the caller always gets what completed.
+    Stages exempt from the deadline are the exception: they start once their
+    dependencies are ok and the run waits for them however late that is.
+    Stages read the time they have left with stage_deadline_seconds() and pass it on to
+    the calls they make, so abandoned stages release their workers by the deadline.
+    """
+    _validate(stages)
+    executor = executor or _stage_executor
+    start = time.perf_counter()
+    deadline = None if deadline_seconds is None else start + deadline_seconds
+    results: Dict[str, StageResult] = {}
+    running: Dict[Any, Tuple[str, float]] = {}  # future -> (stage name, start offset)
+
+    def elapsed_since(offset_ms: float) -> float:
+        return (time.perf_counter() - start) * 1000 - offset_ms
+
+    exempt = {stage.name for stage in stages if stage.exempt_from_deadline}
+
+    def schedule(exempt_only: bool):
+        progressed = True
+        while progressed:
+            progressed = False
+            in_flight = {name for name, _ in running.values()}
+            for stage in stages:
+                if stage.name in results or stage.name in in_flight:
+                    continue
+                if exempt_only and stage.name not in exempt:
+                    continue
+                deps = [results.get(dep) for dep in stage.depends_on]
+                if any(dep is None for dep in deps):
+                    continue
+                failed = [dep.name for dep in deps if dep.status != "ok"]
+                if failed:
+                    results[stage.name] = StageResult(stage.name, "skipped", error=f"upstream {', '.join(failed)} not ok")
+                    progressed = True
+                    continue
+                inputs = {dep.name: dep.value for dep in deps}
+                if stage.condition is not None and not stage.condition(inputs):
+                    results[stage.name] = StageResult(stage.name, "skipped")
+                    progressed = True
+                    continue
+                offset = (time.perf_counter() - start) * 1000
+                stage_deadline = None if stage.name in exempt else deadline
+                running[executor.submit(_run_stage, stage.fn, inputs, stage_deadline)] = (stage.name, offset)
+
+    schedule(exempt_only=False)
+    deadline_hit = False
+    while running:
+        if deadline_hit:
+            # Past the deadline only exempt stages are waited for
+            pending = [future for future, (name, _) in running.items() if name in exempt]
+            if not pending:
+                break
+            timeout = None
+        else:
+            pending = list(running)
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            deadline_hit = True
+            schedule(exempt_only=True)
+            continue
+        for future in done:
+            name, offset = running.pop(future)
+            try:
+                value = future.result()
+                degraded = None
+                if isinstance(value, Degraded):
+                    value, degraded = value.value, value.reason
+                results[name] = StageResult(name, "ok", value, started_ms=offset,
+                                            elapsed_ms=elapsed_since(offset), degraded=degraded)
+            except Exception as e:
+                print(f"Stage {name} failed: {e}")
+                results[name] = StageResult(name, "error", error=str(e), started_ms=offset,
+                                            elapsed_ms=elapsed_since(offset))
+        schedule(exempt_only=deadline_hit)
+
+    for future, (name, offset) in running.items():
+        future.cancel()
+        results[name] = StageResult(name, "timeout", error="turn deadline exceeded", started_ms=offset,
+                                    elapsed_ms=elapsed_since(offset))
+    for stage in stages:
+        if stage.name not in results:
+            results[stage.name] = StageResult(stage.name, "skipped", error="turn deadline exceeded")
+
+    ordered = {stage.name: results[stage.name] for stage in stages}
+    return StageGraphResult(ordered, (time.perf_counter() - start) * 1000, deadline_hit)
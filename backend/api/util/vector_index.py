@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from config.tidb_config import (SessionLocal)
+from .knowledge_graph import ( DatabaseEntity )
+from .index_sync import ( EntitySnapshot, IndexedEntity, on_entity_commit, to_indexed_entity )
+from typing import Dict, List, Optional, Tuple
+
+load_dotenv()
+
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "true").lower() == "true"
+# Rows written by other processes (e.g. the KG builder) are only picked up on reload
+VECTOR_INDEX_MAX_AGE = int(os.getenv("VECTOR_INDEX_MAX_AGE", "900"))
+
+
+class _Partition:
+    """Immutable vectors for one entity type; replaced wholesale on every change"""
+    def __init__(self, entities: List[IndexedEntity], matrix: np.ndarray):
+        self.entities = entities
+        self.matrix = matrix  # unit-normalised rows, so cosine similarity is a dot product
+        self.positions = {e.id: i for i, e in enumerate(entities)}
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EntityVectorIndex:
+    """In-process mirror of entities.description_vec, partitioned by DatabaseEntity.type.
+
+    Search is an exact cosine scan over each partition with numpy, which at
+    knowledge-graph scale is cheaper than the TiDB round trip it replaces.
+    """
+    def __init__(self, max_age: int = VECTOR_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self.partitions: Dict[str, _Partition] = {}
+        self.entity_types: Dict[int, str] = {}
+        self.loaded_at: Optional[float] = None
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def load(self):
+        with SessionLocal() as session:
+            rows = session.query(
+                DatabaseEntity.id,
+                DatabaseEntity.entity_id,
+                DatabaseEntity.name,
+                DatabaseEntity.type,
+                DatabaseEntity.description,
+                DatabaseEntity.description_vec
+            ).filter(
+                DatabaseEntity.description_vec.isnot(None),
+                DatabaseEntity.deleted_at.is_(None)
+            ).all()
+
+        grouped: Dict[str, Tuple[List[IndexedEntity], List]] = {}
+        for row in rows:
+            entities, vectors = grouped.setdefault(row.type, ([], []))
+            entities.append(to_indexed_entity(row))
+            vectors.append(row.description_vec)
+
+        partitions = {}
+        entity_types = {}
+        dim = None
+        for entity_type, (entities, vectors) in grouped.items():
+            matrix = _normalise(np.asarray(vectors, dtype=np.float32))
+            dim = matrix.shape[1]
+            partitions[entity_type] = _Partition(entities, matrix)
+            entity_types.update({e.id: entity_type for e in entities})
+
+        with self._lock:
+            self.partitions = partitions
+            self.entity_types = entity_types
+            self.dim = dim
+            self.loaded_at = time.time()
+        print(f"Vector index loaded {len(rows)} entities across {len(partitions)} types")
+
+    def is_fresh(self) -> bool:
+        if self.loaded_at is None:
+            return False
+        return self.max_age <= 0 or time.time() - self.loaded_at < self.max_age
+
+    def search(self, embedding, entity_type: Optional[str] = None, limit: int = 10) -> Optional[List[Tuple[IndexedEntity, float]]]:
+        """Return (entity, cosine_distance) pairs nearest first, or None when the index cannot answer"""
+        if not self.is_fresh():
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.dim is not None and query.shape[-1] != self.dim:
+            return None
+        query = _normalise(query)
+
+        partitions = self.partitions  # snapshot; writers swap the dict rather than mutate it
+        if entity_type is not None:
+            selected = [partitions[entity_type]] if entity_type in partitions else []
+        else:
+            selected = list(partitions.values())
+
+        candidates = []
+        for partition in selected:
+            scores = partition.matrix @ query
+            k = min(limit, len(scores))
+            if k == 0:
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend((partition.entities[i], 1.0 - float(scores[i])) for i in top)
+        candidates.sort(key=lambda c: c[1])
+        return candidates[:limit]
+
+    def apply_changes(self, upserted: List[EntitySnapshot], deleted: List[int]):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            partitions = dict(self.partitions)
+            entity_types = dict(self.entity_types)
+            removals: Dict[str, set] = {}
+            additions: Dict[str, List[EntitySnapshot]] = {}
+            for entity_id in deleted:
+                if entity_id in entity_types:
+                    removals.setdefault(entity_types.pop(entity_id), set()).add(entity_id)
+            for snapshot in upserted:
+                if snapshot.id in entity_types:
+                    removals.setdefault(entity_types.pop(snapshot.id), set()).add(snapshot.id)
+                if snapshot.description_vec is None:
+                    continue
+                additions.setdefault(snapshot.type, []).append(snapshot)
+                entity_types[snapshot.id] = snapshot.type
+
+            for entity_type in set(removals) | set(additions):
+                partitions[entity_type] = self._rebuild_partition(
+                    partitions.get(entity_type), removals.get(entity_type, set()), additions.get(entity_type, []))
+                if not partitions[entity_type].entities:
+                    del partitions[entity_type]
+
+            self.partitions = partitions
+            self.entity_types = entity_types
+
+    def _rebuild_partition(self, partition: Optional[_Partition], removed: set, added: List[EntitySnapshot]) -> _Partition:
+        entities = []
+        rows = []
+        if partition is not None:
+            keep = [i for i, e in enumerate(partition.entities) if e.id not in removed]
+            entities = [partition.entities[i] for i in keep]
+            rows = [partition.matrix[keep]]
+        if added:
+            entities += [to_indexed_entity(s) for s in added]
+            rows.append(_normalise(np.asarray([s.description_vec for s in added], dtype=np.float32)))
+        matrix = np.vstack(rows) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        if self.dim is None and matrix.shape[1]:
+            self.dim = matrix.shape[1]
+        return _Partition(entities, matrix)
+
+    def reload_in_background(self):
+        """Kick off a reload without blocking the request that noticed the index is stale"""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def _reload():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Vector index reload failed: {e}")
+            finally:
+                self._reloading = False
+
+        threading.Thread(target=_reload, daemon=True).start()
+
+
+vector_index = EntityVectorIndex()
+
+
+@on_entity_commit
+def _sync_vector_index(upserted, deleted):
+    vector_index.apply_changes(upserted, deleted)
+
+
+def load_vector_index():
+    """Populate the vector index at startup; on failure callers keep using TiDB"""
+    if not VECTOR_INDEX_ENABLED:
+        print("Vector index disabled")
+        return
+    try:
+        vector_index.load()
+    except Exception as e:
+        print(f"Vector index load failed, falling back to TiDB: {e}")
+
+
+def search_vector_index(embedding, entity_type: Optional[str] = None, limit: int = 10):
+    if not VECTOR_INDEX_ENABLED:
+        return None
+    hits = vector_index.search(embedding, entity_type, limit)
+    if hits is None and vector_index.loaded_at is not None:
+        vector_index.reload_in_background()
+    return hits
@@ -22,7 +22,12 @@ from sqlalchemy import (
     create_engine,
     or_,
     and_,
-    inspect
+    inspect,
+    insert,
+    update,
+    func,
+    text,
+    Index
 )
 from datetime import datetime
 from sqlalchemy.orm import relationship, Session, sessionmaker, declarative_base, joinedload
@@ -30,9 +35,18 @@ from tidb_vector.sqlalchemy import VectorType
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 from pyvis.network import Network
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import webbrowser
+import hashlib
+import time
 load_dotenv()
 
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+KG_INSERT_CHUNK_SIZE = int(os.getenv("KG_INSERT_CHUNK_SIZE", "500"))
+
 # Use the same get_db_url function
 def get_db_url():
     return URL(
@@ -54,12 +68,21 @@ class DatabaseEntity(Base):
     __tablename__ = "entities"
     
     id = Column(Integer, primary_key=True)
-    entity_id = Column(String(4096), nullable=False)
-    name = Column(String(4096))
-    type = Column(String(4096))  # ClientProfile, Objection, Strategy, Technique, Outcome
+    entity_id = Column(String(255), nullable=False)
+    name = Column(String(1024))
+    type = Column(String(64))  # ClientProfile, Objection, Strategy, Technique, Outcome
     description = Column(Text)
-    description_vec = Column(VectorType())
+    description_vec = Column(VectorType(EMBEDDING_DIM))
     properties = Column(JSON)  # Additional properties as JSON
+    source_id = Column(String(255))  # profile_id of the sales record this entity came from
+    content_hash = Column(String(64))
+    deleted_at = Column(DateTime)  # tombstone set when the source record no longer yields this entity
+
+    __table_args__ = (
+        Index("idx_entities_entity_id", "entity_id"),
+        Index("idx_entities_type", "type", "deleted_at"),
+        Index("idx_entities_source_id", "source_id"),
+    )
 
 class DatabaseRelationship(Base):
     __tablename__ = "relationships"
@@ -67,9 +90,18 @@ class DatabaseRelationship(Base):
     id = Column(Integer, primary_key=True)
     source_entity_id = Column(Integer, ForeignKey("entities.id"))
     target_entity_id = Column(Integer, ForeignKey("entities.id"))
-    relationship_type = Column(String(4096))
+    relationship_type = Column(String(64))
     properties = Column(JSON)  # Additional properties as JSON
+    source_id = Column(String(255))
+    content_hash = Column(String(64))
+    deleted_at = Column(DateTime)
     
+    __table_args__ = (
+        Index("idx_relationships_source_type", "source_entity_id", "relationship_type"),
+        Index("idx_relationships_target_type", "target_entity_id", "relationship_type"),
+        Index("idx_relationships_source_id", "source_id"),
+    )
+
     source_entity = relationship("DatabaseEntity", foreign_keys=[source_entity_id])
     target_entity = relationship("DatabaseEntity", foreign_keys=[target_entity_id])
 
@@ -83,18 +115,207 @@ class SalesKnowledge(Base):
     objections = Column(JSON)
     source_files = Column(JSON)
     llm_metadata = Column(JSON)
+    source_hash = Column(String(64))  # sha256 of the markdown file it was extracted from
+    source_file = Column(String(512))  # markdown file name; one row per file
     created_at = Column(DateTime, default=datetime.now)
 
 
+class KnowledgeGraphSyncState(Base):
+    __tablename__ = 'kg_sync_state'
+
+    source_id = Column(String(255), primary_key=True)  # SalesKnowledge.profile_id
+    record_hash = Column(String(64), nullable=False)
+    synced_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class KnowledgeGraphVersion(Base):
+    __tablename__ = 'kg_version'
+
+    id = Column(Integer, primary_key=True)  # single row, id=1
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+def bump_graph_version(session):
+    """Signal running API processes that their in-memory graph snapshot is out of date"""
+    state = session.get(KnowledgeGraphVersion, 1)
+    if state is None:
+        session.add(KnowledgeGraphVersion(id=1, version=1))
+    else:
+        state.version += 1
+    session.commit()
+
+
+def ensure_sync_columns(engine):
+    """Add the columns incremental sync relies on to tables created by older builds"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for model in (DatabaseEntity, DatabaseRelationship, SalesKnowledge):
+            table = model.__table__
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}")
+
+
 def get_query_embedding(query: str):
     """
     Generate embedding using Ollama's nomic-embed-text model.
     """
-    response = ollama.embeddings(model='nomic-embed-text', prompt=query)
+    response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=query)
     return response['embedding']
 
-def build_knowledge_graph():
-    """Build knowledge graph from data in sales_knowledge table"""
+def collect_descriptions(sales_records) -> List[str]:
+    """Every description the graph build will embed, deduplicated in first-seen order"""
+    descriptions = {}
+    for record in sales_records:
+        descriptions[record.client_profile.get('desc', '')] = None
+        for objection in record.objections:
+            descriptions[objection['desc']] = None
+            for strategy in objection['addressing_strategies']:
+                descriptions[strategy['desc']] = None
+                for technique in strategy['techniques']:
+                    descriptions[technique['desc']] = None
+                    descriptions[technique['outcome']['desc']] = None
+    return list(descriptions)
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    try:
+        response = ollama.embed(model=EMBEDDING_MODEL, input=texts)
+        return response['embeddings']
+    except Exception as e:
+        # Older Ollama servers lack /api/embed; degrade to one request per text
+        print(f"Batch embedding failed ({e}), embedding {len(texts)} texts individually")
+        return [get_query_embedding(text) for text in texts]
+
+def embed_texts(texts: List[str], batch_size: int = EMBED_BATCH_SIZE, max_workers: int = EMBED_MAX_WORKERS) -> Dict[str, List[float]]:
+    """Embed unique texts in batches on a bounded worker pool"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    embeddings = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(embed_batch, batch): batch for batch in batches}
+        for done, future in enumerate(as_completed(futures), start=1):
+            batch = futures[future]
+            embeddings.update(zip(batch, future.result()))
+            print(f"Embedded batch {done}/{len(batches)} ({len(embeddings)}/{len(texts)} texts)")
+    print(f"Embedded {len(texts)} unique descriptions in {time.time() - start:.1f}s")
+    return embeddings
+
+def content_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def record_hash(record) -> str:
+    return content_hash(record.profile_id, record.client_profile, record.objections)
+
+def describe_record(record):
+    """Entity and relationship specs for one sales record, keyed by their natural ids"""
+    entities = []
+    relationships = []
+
+    def add_entity(entity_id, name, entity_type, description, properties):
+        entities.append({
+            "entity_id": entity_id,
+            "name": name,
+            "type": entity_type,
+            "description": description,
+            "properties": properties,
+            "source_id": record.profile_id,
+            "content_hash": content_hash(name, entity_type, description, properties)
+        })
+
+    def add_relationship(source_id, target_id, relationship_type, properties=None):
+        relationships.append({
+            "source": source_id,
+            "target": target_id,
+            "relationship_type": relationship_type,
+            "properties": properties,
+            "source_id": record.profile_id,
+            "content_hash": content_hash(relationship_type, properties)
+        })
+
+    # ClientProfile entity
+    client_profile = record.client_profile
+    add_entity(record.profile_id, client_profile.get('name', 'Unknown'), "ClientProfile",
+               client_profile.get('desc', ''), client_profile)
+
+    for objection in record.objections:
+        # ClientProfile -[HAS_OBJECTION]-> Objection
+        add_entity(objection['obj_id'], f"Objection: {objection['desc'][:50]}...", "Objection",
+                   objection['desc'], objection)
+        add_relationship(record.profile_id, objection['obj_id'], "HAS_OBJECTION",
+                         {"priority": objection['priority']})
+
+        for strategy in objection['addressing_strategies']:
+            # Objection -[ADDRESSED_BY]-> Strategy
+            add_entity(strategy['strat_id'], f"Strategy: {strategy['desc'][:50]}...", "Strategy",
+                       strategy['desc'], strategy)
+            add_relationship(objection['obj_id'], strategy['strat_id'], "ADDRESSED_BY")
+
+            for technique in strategy['techniques']:
+                # Strategy -[USES]-> Technique
+                add_entity(technique['tehcn_id'], f"Technique: {technique['desc'][:50]}...", "Technique",
+                           technique['desc'], technique)
+                add_relationship(strategy['strat_id'], technique['tehcn_id'], "USES")
+
+                # Technique -[RESULTS_IN]-> Outcome
+                outcome = technique['outcome']
+                add_entity(outcome['techn_ot_id'], f"Outcome: {outcome['desc'][:50]}...", "Outcome",
+                           outcome['desc'], outcome)
+                add_relationship(technique['tehcn_id'], outcome['techn_ot_id'], "RESULTS_IN")
+
+    return entities, relationships
+
+def plan_knowledge_graph(sales_records, embed, next_entity_id: int, next_relationship_id: int):
+    """Turn sales records into entity and relationship rows with ids assigned client-side.
+
+    Ids are handed out from ranges starting at next_entity_id / next_relationship_id,
+    so relationships can reference their endpoints without a flush per entity.
+    """
+    entity_rows = []
+    relationship_rows = []
+    entity_map = {}  # Map of entity_id to DatabaseEntity id
+
+    for record in sales_records:
+        entities, relationships = describe_record(record)
+        for entity in entities:
+            row_id = next_entity_id + len(entity_rows)
+            entity_rows.append({**entity, "id": row_id, "description_vec": embed(entity["description"])})
+            entity_map[entity["entity_id"]] = row_id
+        for rel in relationships:
+            source, target = rel.pop("source"), rel.pop("target")
+            relationship_rows.append({
+                **rel,
+                "id": next_relationship_id + len(relationship_rows),
+                "source_entity_id": entity_map[source],
+                "target_entity_id": entity_map[target]
+            })
+
+    return entity_rows, relationship_rows
+
+def next_free_id(session, model) -> int:
+    return (session.query(func.max(model.id)).scalar() or 0) + 1
+
+def bulk_insert(session, model, rows, chunk_size: int = KG_INSERT_CHUNK_SIZE, label: str = "rows"):
+    """Write rows with multi-row INSERTs, committing once per chunk"""
+    start = time.time()
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset:offset + chunk_size]
+        session.execute(insert(model), chunk)
+        session.commit()
+        written = offset + len(chunk)
+        elapsed = time.time() - start
+        print(f"Inserted {written}/{len(rows)} {label} ({written / elapsed if elapsed else 0:.0f}/s)")
+
+def build_knowledge_graph(batch_embeddings: bool = True, chunk_size: int = KG_INSERT_CHUNK_SIZE):
+    """Build knowledge graph from data in sales_knowledge table.
+
+    With batch_embeddings, all descriptions are collected and embedded up front
+    in concurrent batches instead of one blocking request per entity. Rows are
+    then bulk-inserted in chunks of chunk_size.
+    """
     # Set up database connections
     engine = create_engine(get_db_url())
     Session = sessionmaker(bind=engine)
@@ -102,138 +323,202 @@ def build_knowledge_graph():
     
     # Create knowledge graph tables if they don't exist
     Base.metadata.create_all(engine)
+    ensure_sync_columns(engine)
     
     # Fetch all sales knowledge records
     sales_records = session.query(SalesKnowledge).all()
     total_sales_count = len(sales_records)
     print("total sales records", total_sales_count)
 
-    entity_map = {}  # Map of entity_id to DatabaseEntity id
-    relationship_count = 0
-    processed_count = 0
+    if batch_embeddings:
+        embeddings = embed_texts(collect_descriptions(sales_records))
+        embed = embeddings.__getitem__
+    else:
+        embed = get_query_embedding
 
-    for record in sales_records:
-        # Create client profile entity
-        client_profile = record.client_profile
-        client_entity = DatabaseEntity(
-            entity_id=record.profile_id,
-            name=client_profile.get('name', 'Unknown'),
-            type="ClientProfile",
-            description=client_profile.get('desc', ''),
-            description_vec = get_query_embedding(client_profile.get('desc', '')),
-            properties=client_profile
-        )
-        session.add(client_entity)
-        session.flush()  # Get the ID
-        entity_map[record.profile_id] = client_entity.id
-        
-        # Process objections
-        for objection in record.objections:
-            # Create objection entity
-            objection_entity = DatabaseEntity(
-                entity_id=objection['obj_id'],
-                name=f"Objection: {objection['desc'][:50]}...",
-                type="Objection",
-                description=objection['desc'],
-                description_vec = get_query_embedding(objection['desc']),
-                properties=objection
-            )
-            session.add(objection_entity)
-            session.flush()
-            entity_map[objection['obj_id']] = objection_entity.id
-            
-            # Create relationship: ClientProfile -[HAS_OBJECTION]-> Objection
-            rel = DatabaseRelationship(
-                source_entity_id=entity_map[record.profile_id],
-                target_entity_id=entity_map[objection['obj_id']],
-                relationship_type="HAS_OBJECTION",
-                properties={"priority": objection['priority']}
-            )
-            session.add(rel)
-            relationship_count += 1
-            
-            # Process strategies
-            for strategy in objection['addressing_strategies']:
-                # Create strategy entity
-                strategy_entity = DatabaseEntity(
-                    entity_id=strategy['strat_id'],
-                    name=f"Strategy: {strategy['desc'][:50]}...",
-                    type="Strategy",
-                    description=strategy['desc'],
-                    description_vec = get_query_embedding(strategy['desc']),
-                    properties=strategy
-                )
-                session.add(strategy_entity)
-                session.flush()
-                entity_map[strategy['strat_id']] = strategy_entity.id
-                
-                # Create relationship: Objection -[ADDRESSED_BY]-> Strategy
-                rel = DatabaseRelationship(
-                    source_entity_id=entity_map[objection['obj_id']],
-                    target_entity_id=entity_map[strategy['strat_id']],
-                    relationship_type="ADDRESSED_BY"
-                )
-                session.add(rel)
-                relationship_count += 1
-                
-                # Process techniques
-                for technique in strategy['techniques']:
-                    # Create technique entity
-                    technique_entity = DatabaseEntity(
-                        entity_id=technique['tehcn_id'],
-                        name=f"Technique: {technique['desc'][:50]}...",
-                        type="Technique",
-                        description=technique['desc'],
-                        description_vec = get_query_embedding(technique['desc']),
-                        properties=technique
-                    )
-                    session.add(technique_entity)
-                    session.flush()
-                    entity_map[technique['tehcn_id']] = technique_entity.id
-                    
-                    # Create relationship: Strategy -[USES]-> Technique
-                    rel = DatabaseRelationship(
-                        source_entity_id=entity_map[strategy['strat_id']],
-                        target_entity_id=entity_map[technique['tehcn_id']],
-                        relationship_type="USES"
-                    )
-                    session.add(rel)
-                    relationship_count += 1
-                    
-                    # Process outcome
-                    outcome = technique['outcome']
-                    outcome_entity = DatabaseEntity(
-                        entity_id=outcome['techn_ot_id'],
-                        name=f"Outcome: {outcome['desc'][:50]}...",
-                        type="Outcome",
-                        description=outcome['desc'],
-                        description_vec = get_query_embedding(outcome['desc']),
-                        properties=outcome
-                    )
-                    session.add(outcome_entity)
-                    session.flush()
-                    entity_map[outcome['techn_ot_id']] = outcome_entity.id
-                    
-                    # Create relationship: Technique -[RESULTS_IN]-> Outcome
-                    rel = DatabaseRelationship(
-                        source_entity_id=entity_map[technique['tehcn_id']],
-                        target_entity_id=entity_map[outcome['techn_ot_id']],
-                        relationship_type="RESULTS_IN"
-                    )
-                    session.add(rel)
-                    relationship_count += 1
-    
-        processed_count += 1
-        print(f"Processed records {processed_count}/{total_sales_count}\n")
     try:
+        entity_rows, relationship_rows = plan_knowledge_graph(
+            sales_records, embed,
+            next_entity_id=next_free_id(session, DatabaseEntity),
+            next_relationship_id=next_free_id(session, DatabaseRelationship))
+        bulk_insert(session, DatabaseEntity, entity_rows, chunk_size, "entities")
+        bulk_insert(session, DatabaseRelationship, relationship_rows, chunk_size, "relationships")
+        save_sync_state(session, {record.profile_id: record_hash(record) for record in sales_records})
+        bump_graph_version(session)
+        print(f"Built knowledge graph with {len(entity_rows)} entities and {len(relationship_rows)} relationships")
+    except SQLAlchemyError as e:
+        session.rollback()
+        print(f"Database error: {str(e)}")
+    finally:
+        session.close()
+
+def bulk_update(session, model, rows, chunk_size: int = KG_INSERT_CHUNK_SIZE, label: str = "rows"):
+    """Apply primary-key keyed row updates in chunks, committing once per chunk"""
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset:offset + chunk_size]
+        session.execute(update(model), chunk)
         session.commit()
-        print(f"Built knowledge graph with {len(entity_map)} entities and {relationship_count} relationships")
+        print(f"Updated {offset + len(chunk)}/{len(rows)} {label}")
+
+def save_sync_state(session, hashes: Dict[str, str]):
+    for source_id, digest in hashes.items():
+        session.merge(KnowledgeGraphSyncState(source_id=source_id, record_hash=digest, synced_at=datetime.now()))
+    session.commit()
+
+def diff_record(session, record, now):
+    """Compare one sales record with its rows in the graph.
+
+    Existing rows are matched on the natural entity_id (not source_id) so graphs
+    built before sync existed are adopted instead of duplicated. Extra copies of
+    the same entity_id left by earlier non-idempotent runs are tombstoned.
+    """
+    entities, relationships = describe_record(record)
+    wanted_ids = {e["entity_id"] for e in entities}
+    existing_rows = session.query(
+        DatabaseEntity.id, DatabaseEntity.entity_id, DatabaseEntity.description,
+        DatabaseEntity.content_hash, DatabaseEntity.deleted_at
+    ).filter(or_(
+        DatabaseEntity.entity_id.in_(list(wanted_ids)),
+        DatabaseEntity.source_id == record.profile_id
+    )).order_by(DatabaseEntity.id).all()
+
+    existing = {}
+    tombstones = []
+    for row in existing_rows:
+        if row.entity_id in existing or row.entity_id not in wanted_ids:
+            if row.deleted_at is None:
+                tombstones.append({"id": row.id, "deleted_at": now})
+        else:
+            existing[row.entity_id] = row
+
+    inserts, updates = [], []
+    for entity in entities:
+        row = existing.get(entity["entity_id"])
+        if row is None:
+            inserts.append(entity)
+        elif row.content_hash != entity["content_hash"] or row.deleted_at is not None:
+            changed = {**entity, "id": row.id, "deleted_at": None}
+            if row.description == entity["description"]:
+                changed["keep_vector"] = True
+            updates.append(changed)
+
+    return {
+        "entities": entities,
+        "relationships": relationships,
+        "existing": {entity_id: row.id for entity_id, row in existing.items()},
+        "entity_inserts": inserts,
+        "entity_updates": updates,
+        "entity_tombstones": tombstones
+    }
+
+def sync_knowledge_graph(chunk_size: int = KG_INSERT_CHUNK_SIZE):
+    """Incrementally bring the graph in line with sales_knowledge.
+
+    Records whose content hash matches kg_sync_state are skipped outright. For
+    the rest, only new or changed entities and relationships are written, only
+    new or changed descriptions are embedded, and rows no longer produced by
+    any record are tombstoned via deleted_at rather than deleted.
+    """
+    engine = create_engine(get_db_url())
+    Base.metadata.create_all(engine)
+    ensure_sync_columns(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    start = time.time()
+
+    try:
+        records = {record.profile_id: record for record in session.query(SalesKnowledge).all()}
+        synced = {state.source_id: state.record_hash for state in session.query(KnowledgeGraphSyncState).all()}
+        hashes = {profile_id: record_hash(record) for profile_id, record in records.items()}
+        changed = [records[p] for p, digest in hashes.items() if synced.get(p) != digest]
+        removed = [p for p in synced if p not in records]
+        print(f"Sync: {len(records)} records, {len(changed)} new or changed, {len(removed)} removed")
+        if not changed and not removed:
+            print("Knowledge graph already up to date")
+            return
+
+        now = datetime.now()
+        diffs = [diff_record(session, record, now) for record in changed]
+
+        # Embed only text that is new or whose description changed
+        to_embed = {e["description"] for d in diffs for e in d["entity_inserts"]}
+        to_embed |= {e["description"] for d in diffs for e in d["entity_updates"] if not e.get("keep_vector")}
+        embeddings = embed_texts(sorted(to_embed)) if to_embed else {}
+
+        next_entity_id = next_free_id(session, DatabaseEntity)
+        entity_inserts, entity_updates, entity_tombstones = [], [], []
+        for d in diffs:
+            for entity in d["entity_inserts"]:
+                d["existing"][entity["entity_id"]] = next_entity_id + len(entity_inserts)
+                entity_inserts.append({**entity, "id": d["existing"][entity["entity_id"]],
+                                       "description_vec": embeddings[entity["description"]]})
+            for entity in d["entity_updates"]:
+                entity = dict(entity)
+                if not entity.pop("keep_vector", False):
+                    entity["description_vec"] = embeddings[entity["description"]]
+                entity_updates.append(entity)
+            entity_tombstones += d["entity_tombstones"]
+
+        bulk_insert(session, DatabaseEntity, entity_inserts, chunk_size, "entities")
+        bulk_update(session, DatabaseEntity, entity_updates + entity_tombstones, chunk_size, "entities")
+
+        # Relationships are keyed by (source, target, type) once entity ids are settled
+        relationship_inserts, relationship_updates, relationship_tombstones = [], [], []
+        next_relationship_id = next_free_id(session, DatabaseRelationship)
+        for d in diffs:
+            entity_ids = list(d["existing"].values())
+            existing = {}
+            for row in session.query(
+                DatabaseRelationship.id, DatabaseRelationship.source_entity_id, DatabaseRelationship.target_entity_id,
+                DatabaseRelationship.relationship_type, DatabaseRelationship.content_hash, DatabaseRelationship.deleted_at
+            ).filter(or_(
+                DatabaseRelationship.source_entity_id.in_(entity_ids),
+                DatabaseRelationship.source_id == d["entities"][0]["source_id"]
+            )).order_by(DatabaseRelationship.id).all():
+                key = (row.source_entity_id, row.target_entity_id, row.relationship_type)
+                if key in existing:
+                    if row.deleted_at is None:
+                        relationship_tombstones.append({"id": row.id, "deleted_at": now})
+                else:
+                    existing[key] = row
+
+            for rel in d["relationships"]:
+                rel = dict(rel)
+                key = (d["existing"][rel.pop("source")], d["existing"][rel.pop("target")], rel["relationship_type"])
+                row = existing.pop(key, None)
+                rel.update(source_entity_id=key[0], target_entity_id=key[1])
+                if row is None:
+                    relationship_inserts.append({**rel, "id": next_relationship_id + len(relationship_inserts)})
+                elif row.content_hash != rel["content_hash"] or row.deleted_at is not None:
+                    relationship_updates.append({**rel, "id": row.id, "deleted_at": None})
+            relationship_tombstones += [{"id": row.id, "deleted_at": now} for row in existing.values() if row.deleted_at is None]
+
+        bulk_insert(session, DatabaseRelationship, relationship_inserts, chunk_size, "relationships")
+        bulk_update(session, DatabaseRelationship, relationship_updates + relationship_tombstones, chunk_size, "relationships")
+
+        # Records that disappeared from sales_knowledge take all their rows with them
+        if removed:
+            for model in (DatabaseEntity, DatabaseRelationship):
+                session.query(model).filter(
+                    model.source_id.in_(removed), model.deleted_at.is_(None)
+                ).update({model.deleted_at: now}, synchronize_session=False)
+            session.query(KnowledgeGraphSyncState).filter(
+                KnowledgeGraphSyncState.source_id.in_(removed)
+            ).delete(synchronize_session=False)
+            session.commit()
+
+        save_sync_state(session, {record.profile_id: hashes[record.profile_id] for record in changed})
+        bump_graph_version(session)
+        print(f"Synced knowledge graph in {time.time() - start:.1f}s: "
+              f"entities +{len(entity_inserts)} ~{len(entity_updates)} -{len(entity_tombstones)}, "
+              f"relationships +{len(relationship_inserts)} ~{len(relationship_updates)} -{len(relationship_tombstones)}")
     except SQLAlchemyError as e:
         session.rollback()
         print(f"Database error: {str(e)}")
     finally:
         session.close()
 
+
 def visualize_knowledge_graph():
     """Visualize the knowledge graph using PyVis"""
     engine = create_engine(get_db_url())
@@ -241,8 +526,8 @@ def visualize_knowledge_graph():
     session = Session()
 
     # Fetch all entities and relationships
-    entities = session.query(DatabaseEntity).all()
-    relationships = session.query(DatabaseRelationship).all()
+    entities = session.query(DatabaseEntity).filter(DatabaseEntity.deleted_at.is_(None)).all()
+    relationships = session.query(DatabaseRelationship).filter(DatabaseRelationship.deleted_at.is_(None)).all()
 
     # Create network
     net = Network(notebook=False, height="750px", width="100%", bgcolor="#222222", font_color="white")
@@ -284,5 +569,9 @@ def get_color_for_type(entity_type):
     return colors.get(entity_type, "#999999")
 
 if __name__ == "__main__":
-    build_knowledge_graph()
+    import sys
+    if "--full" in sys.argv:
+        build_knowledge_graph()
+    else:
+        sync_knowledge_graph()
     visualize_knowledge_graph()
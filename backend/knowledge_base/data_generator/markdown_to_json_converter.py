@@ -5,6 +5,7 @@ import dspy
 import os
 import json
 import uuid
+import hashlib
 from pymysql import Connection
 from pymysql.cursors import DictCursor
 from sqlalchemy import (
@@ -20,7 +21,8 @@ from sqlalchemy import (
     URL,
     create_engine,
     or_,
-    inspect
+    inspect,
+    text
 )
 from datetime import datetime
 from sqlalchemy.orm import relationship, Session, sessionmaker, declarative_base, joinedload
@@ -48,8 +50,6 @@ dspy.settings.configure(lm=lm_conf)
 # Set up database connection
 engine = create_engine(get_db_url(), pool_recycle=300)
 Base = declarative_base()
-Base.metadata.drop_all(engine)
-Base.metadata.create_all(engine)  # Create tables if they don't exist
 
 
 # Define your Pydantic models for structured extraction
@@ -96,9 +96,61 @@ class SalesKnowledge(Base):
     objections = Column(JSON)
     source_files = Column(JSON)
     llm_metadata = Column(JSON)
+    source_hash = Column(String(64))  # sha256 of the markdown file it was extracted from
+    source_file = Column(String(512))  # markdown file name; one row per file
     created_at = Column(DateTime, default=datetime.now)
 
 
+def prepare_tables(reset: bool = False):
+    """Create sales_knowledge if needed; only drop existing rows when explicitly asked to"""
+    if reset:
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    existing = {column["name"] for column in inspect(engine).get_columns(SalesKnowledge.__tablename__)}
+    with engine.begin() as conn:
+        if "source_hash" not in existing:
+            conn.execute(text(f"ALTER TABLE {SalesKnowledge.__tablename__} ADD COLUMN source_hash VARCHAR(64)"))
+        if "source_file" not in existing:
+            conn.execute(text(f"ALTER TABLE {SalesKnowledge.__tablename__} ADD COLUMN source_file VARCHAR(512)"))
+
+
+def _normalize(desc) -> str:
+    return " ".join(str(desc or "").lower().split())
+
+
+def _match_items(old_items: List[dict], new_items: List[dict]) -> List[tuple]:
+    """Pair new items with old ones: same description first, then same position among the unmatched"""
+    unmatched_old = list(range(len(old_items)))
+    pairs = [None] * len(new_items)
+    by_desc = {}
+    for index in unmatched_old:
+        by_desc.setdefault(_normalize(old_items[index].get("desc")), index)
+    for new_index, item in enumerate(new_items):
+        old_index = by_desc.pop(_normalize(item.get("desc")), None)
+        if old_index is not None:
+            pairs[new_index] = old_index
+            unmatched_old.remove(old_index)
+    for new_index, item in enumerate(new_items):
+        if pairs[new_index] is None and new_index in unmatched_old:
+            pairs[new_index] = new_index
+            unmatched_old.remove(new_index)
+    return [(item, old_items[old_index]) for item, old_index in zip(new_items, pairs) if old_index is not None]
+
+
+def carry_over_ids(old_objections: List[dict], new_objections: List[dict]):
+    """Reuse the ids of an earlier extraction of the same file for the objections, strategies,
+    techniques and outcomes that survive an edit, so the graph sync updates them in place"""
+    for objection, old_objection in _match_items(old_objections or [], new_objections):
+        objection["obj_id"] = old_objection["obj_id"]
+        for strategy, old_strategy in _match_items(old_objection.get("addressing_strategies", []),
+                                                   objection["addressing_strategies"]):
+            strategy["strat_id"] = old_strategy["strat_id"]
+            for technique, old_technique in _match_items(old_strategy.get("techniques", []), strategy["techniques"]):
+                technique["tehcn_id"] = old_technique["tehcn_id"]
+                if old_technique.get("outcome"):
+                    technique["outcome"]["techn_ot_id"] = old_technique["outcome"]["techn_ot_id"]
+
+
 
 class ProfileExtractor(dspy.Signature):
     """Analyze the following text from a sales case study. 
@@ -107,23 +159,51 @@ class ProfileExtractor(dspy.Signature):
     sales_content: str = dspy.InputField(desc="Sales case study content")
     extraction_result: ExtractionResult = dspy.OutputField(desc="Structured extraction result")
 
-def process_markdown_files(markdown_dir: str):
-    """Process all markdown files in a directory and store results in TiDB"""
-    # Set up database connection
-    # engine = create_engine(get_db_url(), pool_recycle=300)
-    # Base = declarative_base()
-    # Base.metadata.create_all(engine)  # Create tables if they don't exist
+def process_markdown_files(markdown_dir: str, reset: bool = False):
+    """Mirror the markdown files of a directory into sales_knowledge, one row per file.
+
+    Unchanged files (same content hash) are skipped. An edited file is re-extracted
+    into its existing row, keeping the profile id and the ids of objections,
+    strategies, techniques and outcomes that survive the edit. Rows whose file is
+    gone are deleted, so the graph sync tombstones their entities.
+    """
+    prepare_tables(reset)
     Session = sessionmaker(bind=engine)
     session = Session()
-    
-    processed_count = 0
-    total_files = len(os.listdir(markdown_dir))
-    
-    for filename in os.listdir(markdown_dir):
-        if not filename.endswith('.md'):
+    filenames = sorted(f for f in os.listdir(markdown_dir) if f.endswith('.md'))
+
+    # Index rows by file, adopting rows from before source_file existed by their hash
+    rows = session.query(SalesKnowledge).order_by(SalesKnowledge.id).all()
+    hashes = {}
+    for filename in filenames:
+        with open(os.path.join(markdown_dir, filename), 'r', encoding='utf-8') as f:
+            hashes[filename] = hashlib.sha256(f.read().encode('utf-8')).hexdigest()
+    filename_by_hash = {digest: filename for filename, digest in hashes.items()}
+    by_file = {}
+    stale = []
+    for row in rows:
+        filename = row.source_file or filename_by_hash.get(row.source_hash)
+        if filename not in hashes or filename in by_file:
+            stale.append(row)  # file deleted, a pre-edit legacy copy, or a duplicate from earlier runs
             continue
-            
+        row.source_file = filename
+        by_file[filename] = row
+    # Rows of deleted files go; the graph sync sees their profile ids disappear and tombstones them
+    for row in stale:
+        print(f"Removing sales knowledge for {row.source_file or row.profile_id}, source file is gone")
+        session.delete(row)
+    session.commit()
+
+    processed_count = 0
+    total_files = len(filenames)
+
+    for filename in filenames:
         file_path = os.path.join(markdown_dir, filename)
+        source_hash = hashes[filename]
+        existing = by_file.get(filename)
+        if existing is not None and existing.source_hash == source_hash:
+            print(f"Skipping {filename}, already extracted")
+            continue
         print(f"Begin processing {filename}")
 
         try:
@@ -137,18 +217,24 @@ def process_markdown_files(markdown_dir: str):
             extraction_result = result.extraction_result
             print("LLM extraction complete")
 
-            sales_knowledge = SalesKnowledge(
-                profile_id=extraction_result.profile_id,
-                client_profile=extraction_result.client_profile.model_dump(),
-                objections=[obj.model_dump() for obj in extraction_result.objections],
-                source_files=extraction_result.source_files,
-                llm_metadata=extraction_result.llm_metadata
-            )
+            objections = [obj.model_dump() for obj in extraction_result.objections]
+            if existing is None:
+                sales_knowledge = SalesKnowledge(profile_id=extraction_result.profile_id, source_file=filename)
+                session.add(sales_knowledge)
+            else:
+                # Same file, new content: replace the row in place and keep its ids stable
+                sales_knowledge = existing
+                carry_over_ids(existing.objections, objections)
+            sales_knowledge.client_profile = extraction_result.client_profile.model_dump()
+            sales_knowledge.objections = objections
+            sales_knowledge.source_files = extraction_result.source_files
+            sales_knowledge.llm_metadata = extraction_result.llm_metadata
+            sales_knowledge.source_hash = source_hash
             # print("sales_knowledge", sales_knowledge)
-            session.add(sales_knowledge)
             processed_count += 1
             print(f"Processing {filename} done - {processed_count}/{total_files}")
             session.commit()
+            by_file[filename] = sales_knowledge
             
         except Exception as e:
             print(f"Error processing {filename}: {str(e)}")
@@ -166,6 +252,7 @@ def process_markdown_files(markdown_dir: str):
     return processed_count
 
 if __name__ == "__main__":
+    import sys
     markdown_dir = "../markdowns/sales_strategies"
-    count = process_markdown_files(markdown_dir)
+    count = process_markdown_files(markdown_dir, reset="--reset" in sys.argv)
     print(f"Processed {count} files")